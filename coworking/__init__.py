@@ -0,0 +1 @@
+"""Общие модули коворкинга, которые используют site.py, trpo/site.py и trpo.py."""
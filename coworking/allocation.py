@@ -0,0 +1,150 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict, namedtuple
+
+# -----------------------
+# Пакетное распределение заявок
+# -----------------------
+# Когда много заявок на один загруженный период приходит разом (импорт,
+# разбор листа ожидания), обработка по очереди занимает комнаты как попало
+# и отказывает тем, кто мог бы поместиться. allocate() распределяет весь
+# пакет сразу, с учётом уже занятых периодов каждой единицы помещения:
+#
+#   COUNT — максимум принятых заявок: жадный выбор по раннему окончанию,
+#           заявка отдаётся единице с наименьшим зазором перед ней (best fit).
+#           Для одной единицы решение оптимально;
+#   DAYS  — максимум забронированных дней: взвешенное планирование интервалов
+#           (динамика по отсортированным окончаниям) для каждой единицы
+#           по очереди. Для одной единицы решение оптимально.
+#
+# Обе стратегии работают за O(n log n) на единицу помещения, поэтому десятки
+# тысяч заявок распределяются за секунды. Даты — включительные границы.
+
+COUNT = "count"
+DAYS = "days"
+OBJECTIVES = {COUNT: "Больше заявок", DAYS: "Больше дней"}
+
+Ask = namedtuple("Ask", "key room_type start end")
+Allocation = namedtuple("Allocation", "accepted rejected")   # {key: номер единицы}, [key]
+
+
+def ask_days(ask):
+    return (ask.end - ask.start).days + 1
+
+
+class Unit:
+    """Занятые периоды одной единицы помещения (порядковые номера дней)."""
+
+    def __init__(self, busy=()):
+        self.starts = []
+        self.ends = []
+        # Склеиваем пересекающиеся периоды, чтобы хватало одного бинарного поиска
+        for start, end in sorted((s.toordinal(), e.toordinal()) for s, e in busy):
+            if self.ends and start <= self.ends[-1] + 1:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def fits(self, start, end):
+        i = bisect_right(self.starts, end) - 1
+        return i < 0 or self.ends[i] < start
+
+    def gap_before(self, start):
+        """Сколько дней свободно перед start (для выбора «плотной» единицы)."""
+        i = bisect_left(self.ends, start) - 1
+        return start - self.ends[i] if i >= 0 else float("inf")
+
+    def add(self, start, end):
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+
+
+def _by_room_type(asks):
+    groups = defaultdict(list)
+    for ask in asks:
+        groups[ask.room_type].append(ask)
+    return groups
+
+
+def _allocate_count(asks, units):
+    accepted = {}
+    for ask in sorted(asks, key=lambda a: (a.end, a.start)):
+        start, end = ask.start.toordinal(), ask.end.toordinal()
+        best, best_gap = None, None
+        for i, unit in enumerate(units):
+            if unit.fits(start, end):
+                gap = unit.gap_before(start)
+                if best is None or gap < best_gap:
+                    best, best_gap = i, gap
+        if best is not None:
+            units[best].add(start, end)
+            accepted[ask.key] = best
+    return accepted
+
+
+def _best_days(asks):
+    """Взвешенное планирование интервалов: непересекающиеся заявки с максимумом дней."""
+    asks = sorted(asks, key=lambda a: a.end)
+    ends = [a.end for a in asks]
+    best = [0] * (len(asks) + 1)    # best[j] — лучший результат среди первых j заявок
+    take = [False] * len(asks)
+    prev = []
+    for j, ask in enumerate(asks):
+        # Последняя заявка, закончившаяся до начала текущей
+        p = bisect_left(ends, ask.start, 0, j)
+        prev.append(p)
+        with_ask = best[p] + ask_days(ask)
+        take[j] = with_ask > best[j]
+        best[j + 1] = with_ask if take[j] else best[j]
+    chosen = []
+    j = len(asks)
+    while j > 0:
+        if take[j - 1]:
+            chosen.append(asks[j - 1])
+            j = prev[j - 1]
+        else:
+            j -= 1
+    return chosen
+
+
+def _allocate_days(asks, units):
+    accepted = {}
+    remaining = list(asks)
+    for i, unit in enumerate(units):
+        candidates = [a for a in remaining if unit.fits(a.start.toordinal(), a.end.toordinal())]
+        for ask in _best_days(candidates):
+            unit.add(ask.start.toordinal(), ask.end.toordinal())
+            accepted[ask.key] = i
+        remaining = [a for a in remaining if a.key not in accepted]
+    return accepted
+
+
+def allocate(asks, occupancy, objective=COUNT):
+    """Распределяет заявки по единицам помещений.
+
+    occupancy: {room_type: [занятые периоды единицы 0, единицы 1, ...]},
+    период — (start, end) датами. Заявки на типы без единиц отклоняются.
+    Ничего не записывает — результат можно показать как пробный прогон.
+    """
+    solve = _allocate_days if objective == DAYS else _allocate_count
+    accepted = {}
+    for room_type, group in _by_room_type(asks).items():
+        units = [Unit(busy) for busy in occupancy.get(room_type, [])]
+        accepted.update(solve(group, units))
+    rejected = [a.key for a in asks if a.key not in accepted]
+    return Allocation(accepted, rejected)
+
+
+def first_come(asks, occupancy):
+    """Для сравнения: заявки по порядку поступления, первая подходящая единица."""
+    units = {rt: [Unit(busy) for busy in periods] for rt, periods in occupancy.items()}
+    accepted = {}
+    for ask in asks:
+        start, end = ask.start.toordinal(), ask.end.toordinal()
+        for i, unit in enumerate(units.get(ask.room_type, [])):
+            if unit.fits(start, end):
+                unit.add(start, end)
+                accepted[ask.key] = i
+                break
+    return Allocation(accepted, [a.key for a in asks if a.key not in accepted])
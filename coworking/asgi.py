@@ -0,0 +1,97 @@
+"""Асинхронный (ASGI) режим для приложений коворкинга.
+
+    uvicorn --factory coworking.asgi:create_app --port 8000
+    COWORKING_APP=site.py COWORKING_THREADS=32 uvicorn --factory coworking.asgi:create_app --limit-concurrency 256
+
+Сервер — uvicorn: простаивающие keep-alive соединения, чтение тела запроса и
+отправка ответа медленным клиентам живут в цикле событий и потоков не
+занимают. Flask-приложение (WSGI) подключается адаптером a2wsgi: обработчик
+и генерация потокового ответа (stream_template, лента событий) выполняются
+в одном потоке ограниченного пула — это и есть предел одновременных
+обращений к SQLite в процессе. Сверх --limit-concurrency клиент получает 503
+от uvicorn.
+
+Отправка клиенту, который уже отключился, у uvicorn молча ничего не делает,
+поэтому ответ, который генерируется долго (лента событий), сам этого не
+заметил бы и держал поток пула до STREAM_TTL. Обрыв соединения отмечается
+по сообщению http.disconnect, и генерация ответа останавливается перед
+следующим куском.
+
+asgiref.wsgi.WsgiToAsgi здесь не подходит: он выполняет все запросы
+процесса в одном потоке, и одна открытая лента событий останавливала бы
+остальные.
+
+Файл приложения и фабрика берутся из COWORKING_APP ("путь[:фабрика]", как у
+coworking.serve), размер пула — из COWORKING_THREADS.
+"""
+import asyncio
+import os
+import threading
+
+from a2wsgi import WSGIMiddleware
+
+from coworking.serve import load_app, worker_threads
+
+DEFAULT_APP = "trpo/site.py:create_app_from_env"
+# Ключ scope с threading.Event обрыва соединения; a2wsgi кладёт scope в environ
+DISCONNECTED = "coworking.disconnected"
+
+
+class WatchDisconnect:
+    """Читает сообщения клиента в фоне и отмечает в scope обрыв соединения."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        disconnected = scope[DISCONNECTED] = threading.Event()
+        inbox = asyncio.Queue()
+
+        async def pump():
+            while True:
+                message = await receive()
+                await inbox.put(message)
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    return
+
+        reader = asyncio.create_task(pump())
+        try:
+            await self.app(scope, inbox.get, send)
+        finally:
+            reader.cancel()
+
+
+def stop_on_disconnect(wsgi_app):
+    """WSGI-обёртка: прекращает ответ, если WatchDisconnect отметил обрыв."""
+
+    def app(environ, start_response):
+        iterable = wsgi_app(environ, start_response)
+        disconnected = environ.get("asgi.scope", {}).get(DISCONNECTED)
+        if disconnected is None:
+            return iterable
+        return _until(iterable, disconnected)
+
+    return app
+
+
+def _until(iterable, event):
+    try:
+        for chunk in iterable:
+            if event.is_set():
+                break
+            yield chunk
+    finally:
+        # Закрытие генератора освобождает подписку и соединение с базой
+        getattr(iterable, "close", lambda: None)()
+
+
+def create_app(spec=None, threads=None):
+    """ASGI-приложение для uvicorn --factory."""
+    spec = spec or os.environ.get("COWORKING_APP", DEFAULT_APP)
+    threads = threads or worker_threads()
+    wsgi = WSGIMiddleware(stop_on_disconnect(load_app(spec)), workers=threads)
+    return WatchDisconnect(wsgi)
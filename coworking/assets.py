@@ -0,0 +1,136 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен — без него отдаём gzip
+    brotli = None
+
+# -----------------------
+# Статика с отпечатками и предварительным сжатием
+# -----------------------
+# При старте приложения каждый файл из static/ читается один раз: имя получает
+# хэш содержимого (styles.css -> styles.3f2a9c1d.css), а gzip/brotli версии
+# сжимаются заранее. Такие файлы никогда не меняются по одному и тому же URL,
+# поэтому браузер кэширует их навсегда и не перепроверяет.
+#
+# У каждого варианта (без сжатия, gzip, br) свой ETag: байты у них разные, и
+# кэш по If-None-Match не должен выдать один вариант за другой.
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+COMPRESSIBLE = {".css", ".js", ".html", ".svg", ".json", ".txt"}
+ETAG_SUFFIXES = {None: "", "gzip": "-gz", "br": "-br"}
+
+
+class Asset:
+    __slots__ = ("name", "hashed_name", "mimetype", "digest", "variants", "tags")
+
+    def __init__(self, name, data):
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        root, ext = os.path.splitext(name)
+        self.name = name
+        self.hashed_name = f"{root}.{digest}{ext}"
+        self.mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if self.mimetype.startswith("text/") or self.mimetype == "application/javascript":
+            self.mimetype += "; charset=utf-8"
+        self.digest = digest
+        # {кодировка: байты}; None — без сжатия
+        self.variants = {None: data}
+        if ext in COMPRESSIBLE:
+            gz = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(gz) < len(data):
+                self.variants["gzip"] = gz
+            if brotli is not None:
+                br = brotli.compress(data, quality=11)
+                if len(br) < len(data):
+                    self.variants["br"] = br
+        # {кодировка: ETag без кавычек}
+        self.tags = {encoding: digest + ETAG_SUFFIXES[encoding] for encoding in self.variants}
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding, кроме явно запрещённых через q=0."""
+    result = set()
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if token and params not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            result.add(token.lower())
+    return result
+
+
+class AssetPipeline:
+    def __init__(self, static_folder):
+        self.by_name = {}
+        self.by_hashed = {}
+        for dirpath, _, filenames in os.walk(static_folder):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, static_folder).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    asset = Asset(name, f.read())
+                self.by_name[name] = asset
+                self.by_hashed[asset.hashed_name] = asset
+
+    def hashed_name(self, name):
+        asset = self.by_name.get(name)
+        return asset.hashed_name if asset else None
+
+    def pick(self, hashed_name, accept_encoding):
+        """(asset, кодировка, байты) для запроса или None, если файла нет."""
+        asset = self.by_hashed.get(hashed_name)
+        if asset is None:
+            return None
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in asset.variants:
+                return asset, encoding, asset.variants[encoding]
+        return asset, None, asset.variants[None]
+
+
+# -----------------------
+# Связка с Flask
+# -----------------------
+
+def init_assets(app):
+    """Собирает статику и подменяет url_for('static', ...) в шаблонах.
+
+    Файлы с отпечатком раздаются по /assets/<имя>; обычный /static/ остаётся
+    для ссылок, которые строятся не через шаблоны.
+    """
+    from flask import request, url_for, abort
+
+    pipeline = AssetPipeline(app.static_folder)
+    app.extensions["assets"] = pipeline
+
+    @app.route("/assets/<path:filename>", endpoint="hashed_static")
+    def hashed_static(filename):
+        picked = pipeline.pick(filename, request.headers.get("Accept-Encoding"))
+        if picked is None:
+            abort(404)
+        asset, encoding, body = picked
+        tag = asset.tags[encoding]
+        if request.if_none_match.contains(tag):
+            resp = app.response_class(status=304)
+        else:
+            resp = app.response_class(body, mimetype=asset.mimetype.split(";")[0])
+            resp.headers["Content-Type"] = asset.mimetype
+            if encoding:
+                resp.headers["Content-Encoding"] = encoding
+        resp.headers["ETag"] = f'"{tag}"'
+        resp.headers["Cache-Control"] = IMMUTABLE
+        resp.headers["Vary"] = "Accept-Encoding"
+        return resp
+
+    def asset_url_for(endpoint, **values):
+        if endpoint == "static":
+            hashed = pipeline.hashed_name(values.get("filename"))
+            if hashed:
+                values["filename"] = hashed
+                return url_for("hashed_static", **values)
+        return url_for(endpoint, **values)
+
+    app.jinja_env.globals["url_for"] = asset_url_for
+    return pipeline
@@ -0,0 +1,80 @@
+import json
+import threading
+import time
+from collections import namedtuple
+
+from coworking.db import connect_readonly
+
+# -----------------------
+# Журнал изменений (change data capture)
+# -----------------------
+# Каждая вставка в Users и Request дописывает строку в таблицу Changes с
+# возрастающим номером seq (триггеры из миграции 5 в coworking/db.py).
+# Производные структуры — индексы доступности, агрегаты отчётов, кэши
+# страниц — запоминают последний обработанный seq и догоняют базу запросом
+# «изменения после N» за O(изменений), а не перечитыванием таблицы.
+# Журнал общий для всех процессов, работающих с базой.
+
+Change = namedtuple("Change", "seq table op row_id data at")
+
+
+def last_seq(conn, table=None) -> int:
+    """Номер последнего изменения (только таблицы table, если задана); 0 — журнал пуст."""
+    if table is None:
+        return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM Changes").fetchone()[0]
+    # Обход с конца журнала: нужная таблица обычно встречается сразу
+    row = conn.execute("SELECT seq FROM Changes WHERE tbl = ? ORDER BY seq DESC LIMIT 1", (table,)).fetchone()
+    return row[0] if row else 0
+
+
+def changes_after(conn, seq: int, limit: int = 1000):
+    """Изменения с номером больше seq в порядке записи, не больше limit."""
+    rows = conn.execute(
+        "SELECT seq, tbl, op, row_id, data, At FROM Changes WHERE seq > ? ORDER BY seq LIMIT ?",
+        (seq, limit)
+    ).fetchall()
+    return [Change(s, tbl, op, row_id, json.loads(data) if data else {}, at)
+            for s, tbl, op, row_id, data, at in rows]
+
+
+class ChangeFollower:
+    """Фоновый поток, передающий новые изменения журнала в callback(change).
+
+    Начинает с последнего изменения на момент запуска; поток стартует при
+    первом вызове start() — уже в воркере, а не в процессе до fork.
+    """
+
+    def __init__(self, db_name, callback, interval=0.5, batch=1000):
+        self.db_name = db_name
+        self.callback = callback
+        self.interval = interval
+        self.batch = batch
+        self.seq = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    conn = connect_readonly(self.db_name)
+                    try:
+                        if self.seq is None:
+                            self.seq = last_seq(conn)
+                    finally:
+                        conn.close()
+                    self._thread = threading.Thread(target=self._run, name="change-follower", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        conn = connect_readonly(self.db_name)
+        while True:
+            changes = changes_after(conn, self.seq, self.batch)
+            for change in changes:
+                try:
+                    self.callback(change)
+                except Exception as e:
+                    print(f"[changes] Ошибка обработки изменения {change.seq}: {e}")
+                self.seq = change.seq
+            if len(changes) < self.batch:
+                time.sleep(self.interval)
@@ -0,0 +1,278 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+# -----------------------
+# Схема базы и подключения
+# -----------------------
+# Номер схемы хранится в PRAGMA user_version. Если база уже обновлена,
+# проверка при старте — одно чтение прагмы; миграции применяются только
+# к новым или устаревшим файлам. Проверка выполняется лениво, при первом
+# подключении к базе, а не при импорте модуля приложения.
+
+MIGRATIONS = [
+    # 1: исходная схема site.py
+    [
+        """
+        CREATE TABLE IF NOT EXISTS Users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            Login TEXT UNIQUE,
+            Password TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS Request (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            RoomType TEXT,
+            Date TEXT,              -- ISO: YYYY-MM-DD
+            RentType TEXT,          -- 'days' | 'hours'
+            Duration INTEGER,       -- целое положительное
+            id_users INTEGER,
+            FOREIGN KEY(id_users) REFERENCES Users(id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_request_room_date ON Request(RoomType, Date)",
+        "CREATE INDEX IF NOT EXISTS idx_request_user ON Request(id_users)",
+    ],
+    # 2: покрывающий индекс для «Моих заявок»; id стоит сразу после Date,
+    # чтобы порядок (Date, id) брался из индекса без сортировки
+    [
+        """
+        CREATE INDEX IF NOT EXISTS idx_request_user_date
+        ON Request(id_users, Date, id, RoomType, RentType, Duration)
+        """,
+    ],
+    # 3: сессии, общие для всех воркеров
+    [
+        """
+        CREATE TABLE IF NOT EXISTS Sessions (
+            id TEXT PRIMARY KEY,
+            data TEXT
+        ) WITHOUT ROWID
+        """,
+    ],
+    # 4: переход на WAL — выполняется после транзакции миграции (см. USE_WAL)
+    [],
+    # 5: журнал изменений (coworking/changes.py). Записи добавляют триггеры,
+    # поэтому они попадают в ту же транзакцию, что и сама вставка, при любом
+    # пути записи. Старые строки не переносятся: потребитель начинает со
+    # снимка таблицы и номера последнего изменения. Пароли в журнал не пишутся.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS Changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tbl TEXT NOT NULL,
+            op TEXT NOT NULL,       -- 'insert' | 'delete'
+            row_id INTEGER NOT NULL,
+            data TEXT               -- JSON с полями строки
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS changes_users_insert AFTER INSERT ON Users
+        BEGIN
+            INSERT INTO Changes (tbl, op, row_id, data)
+            VALUES ('Users', 'insert', NEW.id, json_object('login', NEW.Login));
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS changes_request_insert AFTER INSERT ON Request
+        BEGIN
+            INSERT INTO Changes (tbl, op, row_id, data)
+            VALUES ('Request', 'insert', NEW.id, json_object(
+                'room_type', NEW.RoomType, 'date', NEW.Date, 'rent_type', NEW.RentType,
+                'duration', NEW.Duration, 'user_id', NEW.id_users));
+        END
+        """,
+    ],
+    # 6: отмена брони попадает в журнал; лист ожидания (coworking/waitlist.py)
+    [
+        """
+        CREATE TRIGGER IF NOT EXISTS changes_request_delete AFTER DELETE ON Request
+        BEGIN
+            INSERT INTO Changes (tbl, op, row_id, data)
+            VALUES ('Request', 'delete', OLD.id, json_object(
+                'room_type', OLD.RoomType, 'date', OLD.Date, 'rent_type', OLD.RentType,
+                'duration', OLD.Duration, 'user_id', OLD.id_users));
+        END
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS Waitlist (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            RoomType TEXT,
+            Date TEXT,
+            RentType TEXT,
+            Duration INTEGER,
+            id_users INTEGER,
+            Status TEXT NOT NULL DEFAULT 'waiting',   -- waiting | promoted | expired | cancelled
+            id_request INTEGER,                       -- заявка, созданная при продвижении
+            FOREIGN KEY(id_users) REFERENCES Users(id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_waitlist_queue ON Waitlist(Status, RoomType, Date)",
+        "CREATE INDEX IF NOT EXISTS idx_waitlist_user ON Waitlist(id_users, id)",
+    ],
+    # 7: повторяющиеся брони (coworking/series.py) — одна запись на серию,
+    # повторения — обычные строки Request со ссылкой на неё
+    [
+        """
+        CREATE TABLE IF NOT EXISTS Series (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_users INTEGER,
+            RoomType TEXT,
+            FirstDate TEXT,
+            Freq TEXT,                  -- 'daily' | 'weekly'
+            UntilDate TEXT,             -- последняя дата или NULL
+            Count INTEGER,              -- число повторений или NULL
+            RentType TEXT,
+            Duration INTEGER,
+            ExpandedThrough TEXT,       -- до какой даты повторения уже развёрнуты
+            Generated INTEGER NOT NULL DEFAULT 0,   -- сколько повторений рассмотрено
+            FOREIGN KEY(id_users) REFERENCES Users(id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_series_user ON Series(id_users)",
+        "ALTER TABLE Request ADD COLUMN id_series INTEGER REFERENCES Series(id)",
+    ],
+    # 8: самая длинная дневная бронь — нижняя граница выборки заявок,
+    # ещё идущих сегодня (пакетное распределение), без перебора истории
+    [
+        "CREATE INDEX IF NOT EXISTS idx_request_rent_duration ON Request(RentType, Duration)",
+    ],
+    # 9: время изменения в журнале (UTC, ставят триггеры) — DTSTAMP ленты
+    # календаря (coworking/icalfeed.py) не меняется между опросами. Триггеры
+    # пересоздаются с новым столбцом; у старых строк журнала время пустое.
+    [
+        "ALTER TABLE Changes ADD COLUMN At TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_changes_row ON Changes(tbl, row_id)",
+        "DROP TRIGGER IF EXISTS changes_users_insert",
+        "DROP TRIGGER IF EXISTS changes_request_insert",
+        "DROP TRIGGER IF EXISTS changes_request_delete",
+        """
+        CREATE TRIGGER changes_users_insert AFTER INSERT ON Users
+        BEGIN
+            INSERT INTO Changes (tbl, op, row_id, data, At)
+            VALUES ('Users', 'insert', NEW.id, json_object('login', NEW.Login),
+                    strftime('%Y-%m-%dT%H:%M:%SZ', 'now'));
+        END
+        """,
+        """
+        CREATE TRIGGER changes_request_insert AFTER INSERT ON Request
+        BEGIN
+            INSERT INTO Changes (tbl, op, row_id, data, At)
+            VALUES ('Request', 'insert', NEW.id, json_object(
+                'room_type', NEW.RoomType, 'date', NEW.Date, 'rent_type', NEW.RentType,
+                'duration', NEW.Duration, 'user_id', NEW.id_users),
+                strftime('%Y-%m-%dT%H:%M:%SZ', 'now'));
+        END
+        """,
+        """
+        CREATE TRIGGER changes_request_delete AFTER DELETE ON Request
+        BEGIN
+            INSERT INTO Changes (tbl, op, row_id, data, At)
+            VALUES ('Request', 'delete', OLD.id, json_object(
+                'room_type', OLD.RoomType, 'date', OLD.Date, 'rent_type', OLD.RentType,
+                'duration', OLD.Duration, 'user_id', OLD.id_users),
+                strftime('%Y-%m-%dT%H:%M:%SZ', 'now'));
+        END
+        """,
+    ],
+    # 10: срок жизни сессии (unix-время, coworking/sessions.py). У сессий,
+    # созданных до миграции, срока нет — они считаются истёкшими
+    [
+        "ALTER TABLE Sessions ADD COLUMN expires REAL",
+        "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON Sessions(expires)",
+    ],
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Режим журнала WAL: читатели не блокируют запись и наоборот, поэтому долгие
+# отчёты не задерживают /book. Режим хранится в самом файле БД, так что
+# включается один раз — вместе с миграцией старой базы.
+USE_WAL = True
+
+_ready = set()
+_lock = threading.Lock()
+# Подключения, которые держат живыми базы в памяти (file:...?mode=memory)
+_keepalive = {}
+
+
+def _open(db_name, timeout):
+    # uri=True позволяет передать "file:test?mode=memory&cache=shared";
+    # обычные пути SQLite по-прежнему понимает как имена файлов
+    return sqlite3.connect(db_name, timeout=timeout, uri=True)
+
+
+def migrate(conn) -> int:
+    """Доводит схему до SCHEMA_VERSION; возвращает номер схемы до миграции."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return version
+    with conn:
+        for statements in MIGRATIONS[version:]:
+            for sql in statements:
+                conn.execute(sql)
+        # PRAGMA не принимает параметры — номер подставляется как число
+        conn.execute(f"PRAGMA user_version = {int(SCHEMA_VERSION)}")
+    if USE_WAL:
+        # journal_mode нельзя менять внутри транзакции; базы в памяти WAL не поддерживают
+        conn.execute("PRAGMA journal_mode = WAL")
+    return version
+
+
+def ensure_schema(db_name):
+    if db_name in _ready:
+        return
+    with _lock:
+        if db_name in _ready:
+            return
+        conn = _open(db_name, timeout=30)
+        try:
+            migrate(conn)
+        finally:
+            if "mode=memory" in db_name:
+                _keepalive[db_name] = conn
+            else:
+                conn.close()
+        _ready.add(db_name)
+
+
+def connect(db_name, timeout=5.0):
+    ensure_schema(db_name)
+    return _open(db_name, timeout)
+
+
+def connect_readonly(db_name, timeout=5.0):
+    """Подключение только для чтения — для админки и отчётов."""
+    conn = connect(db_name, timeout)
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+class ReadSnapshot:
+    """Согласованный снимок базы для отчёта.
+
+    Внутри with все запросы видят базу на момент taken_at: в режиме WAL
+    читающая транзакция фиксирует снимок при первом чтении и не мешает
+    одновременным вставкам бронирований.
+    """
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.conn = None
+        self.taken_at = None
+
+    def __enter__(self):
+        self.conn = connect_readonly(self.db_name)
+        self.conn.isolation_level = None
+        self.conn.execute("BEGIN")
+        # Первое чтение открывает снимок — с этого момента данные не меняются
+        self.conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        self.taken_at = datetime.now()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK")
+        finally:
+            self.conn.close()
+        return False
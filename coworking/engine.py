@@ -0,0 +1,233 @@
+from datetime import date, datetime, timedelta
+
+from coworking.db import connect_readonly
+
+# -----------------------
+# Ядро бронирования
+# -----------------------
+# Правила бронирования (окно, конец периода, пересечения) и операции над
+# заявками — проверка доступности, причина конфликта, поиск альтернатив,
+# вставка — в одном месте для всех трёх приложений. Где лежат заявки,
+# решает хранилище:
+#
+#   SQLiteStorage — таблица Request на переданном соединении (site.py,
+#                   trpo/site.py); в транзакции записи проверка и вставка
+#                   атомарны;
+#   MemoryStorage — комнаты и заявки в памяти процесса (trpo.py) с индексом
+#                   занятости {(комната, день): заявка}.
+#
+# Хранилище описывает «единицы» помещения: в SQLite тип помещения — одна
+# единица (None), в памяти — конкретные комнаты. Тип свободен, если свободна
+# хотя бы одна его единица. Быстрый индекс занятости (таблица в общей
+# памяти) можно передать движку — им отвечают проверки вне транзакции.
+
+BOOKING_WINDOW_DAYS = 30
+
+# Причины отказа
+TAKEN = "taken"
+OWN = "own"
+
+
+def booking_window_end(today=None) -> date:
+    # Бронировать можно не позже чем через BOOKING_WINDOW_DAYS дней
+    return (today or date.today()) + timedelta(days=BOOKING_WINDOW_DAYS)
+
+
+def can_book_date(desired_date: date, today=None) -> bool:
+    # Не раньше сегодня и не позже конца окна
+    today = today or date.today()
+    return today <= desired_date <= booking_window_end(today)
+
+
+def period_end(start: date, rent_type: str, duration: int) -> date:
+    # Часовые брони считаем занятием конкретного дня (без точного времени в схеме)
+    if rent_type == "hours":
+        return start
+    # Дневные брони: включительно, duration>=1
+    return start + timedelta(days=duration - 1)
+
+
+def overlaps(a_start: date, a_end: date, b_start: date, b_end: date) -> bool:
+    return not (a_end < b_start or b_end < a_start)
+
+
+class Storage:
+    """Хранилище заявок для BookingEngine."""
+
+    def units(self, room_type):
+        """Единицы помещения этого типа; [None] — тип и есть единица."""
+        raise NotImplementedError
+
+    def bookings(self, room_type, start, end):
+        """(единица, начало, конец, пользователь) заявок типа, пересекающих [start, end]."""
+        raise NotImplementedError
+
+    def insert(self, room_type, unit, start, rent_type, duration, user):
+        """Сохраняет заявку и возвращает её id."""
+        raise NotImplementedError
+
+
+class SQLiteStorage(Storage):
+    """Заявки в таблице Request.
+
+    С conn работает на соединении вызывающего (транзакция записи, снимок
+    отчёта); без него каждое чтение открывает подключение только для
+    чтения к db_name.
+    """
+
+    def __init__(self, conn=None, db_name=None):
+        self.conn = conn
+        self.db_name = db_name
+
+    def units(self, room_type):
+        return [None]
+
+    def _fetch(self, sql, params):
+        if self.conn is not None:
+            return self.conn.execute(sql, params).fetchall()
+        conn = connect_readonly(self.db_name)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def bookings(self, room_type, start, end):
+        # Заявки, начавшиеся позже конца периода, пересечься с ним не могут
+        rows = self._fetch(
+            "SELECT Date, RentType, Duration, id_users FROM Request WHERE RoomType=? AND Date<=?",
+            (room_type, end.isoformat())
+        )
+        for d_str, rent_type, duration, user_id in rows:
+            s = datetime.strptime(d_str, "%Y-%m-%d").date()
+            e = period_end(s, rent_type, int(duration))
+            if overlaps(start, end, s, e):
+                yield None, s, e, user_id
+
+    def insert(self, room_type, unit, start, rent_type, duration, user):
+        return self.conn.execute(
+            "INSERT INTO Request (RoomType, Date, RentType, Duration, id_users) VALUES (?, ?, ?, ?, ?)",
+            (room_type, start.isoformat(), rent_type, duration, user)
+        ).lastrowid
+
+
+class MemoryStorage(Storage):
+    """Комнаты и заявки в памяти; блокировку держит вызывающий."""
+
+    def __init__(self, rooms):
+        self.rooms = rooms
+        self.bookings_list = []
+        self.occupied = {}      # {(id комнаты, день): id заявки} — без перебора всех заявок
+
+    def units(self, room_type):
+        return [room["id"] for room in self.rooms if room["room_type"] == room_type]
+
+    def room_type(self, room_id):
+        return next(room["room_type"] for room in self.rooms if room["id"] == room_id)
+
+    def get(self, booking_id):
+        if 1 <= booking_id <= len(self.bookings_list):
+            return self.bookings_list[booking_id - 1]
+        return None
+
+    def bookings(self, room_type, start, end):
+        seen = set()
+        for room_id in self.units(room_type):
+            day = start
+            while day <= end:
+                booking_id = self.occupied.get((room_id, day))
+                if booking_id is not None and booking_id not in seen:
+                    seen.add(booking_id)
+                    booking = self.bookings_list[booking_id - 1]
+                    yield room_id, booking["start_date"], booking["end_date"], booking["user"]
+                day += timedelta(days=1)
+
+    def _days(self, booking):
+        day = booking["start_date"]
+        while day <= booking["end_date"]:
+            yield booking["room_id"], day
+            day += timedelta(days=1)
+
+    def insert(self, room_type, unit, start, rent_type, duration, user):
+        booking = {
+            "id": len(self.bookings_list) + 1,
+            "room_id": unit,
+            "start_date": start,
+            "end_date": period_end(start, rent_type, duration),
+            "duration_hours": duration if rent_type == "hours" else None,
+            "duration_days": duration if rent_type == "days" else None,
+            "status": "accepted",
+            "user": user
+        }
+        self.bookings_list.append(booking)
+        for key in self._days(booking):
+            self.occupied[key] = booking["id"]
+        return booking["id"]
+
+    def cancel(self, booking_id, user):
+        """Отменяет свою заявку; возвращает её или None"""
+        booking = self.get(booking_id)
+        if not booking or booking["user"] != user or booking["status"] != "accepted":
+            return None
+        booking["status"] = "cancelled"
+        for key in self._days(booking):
+            self.occupied.pop(key, None)
+        return booking
+
+
+class BookingEngine:
+    """Операции бронирования над хранилищем."""
+
+    def __init__(self, storage, occupancy=None):
+        self.storage = storage
+        self.occupancy = occupancy
+
+    def free_units(self, room_type, start, end):
+        busy = {unit for unit, _, _, _ in self.storage.bookings(room_type, start, end)}
+        return [unit for unit in self.storage.units(room_type) if unit not in busy]
+
+    def is_available(self, room_type, start, end=None):
+        """Есть ли свободная единица типа на весь период [start, end]."""
+        end = end or start
+        if self.occupancy is not None:
+            free = self.occupancy.is_free(room_type, start, end)
+            if free is not None:
+                return free
+        return bool(self.free_units(room_type, start, end))
+
+    def conflict(self, room_type, start, end, user=None):
+        """None, если бронировать можно; иначе OWN (своя заявка на период) или TAKEN."""
+        rows = list(self.storage.bookings(room_type, start, end))
+        if user is not None and any(row_user == user for _, _, _, row_user in rows):
+            return OWN
+        busy = {unit for unit, _, _, _ in rows}
+        if all(unit in busy for unit in self.storage.units(room_type)):
+            return TAKEN
+        return None
+
+    def book(self, room_type, start, rent_type, duration, user):
+        """(id заявки, None) или (None, причина отказа).
+
+        Проверка и вставка атомарны, если вызывающий держит транзакцию
+        записи (SQLite) или блокировку хранилища (память).
+        """
+        end = period_end(start, rent_type, duration)
+        reason = self.conflict(room_type, start, end, user)
+        if reason:
+            return None, reason
+        unit = self.free_units(room_type, start, end)[0]
+        return self.storage.insert(room_type, unit, start, rent_type, duration, user), None
+
+    def alternative_date(self, room_type, desired_date, rent_type, duration, days=30):
+        """Ближайшая следующая дата в окне, на которую свободен весь период."""
+        for i in range(1, days + 1):
+            day = desired_date + timedelta(days=i)
+            if not can_book_date(day):
+                break
+            if self.is_available(room_type, day, period_end(day, rent_type, duration)):
+                return day
+        return None
+
+    def alternative_types(self, room_types, start, rent_type, duration):
+        """Типы из room_types, свободные на весь период."""
+        end = period_end(start, rent_type, duration)
+        return [room_type for room_type in room_types if self.is_available(room_type, start, end)]
@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from flask import Response, request
+
+# -----------------------
+# Лента изменений доступности (server-sent events)
+# -----------------------
+# Вместо того чтобы перезагружать /bookings, браузер держит одно соединение
+# с /availability/stream и получает короткие события «помещение, день,
+# новое состояние» вскоре после COMMIT брони. Рассылкой занимается один
+# Broadcaster на процесс: событие кладётся в общую историю и в буфер каждого
+# подписчика, запросов к SQLite на каждого подписчика нет.
+#
+# Буфер подписчика ограничен: если клиент не успевает читать, он получает
+# событие reset и заново запрашивает снимок. Номер последнего события
+# (Last-Event-ID) позволяет после обрыва дочитать пропущенное из истории.
+# В номер входит эпоха процесса — после перезапуска или при переходе на
+# другой воркер старые номера не подходят, и клиент получает свежий снимок.
+#
+# События в Broadcaster поставляет приложение — по журналу изменений
+# (coworking/changes.py), который читает каждый воркер, так что подписчик
+# видит брони, сделанные через любой процесс.
+
+KEEPALIVE = 15        # секунд между комментариями-пингами
+STREAM_TTL = 300      # соединение закрывается, браузер переподключается сам
+RETRY_MS = 2000
+
+
+class Subscriber:
+    def __init__(self, maxlen):
+        self.maxlen = maxlen
+        self.events = deque()
+        self.lagged = False
+        self.cond = threading.Condition()
+
+    def push(self, item):
+        with self.cond:
+            if len(self.events) >= self.maxlen:
+                # Клиент отстал — дальше буферизовать нет смысла
+                self.lagged = True
+                self.events.clear()
+            elif not self.lagged:
+                self.events.append(item)
+            self.cond.notify()
+
+    def wait(self, timeout):
+        """Забирает накопленные события; пустой список — за timeout ничего не пришло."""
+        with self.cond:
+            if not self.events and not self.lagged:
+                self.cond.wait(timeout)
+            items = list(self.events)
+            self.events.clear()
+            return items
+
+
+class Broadcaster:
+    def __init__(self, buffer_size=256, history=1024, max_subscribers=16):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.epoch = os.urandom(4).hex()
+        self.seq = 0
+        self._history = deque(maxlen=history)   # (seq, событие)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def event_id(self, seq):
+        return f"{self.epoch}-{seq}"
+
+    def parse_event_id(self, value):
+        """Номер события из Last-Event-ID или None, если он не из этого процесса."""
+        epoch, _, seq = (value or "").partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def publish(self, event):
+        with self._lock:
+            self.seq += 1
+            item = (self.seq, event)
+            self._history.append(item)
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.push(item)
+        return item[0]
+
+    def subscribe(self, last_seq=None):
+        """Новый подписчик или None, если мест нет.
+
+        При last_seq в буфер сразу попадают пропущенные события; если история
+        их уже не хранит, подписчик помечается отставшим (нужен новый снимок).
+        """
+        sub = Subscriber(self.buffer_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            if last_seq is not None:
+                oldest = self._history[0][0] if self._history else self.seq + 1
+                if last_seq + 1 < oldest or last_seq > self.seq:
+                    sub.lagged = True
+                else:
+                    for item in self._history:
+                        if item[0] > last_seq:
+                            sub.push(item)
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+
+def _format(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
+
+
+def event_stream(broadcaster, snapshot):
+    """Flask-ответ text/event-stream.
+
+    snapshot() возвращает текущую занятость — её получает клиент без
+    Last-Event-ID (или с устаревшим номером) первым событием.
+    """
+    last_seq = broadcaster.parse_event_id(request.headers.get("Last-Event-ID"))
+    sub = broadcaster.subscribe(last_seq)
+    if sub is None:
+        return Response("Too many subscribers", status=503, headers={"Retry-After": "30"})
+    first = None
+    if last_seq is None or sub.lagged:
+        # Подписались до чтения снимка: события, пришедшие за время запроса,
+        # повторятся после него — для состояний это безопасно. Снимок читается
+        # здесь, в контексте запроса, чтобы поток не держал этот контекст.
+        with sub.cond:
+            sub.lagged = False
+        seq = broadcaster.seq
+        try:
+            first = _format("snapshot", snapshot(), broadcaster.event_id(seq))
+        except Exception:
+            broadcaster.unsubscribe(sub)
+            raise
+
+    def generate():
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            if first:
+                yield first
+            deadline = time.monotonic() + STREAM_TTL
+            while time.monotonic() < deadline:
+                items = sub.wait(KEEPALIVE)
+                if sub.lagged:
+                    yield _format("reset", {})
+                    return
+                if not items:
+                    yield ": ping\n\n"
+                for seq, event in items:
+                    yield _format("availability", event, broadcaster.event_id(seq))
+        finally:
+            broadcaster.unsubscribe(sub)
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
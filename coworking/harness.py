@@ -0,0 +1,280 @@
+"""Сверка и замер логики доступности.
+
+    python -m coworking.harness --ops 5000 --seed 1
+    python -m coworking.harness --scenario rooms --ops 20000
+
+Генерирует случайную (воспроизводимую по --seed) последовательность
+операций — брони, отмены, проверки доступности — с крайними случаями на
+границах окна бронирования и смесью часовых и дневных заявок. Одна и та же
+последовательность прогоняется через эталон и через каждого кандидата;
+решения (принята / причина отказа, свободно / занято) должны совпасть
+во всём. Для каждого варианта печатается скорость в операциях в секунду.
+
+Эталон — прямой перебор всех заявок, как в исходных циклах приложений.
+Кандидаты — ядро бронирования (coworking/engine.py) на SQLite, на SQLite
+с таблицей занятости в общей памяти и на хранилище в памяти. Любая новая
+реализация доступности добавляется сюда кандидатом и должна пройти сверку.
+
+Сценарии:
+    single — одна единица на тип помещения (site.py, trpo/site.py);
+    rooms  — несколько комнат на тип (trpo.py).
+
+Код возврата 1 — есть расхождения.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+
+from coworking import db
+from coworking.engine import (BookingEngine, MemoryStorage, SQLiteStorage, OWN, TAKEN,
+                              BOOKING_WINDOW_DAYS, can_book_date, period_end)
+from coworking.occupancy import OccupancyTable, shared_memory
+
+ROOM_TYPES = ["workspace_open", "office_light", "office_premium", "meeting_room"]
+# Комнаты trpo.py: по две на открытые места и переговорные
+ROOMS = [
+    {"id": 1, "room_type": "workspace_open"},
+    {"id": 2, "room_type": "workspace_open"},
+    {"id": 3, "room_type": "office_light"},
+    {"id": 4, "room_type": "office_premium"},
+    {"id": 5, "room_type": "meeting_room"},
+    {"id": 6, "room_type": "meeting_room"},
+]
+SINGLE_ROOMS = [{"id": i + 1, "room_type": t} for i, t in enumerate(ROOM_TYPES)]
+
+WINDOW = "window"    # отказ: дата вне окна бронирования
+MAX_DIFFS = 5        # сколько расхождений показывать
+
+# kind: book | cancel | check; target — номер операции-брони для отмены
+Op = namedtuple("Op", "index kind room_type start rent_type duration user target")
+
+
+def workload(seed, ops, users, today):
+    """Случайные операции; четверть дат — на границах окна."""
+    rnd = random.Random(seed)
+    edges = [-1, 0, 1, BOOKING_WINDOW_DAYS - 1, BOOKING_WINDOW_DAYS, BOOKING_WINDOW_DAYS + 1]
+    booked = []
+    result = []
+    for i in range(ops):
+        roll = rnd.random()
+        if roll < 0.15 and booked:
+            result.append(Op(i, "cancel", None, None, None, None, None, rnd.choice(booked)))
+            continue
+        offset = rnd.choice(edges) if rnd.random() < 0.25 else rnd.randint(-3, BOOKING_WINDOW_DAYS + 5)
+        rent_type = rnd.choice(["days", "hours"])
+        duration = rnd.randint(1, 6) if rent_type == "days" else rnd.randint(1, 8)
+        kind = "check" if roll < 0.3 else "book"
+        result.append(Op(i, kind, rnd.choice(ROOM_TYPES), today + timedelta(days=offset),
+                         rent_type, duration, rnd.randint(1, users), None))
+        if kind == "book":
+            booked.append(i)
+    return result
+
+
+def reference_end(start, rent_type, duration):
+    # Свои копии правил: ошибка в ядре не должна попасть и в эталон
+    return start if rent_type == "hours" else start + timedelta(days=duration - 1)
+
+
+def reference_overlaps(a_start, a_end, b_start, b_end):
+    return not (a_end < b_start or b_end < a_start)
+
+
+class Reference:
+    """Эталон: перебор всех заявок на каждую операцию."""
+
+    name = "эталон"
+
+    def __init__(self, rooms, today):
+        self.units = {t: [r["id"] for r in rooms if r["room_type"] == t] for t in ROOM_TYPES}
+        self.today = today
+        self.rows = {}      # номер операции -> (тип, единица, начало, конец, пользователь)
+
+    def _scan(self, room_type, start, end):
+        busy, users = set(), set()
+        for rt, unit, s, e, user in self.rows.values():
+            if rt == room_type and reference_overlaps(start, end, s, e):
+                busy.add(unit)
+                users.add(user)
+        return busy, users
+
+    def book(self, op):
+        if not self.today <= op.start <= self.today + timedelta(days=BOOKING_WINDOW_DAYS):
+            return False, WINDOW
+        end = reference_end(op.start, op.rent_type, op.duration)
+        busy, users = self._scan(op.room_type, op.start, end)
+        if op.user in users:
+            return False, OWN
+        free = [u for u in self.units[op.room_type] if u not in busy]
+        if not free:
+            return False, TAKEN
+        self.rows[op.index] = (op.room_type, free[0], op.start, end, op.user)
+        return True, None
+
+    def cancel(self, op):
+        return self.rows.pop(op.target, None) is not None
+
+    def check(self, op):
+        busy, _ = self._scan(op.room_type, op.start, reference_end(op.start, op.rent_type, op.duration))
+        return any(u not in busy for u in self.units[op.room_type])
+
+    def close(self):
+        pass
+
+
+class EngineCandidate:
+    """Ядро бронирования над хранилищем в памяти."""
+
+    def __init__(self, name, rooms, today):
+        self.name = name
+        self.today = today
+        self.storage = MemoryStorage(rooms)
+        self.engine = BookingEngine(self.storage)
+        self.ids = {}       # номер операции -> id заявки
+
+    def book(self, op):
+        if not can_book_date(op.start, self.today):
+            return False, WINDOW
+        booking_id, reason = self.engine.book(op.room_type, op.start, op.rent_type, op.duration, op.user)
+        if reason:
+            return False, reason
+        self.ids[op.index] = booking_id
+        return True, None
+
+    def cancel(self, op):
+        booking_id = self.ids.pop(op.target, None)
+        if booking_id is None:
+            return False
+        return self.storage.cancel(booking_id, self.storage.get(booking_id)["user"]) is not None
+
+    def check(self, op):
+        return self.engine.is_available(op.room_type, op.start, period_end(op.start, op.rent_type, op.duration))
+
+    def close(self):
+        pass
+
+
+class SQLiteCandidate(EngineCandidate):
+    """Ядро бронирования на SQLite (временная база), по желанию — с таблицей в общей памяти."""
+
+    def __init__(self, name, today, with_shm=False):
+        self.name = name
+        self.today = today
+        self.dir = tempfile.mkdtemp(prefix="coworking-harness-")
+        self.db_name = os.path.join(self.dir, "harness.db")
+        self.conn = db.connect(self.db_name)
+        # Меряем логику, а не fsync: сохранность данных здесь не нужна
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.conn.isolation_level = None
+        self.occupancy = OccupancyTable(self.db_name, ROOM_TYPES, period_end) if with_shm else None
+        self.engine = BookingEngine(SQLiteStorage(self.conn), self.occupancy)
+        self.ids = {}
+
+    def _write(self, fn):
+        # Как WriteCoordinator: транзакция записи, после COMMIT — обновление таблицы
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn()
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        if self.occupancy is not None:
+            self.occupancy.sync(self.conn)
+        return result
+
+    def book(self, op):
+        if not can_book_date(op.start, self.today):
+            return False, WINDOW
+        booking_id, reason = self._write(
+            lambda: self.engine.book(op.room_type, op.start, op.rent_type, op.duration, op.user))
+        if reason:
+            return False, reason
+        self.ids[op.index] = booking_id
+        return True, None
+
+    def cancel(self, op):
+        booking_id = self.ids.pop(op.target, None)
+        if booking_id is None:
+            return False
+        return self._write(lambda: self.conn.execute("DELETE FROM Request WHERE id=?", (booking_id,)).rowcount) > 0
+
+    def close(self):
+        if self.occupancy is not None:
+            self.occupancy.unlink()
+        self.conn.close()
+        for name in os.listdir(self.dir):
+            os.remove(os.path.join(self.dir, name))
+        os.rmdir(self.dir)
+
+
+def run(impl, ops):
+    """Прогоняет операции; возвращает (решения, секунды)."""
+    decisions = []
+    started = time.perf_counter()
+    for op in ops:
+        if op.kind == "book":
+            decisions.append(impl.book(op))
+        elif op.kind == "cancel":
+            decisions.append(impl.cancel(op))
+        else:
+            decisions.append(impl.check(op))
+    return decisions, time.perf_counter() - started
+
+
+def compare(ops, expected, got):
+    return [(op, e, g) for op, e, g in zip(ops, expected, got) if e != g]
+
+
+def candidates(scenario, today, with_shm):
+    if scenario == "rooms":
+        return ROOMS, [EngineCandidate("engine/memory", ROOMS, today)]
+    result = [EngineCandidate("engine/memory", SINGLE_ROOMS, today), SQLiteCandidate("engine/sqlite", today)]
+    if with_shm:
+        result.append(SQLiteCandidate("engine/sqlite+shm", today, with_shm=True))
+    return SINGLE_ROOMS, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сверка и замер логики доступности")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--ops", type=int, default=5000, help="операций в сценарии")
+    parser.add_argument("--users", type=int, default=12)
+    parser.add_argument("--scenario", choices=["single", "rooms", "all"], default="all")
+    parser.add_argument("--no-shm", action="store_true", help="без таблицы занятости в общей памяти")
+    args = parser.parse_args(argv)
+
+    # Таблица в общей памяти считает окно от настоящего сегодня
+    today = date.today()
+    with_shm = not args.no_shm and shared_memory is not None
+    failed = False
+    for scenario in (["single", "rooms"] if args.scenario == "all" else [args.scenario]):
+        ops = workload(args.seed, args.ops, args.users, today)
+        rooms, impls = candidates(scenario, today, with_shm)
+        reference = Reference(rooms, today)
+        expected, seconds = run(reference, ops)
+        accepted = sum(1 for op, d in zip(ops, expected) if op.kind == "book" and d[0])
+        print(f"[{scenario}] {len(ops)} операций, принято броней: {accepted}")
+        print(f"  {reference.name:<20} {len(ops) / seconds:>10.0f} оп/с")
+        for impl in impls:
+            try:
+                got, seconds = run(impl, ops)
+            finally:
+                impl.close()
+            diffs = compare(ops, expected, got)
+            status = "совпадает" if not diffs else f"РАСХОЖДЕНИЙ: {len(diffs)}"
+            print(f"  {impl.name:<20} {len(ops) / seconds:>10.0f} оп/с  {status}")
+            for op, e, g in diffs[:MAX_DIFFS]:
+                print(f"    #{op.index} {op.kind} {op.room_type} {op.start} {op.rent_type}x{op.duration} "
+                      f"user={op.user}: эталон {e}, получено {g}")
+            failed = failed or bool(diffs)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
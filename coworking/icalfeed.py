@@ -0,0 +1,209 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from email.utils import formatdate
+
+from coworking.changes import ChangeFollower, last_seq
+from coworking.db import connect_readonly
+
+# -----------------------
+# Календарь броней пользователя (iCalendar)
+# -----------------------
+# Календари (Google, Outlook, Apple) опрашивают /calendar/<token>.ics раз в
+# несколько минут. Лента каждого пользователя собирается один раз из SQLite
+# и дальше хранится готовыми байтами; новые брони дописываются в неё по
+# журналу изменений (coworking/changes.py), отменённые — вырезаются. Полной
+# перегенерации и запросов к базе при опросе нет.
+#
+# ETag сильный: id последней брони пользователя и отпечаток набора его
+# заявок (отмена меняет ленту, но не последний id). Заявки не изменяются
+# после вставки, а id не переиспользуются, поэтому одинаковый ETag значит
+# одинаковые байты — в любом воркере и после перезапуска.
+#
+# Токен в адресе — id пользователя и HMAC от него (и от площадки) на
+# отдельном ключе: календарь не умеет cookie, а проверка токена не требует
+# базы. Ключ берётся из CALENDAR_SECRET в конфигурации или из переменной
+# окружения COWORKING_CALENDAR_SECRET и в репозитории не хранится: id идут
+# подряд, и по известному ключу токен любого пользователя вычислялся бы.
+# Без ключа ленты выключены — ссылка не показывается, адреса отвечают 404.
+
+SECRET_ENV = "COWORKING_CALENDAR_SECRET"
+CALENDAR_NAME = "Coworking — мои брони"
+MAX_FEEDS = 1024    # лент в памяти процесса; сверх этого вытесняются самые давние
+TOKEN_DIGEST = 24
+
+
+def configured_secret(config):
+    """Ключ токенов из конфигурации или окружения; None — ленты выключены."""
+    return config.get("CALENDAR_SECRET") or os.environ.get(SECRET_ENV) or None
+
+
+def make_token(secret, user_id, site=""):
+    message = f"calendar:{site}:{user_id}".encode()
+    digest = hmac.new(str(secret).encode(), message, hashlib.sha256).hexdigest()
+    return f"{user_id}-{digest[:TOKEN_DIGEST]}"
+
+
+def parse_token(secret, token, site=""):
+    """id пользователя из токена или None, если токен поддельный или ключа нет."""
+    if not secret:
+        return None
+    user_id, _, _ = token.partition("-")
+    if not user_id.isdigit():
+        return None
+    if not hmac.compare_digest(make_token(secret, int(user_id), site), token):
+        return None
+    return int(user_id)
+
+
+def escape(text):
+    return (str(text).replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\n", "\\n"))
+
+
+def fold(line):
+    """Переносит строку длиннее 75 байт (RFC 5545, 3.1), не разрывая символы UTF-8."""
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return data + b"\r\n"
+    parts = []
+    while data:
+        cut = min(len(data), 75 if not parts else 74)
+        while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut])
+        data = data[cut:]
+    return b"\r\n ".join(parts) + b"\r\n"
+
+
+HEADER = b"".join(fold(line) for line in [
+    "BEGIN:VCALENDAR",
+    "VERSION:2.0",
+    "PRODID:-//Coworking//Bookings//RU",
+    "CALSCALE:GREGORIAN",
+    "METHOD:PUBLISH",
+    f"X-WR-CALNAME:{escape(CALENDAR_NAME)}",
+])
+FOOTER = fold("END:VCALENDAR")
+
+
+class Feed:
+    """Готовая лента одного пользователя."""
+
+    __slots__ = ("user_id", "events", "seq", "body", "etag", "mtime", "last_modified")
+
+    def __init__(self, user_id, seq):
+        self.user_id = user_id
+        self.events = OrderedDict()    # {id заявки: байты VEVENT} в порядке id
+        self.seq = seq                 # номер журнала, на котором снята лента
+
+    def stamp(self):
+        ids = ",".join(map(str, self.events)).encode()
+        last = next(reversed(self.events), 0)
+        self.etag = '"%d-%s"' % (last, hashlib.sha1(ids).hexdigest()[:16])
+        self.mtime = int(time.time())
+        self.last_modified = formatdate(self.mtime, usegmt=True)
+
+
+class CalendarFeeds:
+    """Ленты пользователей в памяти процесса, обновляемые по журналу изменений."""
+
+    def __init__(self, db_name, labels, period_end, max_feeds=MAX_FEEDS):
+        self.db_name = db_name
+        self.labels = labels
+        self.period_end = period_end
+        self.max_feeds = max_feeds
+        self._feeds = OrderedDict()
+        self._lock = threading.Lock()
+        self._follower = ChangeFollower(db_name, self.apply)
+
+    def event(self, row_id, room_type, d_str, rent_type, duration, created=None):
+        """VEVENT заявки; created — время её вставки из журнала (UTC, ISO 8601)."""
+        start = date.fromisoformat(d_str)
+        end = self.period_end(start, rent_type, int(duration))
+        label = self.labels.get(room_type, room_type)
+        amount = f"{duration} ч" if rent_type == "hours" else f"{duration} дн."
+        # DTSTAMP — время создания заявки из журнала: байты ленты не зависят от
+        # момента сборки. У заявок старше журнала — полночь даты начала
+        if created:
+            dtstamp = created.replace("-", "").replace(":", "")
+        else:
+            dtstamp = f"{start:%Y%m%d}T000000Z"
+        return b"".join(fold(line) for line in [
+            "BEGIN:VEVENT",
+            f"UID:request-{row_id}@coworking",
+            f"DTSTAMP:{dtstamp}",
+            f"DTSTART;VALUE=DATE:{start:%Y%m%d}",
+            f"DTEND;VALUE=DATE:{end + timedelta(days=1):%Y%m%d}",
+            f"SUMMARY:{escape(label)}",
+            f"DESCRIPTION:{escape(f'Заявка #{row_id}, {amount}')}",
+            "TRANSP:OPAQUE",
+            "END:VEVENT",
+        ])
+
+    def _load(self, user_id):
+        conn = connect_readonly(self.db_name)
+        try:
+            conn.execute("BEGIN")    # заявки и номер журнала — из одного снимка
+            feed = Feed(user_id, last_seq(conn))
+            for row in conn.execute(
+                    "SELECT r.id, r.RoomType, r.Date, r.RentType, r.Duration, c.At FROM Request r "
+                    "LEFT JOIN Changes c ON c.tbl = 'Request' AND c.row_id = r.id AND c.op = 'insert' "
+                    "WHERE r.id_users=? ORDER BY r.id",
+                    (user_id,)):
+                feed.events[row[0]] = self.event(*row)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        feed.body = HEADER + b"".join(feed.events.values()) + FOOTER
+        feed.stamp()
+        return feed
+
+    def get(self, user_id):
+        """Лента пользователя; база читается только при первом запросе."""
+        # Поток журнала запускается до чтения — изменения после снимка не
+        # потеряются; если поток упал, он поднимается заново
+        self._follower.start()
+        feed = self._feeds.get(user_id)
+        if feed is not None:
+            return feed
+        with self._lock:
+            feed = self._feeds.get(user_id)
+            if feed is None:
+                # Под блокировкой: apply() ждёт, пока лента не окажется в кэше
+                feed = self._load(user_id)
+                self._feeds[user_id] = feed
+                while len(self._feeds) > self.max_feeds:
+                    self._feeds.popitem(last=False)
+        return feed
+
+    def apply(self, change):
+        """Дописывает новую бронь в ленту или вырезает отменённую."""
+        if change.table != "Request":
+            return
+        with self._lock:
+            feed = self._feeds.get(change.data.get("user_id"))
+            # Лента снята позже этого изменения — оно в ней уже учтено
+            if feed is None or change.seq <= feed.seq:
+                return
+            # Новый объект: запрос, уже взявший старую ленту, отдаст её целиком
+            events = feed.events.copy()
+            if change.op == "delete":
+                if events.pop(change.row_id, None) is None:
+                    return
+                body = HEADER + b"".join(events.values()) + FOOTER
+            else:
+                row = change.data
+                event = self.event(change.row_id, row["room_type"], row["date"], row["rent_type"], row["duration"],
+                                   change.at)
+                events[change.row_id] = event
+                body = feed.body[:-len(FOOTER)] + event + FOOTER
+            updated = Feed(feed.user_id, change.seq)
+            updated.events = events
+            updated.body = body
+            updated.stamp()
+            self._feeds[feed.user_id] = updated
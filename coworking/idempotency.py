@@ -0,0 +1,123 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import current_app, make_response
+
+# -----------------------
+# Повторные отправки формы брони
+# -----------------------
+# Двойной щелчок по «Забронировать» или повтор POST мобильным браузером
+# приходит с тем же ключом формы (скрытое поле, новое при каждом показе
+# страницы). Первая отправка выполняется как обычно, её результат
+# запоминается; повтор получает его сразу — без проверок, поиска
+# альтернатив и записи в базу. Повтор, пришедший, пока первая отправка
+# ещё выполняется, ждёт её результата, а не выполняется параллельно.
+#
+# В ключ кэша входят пользователь и отпечаток полей формы: тот же ключ с
+# другими полями (форма, восстановленная кнопкой «Назад» и изменённая)
+# выполняется заново. Кэш ограничен по числу записей и по времени жизни.
+# Он свой у каждого процесса: повтор, попавший в другой воркер, снова
+# проходит обычную проверку конфликтов при записи.
+
+KEY_FIELD = "idempotency_key"
+MAX_ENTRIES = 4096
+TTL = 600              # секунд хранится результат
+WAIT_TIMEOUT = 30      # сколько повтор ждёт завершения первой отправки
+
+
+class InProgress(Exception):
+    """Первая отправка с этим ключом ещё не завершилась."""
+
+
+def new_key():
+    return uuid.uuid4().hex
+
+
+def request_key(user_id, form):
+    """Ключ кэша для отправки формы или None, если формы без ключа (старая страница)."""
+    key = form.get(KEY_FIELD, "")
+    if not key:
+        return None
+    items = sorted((name, value) for name, value in form.items(multi=True) if name != KEY_FIELD)
+    return user_id, key, hashlib.sha1(repr(items).encode("utf-8")).hexdigest()
+
+
+def freeze(rv):
+    """Ответ обработчика в виде для повторной отдачи: (статус, заголовки, тело).
+
+    Потоковый ответ при этом дочитывается целиком.
+    """
+    response = make_response(rv)
+    body = response.get_data()
+    headers = [(k, v) for k, v in response.headers.items() if k.lower() not in ("content-length", "set-cookie")]
+    return response.status_code, headers, body
+
+
+def replay(frozen):
+    status, headers, body = frozen
+    return current_app.response_class(body, status=status, headers=headers)
+
+
+class _Entry:
+    __slots__ = ("done", "outcome", "created")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.outcome = None
+        self.created = time.monotonic()
+
+
+class IdempotencyCache:
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL, wait_timeout=WAIT_TIMEOUT):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.replayed = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _claim(self, key):
+        """(запись, первая ли это отправка)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.created < self.ttl:
+                return entry, False
+            entry = self._entries[key] = _Entry()
+            self._entries.move_to_end(key)
+            # Записи упорядочены по времени создания — старые и лишние в начале
+            while self._entries:
+                oldest_key, oldest = next(iter(self._entries.items()))
+                if len(self._entries) <= self.max_entries and now - oldest.created < self.ttl:
+                    break
+                del self._entries[oldest_key]
+            return entry, True
+
+    def run(self, key, fn):
+        """Результат fn() для первой отправки с ключом key; повторы получают его же.
+
+        Если fn() упала, запись удаляется: повтор выполнится заново.
+        Если первая отправка не завершилась за wait_timeout — InProgress.
+        """
+        entry, first = self._claim(key)
+        if first:
+            try:
+                entry.outcome = fn()
+            except BaseException:
+                with self._lock:
+                    if self._entries.get(key) is entry:
+                        del self._entries[key]
+                entry.done.set()
+                raise
+            entry.done.set()
+            return entry.outcome
+        if not entry.done.wait(self.wait_timeout):
+            raise InProgress("отправка с этим ключом ещё выполняется")
+        if entry.outcome is None:
+            # Первая отправка упала — выполняем как новую
+            return self.run(key, fn)
+        self.replayed += 1
+        return entry.outcome
@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# -----------------------
+# Фоновые задачи для тяжёлых отчётов
+# -----------------------
+# Отчёт считается в пуле из нескольких потоков, а не внутри запроса. Задачи
+# хранятся в таблице по ключу (имя отчёта, параметры, версия данных): пока
+# данные не изменились, повторный просмотр отдаёт готовый результат сразу.
+
+
+class Job:
+    __slots__ = ("key", "status", "progress", "result", "error", "started", "finished")
+
+    def __init__(self, key):
+        self.key = key
+        self.status = "queued"      # queued | running | done | failed
+        self.progress = 0.0         # 0..1
+        self.result = None
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed")
+
+    @property
+    def percent(self):
+        return int(self.progress * 100)
+
+    def report(self, progress):
+        """Вызывается из функции отчёта, чтобы обновить прогресс."""
+        self.progress = min(max(progress, 0.0), 1.0)
+
+
+class JobQueue:
+    def __init__(self, max_workers=2, max_jobs=64):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report")
+        self._jobs = OrderedDict()   # key -> Job, от старых к новым
+        self._lock = threading.Lock()
+        self.max_jobs = max_jobs
+
+    def get(self, key):
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                self._jobs.move_to_end(key)
+            return job
+
+    def submit(self, key, fn, *args):
+        """Запускает fn(job, *args) или возвращает уже существующую задачу с тем же ключом."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.status != "failed":
+                self._jobs.move_to_end(key)
+                return job
+            job = Job(key)
+            self._jobs[key] = job
+            self._evict()
+        self._pool.submit(self._run, job, fn, args)
+        return job
+
+    def wait(self, job, timeout):
+        """Ждёт завершения задачи не дольше timeout — мелкие отчёты успевают сразу."""
+        deadline = time.monotonic() + timeout
+        while not job.done and time.monotonic() < deadline:
+            time.sleep(0.02)
+        return job.done
+
+    def _evict(self):
+        # Выбрасываем самые старые завершённые задачи; выполняющиеся не трогаем
+        for key in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[key].done:
+                del self._jobs[key]
+
+    @staticmethod
+    def _run(job, fn, args):
+        job.status = "running"
+        try:
+            job.result = fn(job, *args)
+            job.progress = 1.0
+            job.status = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished = time.time()
@@ -0,0 +1,276 @@
+import hashlib
+import os
+import struct
+import threading
+import time
+from datetime import date, datetime
+
+from coworking.changes import changes_after, last_seq
+from coworking.db import connect_readonly
+from coworking.periodindex import PeriodIndex
+
+try:
+    import fcntl
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:   # нет POSIX shared memory — приложения читают SQLite, как раньше
+    shared_memory = None
+
+# -----------------------
+# Таблица занятости в общей памяти
+# -----------------------
+# Счётчики «сколько заявок занимает (тип помещения, день)» на days дней от
+# сегодняшнего лежат в multiprocessing.shared_memory — одна копия на хост
+# для всех воркеров, работающих с этой базой. Проверка «свободно ли» —
+# чтение нескольких чисел без запросов к SQLite и без блокировок.
+#
+# Раскладка: заголовок (magic, seq, stamp, epoch, n_types, n_days), затем
+# int32[n_types][n_days]. seq — seqlock: писатель делает его нечётным на
+# время изменения, читатель повторяет чтение, если seq был нечётным или
+# изменился. stamp — номер последнего учтённого изменения журнала
+# (coworking/changes.py), epoch — порядковый номер первого дня окна.
+#
+# Писатели — потоки записи после COMMIT (sync), они по очереди берут flock
+# и дочитывают журнал с stamp. Таблица перестраивается из SQLite при первом
+# подключении процесса, при смене дня, если писатель умер посреди изменения
+# или журнал не сходится со stamp. Пока таблица недоступна, is_free()
+# возвращает None — приложение проверяет по SQLite.
+#
+# Перестройка берёт действующие заявки из индекса периодов на диске
+# (coworking/periodindex.py), а не перебором всей таблицы Request.
+
+MAGIC = b"CWOCC01\0"
+HEADER = struct.Struct("<8sQqqII")
+SEQ_OFFSET = 8
+DEFAULT_DAYS = 128
+VERIFY_INTERVAL = 5.0    # секунд между сверками stamp с журналом в каждом процессе
+REBUILD_AFTER = 1000     # больше изменений проще перечитать целиком
+
+
+class OccupancyTable:
+    def __init__(self, db_name, room_types, period_end, days=DEFAULT_DAYS):
+        self.db_name = db_name
+        self.room_types = list(room_types)
+        self.index = {t: i for i, t in enumerate(self.room_types)}
+        self.period_end = period_end
+        self.days = days
+        self.size = HEADER.size + 4 * len(self.room_types) * days
+        # Имя зависит от базы и раскладки: другая раскладка — другой сегмент
+        key = f"{os.path.abspath(db_name)}|{','.join(self.room_types)}|{days}"
+        self.name = "cw_occ_" + hashlib.sha1(key.encode()).hexdigest()[:16]
+        self.rebuilds = 0
+        self._shm = None
+        self._counts = None
+        self._verified = 0.0
+        self._lock = threading.Lock()
+        self._lock_path = os.path.join(os.environ.get("TMPDIR", "/tmp"), self.name + ".lock")
+        self._disabled = shared_memory is None
+        # Для базы в памяти или URI индексу на диске негде лежать
+        self.periods = None
+        if not db_name.startswith("file:") and db_name != ":memory:":
+            self.periods = PeriodIndex(db_name + ".periods", period_end)
+
+    # -- подключение ---------------------------------------------------
+
+    def _attach(self):
+        try:
+            shm = shared_memory.SharedMemory(self.name, create=True, size=self.size)
+        except FileExistsError:
+            shm = shared_memory.SharedMemory(self.name)
+        # Сегмент общий для всех процессов хоста: завершение одного воркера
+        # не должно его удалять (resource_tracker по умолчанию удаляет)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        if shm.size < self.size:
+            shm.close()
+            raise RuntimeError(f"сегмент {self.name} меньше ожидаемого")
+        self._shm = shm
+        self._counts = shm.buf[HEADER.size:self.size].cast("i")
+
+    def _ensure(self):
+        """Подключает сегмент и при необходимости сверяет его с базой; False — работать без него."""
+        if self._disabled:
+            return False
+        if self._shm is None or time.monotonic() - self._verified > VERIFY_INTERVAL:
+            attached = self._shm is not None
+            try:
+                # Первое подключение процесса — перестройка, дальше — догон журнала
+                self.refresh(rebuild=not attached)
+            except Exception as e:
+                print(f"[occupancy] Таблица занятости недоступна, проверки идут через SQLite: {e}")
+                if not attached:
+                    self._disabled = True
+                return False
+        return True
+
+    def refresh(self, rebuild=False):
+        """Догоняет журнал своим подключением (или перестраивает таблицу)."""
+        conn = connect_readonly(self.db_name)
+        try:
+            self.sync(conn, rebuild)
+        finally:
+            conn.close()
+
+    # -- заголовок -----------------------------------------------------
+
+    def _header(self):
+        return HEADER.unpack_from(self._shm.buf, 0)
+
+    def _set_seq(self, seq):
+        struct.pack_into("<Q", self._shm.buf, SEQ_OFFSET, seq)
+
+    # -- запись --------------------------------------------------------
+
+    def sync(self, conn, rebuild=False):
+        """Применяет изменения журнала после stamp; вызывается после COMMIT.
+
+        Выполняется под межпроцессной блокировкой; читатели в это время
+        видят нечётный seq и повторяют чтение.
+        """
+        if self._disabled:
+            return
+        with self._lock:
+            if self._shm is None:
+                self._attach()
+            with open(self._lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._sync_locked(conn, rebuild)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+            self._verified = time.monotonic()
+
+    def _periods(self, conn, epoch):
+        """(тип, первый день, последний день) заявок, задевающих окно."""
+        if self.periods is not None:
+            return self.periods.load(conn, epoch)
+        rows = conn.execute(
+            "SELECT RoomType, Date, RentType, Duration FROM Request WHERE Date < ?",
+            (date.fromordinal(epoch + self.days).isoformat(),)
+        ).fetchall()
+        return [(room_type, *self._period(d_str, rent_type, duration))
+                for room_type, d_str, rent_type, duration in rows]
+
+    def _period(self, d_str, rent_type, duration):
+        start = datetime.strptime(d_str, "%Y-%m-%d").date()
+        return start.toordinal(), self.period_end(start, rent_type, int(duration)).toordinal()
+
+    def _sync_locked(self, conn, rebuild):
+        magic, seq, stamp, epoch, n_types, n_days = self._header()
+        today = date.today().toordinal()
+        # Нечётный seq под блокировкой — прошлый писатель умер посреди изменения
+        rebuild = (rebuild or magic != MAGIC or seq & 1 or epoch != today
+                   or (n_types, n_days) != (len(self.room_types), self.days))
+        own_tx = not conn.in_transaction
+        if own_tx:
+            conn.execute("BEGIN")     # журнал и заявки — из одного снимка
+        try:
+            last = last_seq(conn)
+            if stamp > last or last - stamp > REBUILD_AFTER:
+                rebuild = True        # другая база или слишком долгий разрыв
+            if not rebuild and last == stamp:
+                return
+            odd = seq | 1
+            self._set_seq(odd)
+            if not rebuild:
+                for change in changes_after(conn, stamp, REBUILD_AFTER):
+                    if change.table != "Request":
+                        continue
+                    row = change.data
+                    delta = -1 if change.op == "delete" else 1
+                    first, end = self._period(row["date"], row["rent_type"], row["duration"])
+                    if not self._apply(row["room_type"], first, end, today, delta):
+                        rebuild = True    # счётчик ушёл в минус — таблица разошлась с базой
+                        break
+            if rebuild:
+                self._counts[:] = memoryview(bytes(len(self._counts) * 4)).cast("i")
+                for room_type, first, end in self._periods(conn, today):
+                    self._apply(room_type, first, end, today, 1)
+                self.rebuilds += 1
+            HEADER.pack_into(self._shm.buf, 0, MAGIC, odd, last, today, len(self.room_types), self.days)
+            # При исключении seq остаётся нечётным: читатели идут в SQLite,
+            # следующий писатель перестроит таблицу
+            self._set_seq(odd + 1)
+        finally:
+            if own_tx:
+                conn.execute("COMMIT")
+
+    def _apply(self, room_type, start, end, epoch, delta):
+        """Прибавляет delta к дням [start, end] (порядковые номера) внутри окна; False — счётчик ушёл в минус."""
+        row = self.index.get(room_type)
+        if row is None:
+            return True
+        first = max(start, epoch) - epoch
+        last = min(end, epoch + self.days - 1) - epoch
+        base = row * self.days
+        ok = True
+        for i in range(base + first, base + last + 1):
+            value = self._counts[i] + delta
+            self._counts[i] = value
+            ok = ok and value >= 0
+        return ok
+
+    # -- чтение --------------------------------------------------------
+
+    def _read(self, fn):
+        """Согласованное чтение под seqlock: fn(epoch) или None, если не удалось."""
+        buf = self._shm.buf
+        for attempt in range(100):
+            seq = struct.unpack_from("<Q", buf, SEQ_OFFSET)[0]
+            if not seq & 1:
+                epoch = struct.unpack_from("<q", buf, 24)[0]
+                result = fn(epoch)
+                if struct.unpack_from("<Q", buf, SEQ_OFFSET)[0] == seq:
+                    return result
+            if attempt > 10:
+                time.sleep(0)
+        return None
+
+    def is_free(self, room_type, start, end):
+        """True/False по таблице; None — период вне окна или таблица недоступна."""
+        if not self._ensure() or room_type not in self.index:
+            return None
+        base = self.index[room_type] * self.days
+
+        def check(epoch):
+            first, last = start.toordinal() - epoch, end.toordinal() - epoch
+            if epoch != date.today().toordinal() or first < 0 or last >= self.days:
+                return None
+            return not any(self._counts[base + first:base + last + 1])
+
+        return self._read(check)
+
+    def busy_days(self, start, end):
+        """{тип: [занятые дни ISO]} за период или None."""
+        if not self._ensure():
+            return None
+
+        def collect(epoch):
+            first, last = start.toordinal() - epoch, end.toordinal() - epoch
+            if epoch != date.today().toordinal() or first < 0 or last >= self.days:
+                return None
+            busy = {}
+            for room_type, row in self.index.items():
+                counts = self._counts[row * self.days + first:row * self.days + last + 1]
+                busy[room_type] = [date.fromordinal(epoch + first + i).isoformat()
+                                   for i, count in enumerate(counts) if count]
+            return busy
+
+        return self._read(collect)
+
+    def close(self):
+        if self._shm is not None:
+            # Срез-представление держит буфер — без release() close() не пройдёт
+            self._counts.release()
+            self._shm.close()
+            self._shm = self._counts = None
+
+    __del__ = close
+
+    def unlink(self):
+        """Удаляет сегмент с хоста (для тестов и обслуживания)."""
+        if self._shm is None and not self._disabled:
+            self._attach()
+        if self._shm is not None:
+            # unlink() снимает регистрацию, снятую при подключении, — вернём её
+            resource_tracker.register(self._shm._name, "shared_memory")
+            self._shm.unlink()
+            self.close()
@@ -0,0 +1,117 @@
+import hashlib
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+# -----------------------
+# Кэш отрендеренных страниц
+# -----------------------
+# Страницы, которые не зависят от конкретного пользователя (главная для гостя,
+# формы входа и регистрации), рендерятся один раз и дальше отдаются готовыми
+# байтами. Ключ — (маршрут, вошёл ли пользователь).
+
+
+class CachedPage:
+    __slots__ = ("body", "etag", "last_modified", "mtime", "source")
+
+    def __init__(self, body: bytes, source=None):
+        self.body = body
+        self.etag = '"%s"' % hashlib.sha1(body).hexdigest()[:20]
+        # Last-Modified имеет точность до секунды — округляем сразу
+        self.mtime = int(time.time())
+        self.last_modified = formatdate(self.mtime, usegmt=True)
+        # Объект, по которому проверяется актуальность (например, шаблон Jinja)
+        self.source = source
+
+
+class PageCache:
+    def __init__(self):
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._pages.get(key)
+
+    def put(self, key, body, source=None) -> CachedPage:
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        cached = CachedPage(body, source)
+        with self._lock:
+            self._pages[key] = cached
+        return cached
+
+    def get_or_render(self, key, render, is_fresh=None) -> CachedPage:
+        """Возвращает страницу из кэша или рендерит её заново.
+
+        render() возвращает (тело, источник) — источник передаётся в
+        is_fresh(источник) при следующих обращениях.
+        """
+        cached = self._pages.get(key)
+        if cached is not None and is_fresh is not None and not is_fresh(cached.source):
+            # Шаблон перечитан с диска — старые байты больше не годятся
+            self.invalidate()
+            cached = None
+        if cached is None:
+            body, source = render()
+            cached = self.put(key, body, source)
+        return cached
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._pages.clear()
+            else:
+                self._pages.pop(key, None)
+
+
+def is_not_modified(cached: CachedPage, if_none_match, if_modified_since) -> bool:
+    """Условный GET: 304, если у клиента уже есть эта версия страницы."""
+    if if_none_match:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or cached.etag in tags or ("W/" + cached.etag) in tags
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return cached.mtime <= since
+    return False
+
+
+def cache_headers(cached: CachedPage):
+    return [
+        ("ETag", cached.etag),
+        ("Last-Modified", cached.last_modified),
+        # Страница зависит от cookie сессии, поэтому всегда перепроверяем
+        ("Cache-Control", "no-cache"),
+        ("Vary", "Cookie"),
+    ]
+
+
+# -----------------------
+# Связка с Flask
+# -----------------------
+
+def render_cached(cache: PageCache, key, template_name: str, **context):
+    """Аналог render_template, который отдаёт готовые байты с ETag и 304."""
+    from flask import current_app, request, make_response, render_template
+
+    env = current_app.jinja_env
+
+    def render():
+        return render_template(template_name, **context), env.get_template(template_name)
+
+    def is_fresh(template):
+        # Без auto_reload шаблоны не перечитываются — проверять нечего
+        return not env.auto_reload or template.is_up_to_date
+
+    cached = cache.get_or_render(key, render, is_fresh)
+    if is_not_modified(cached, request.headers.get("If-None-Match"),
+                       request.headers.get("If-Modified-Since")):
+        resp = make_response("", 304)
+    else:
+        resp = make_response(cached.body)
+        resp.headers["Content-Type"] = "text/html; charset=utf-8"
+    for name, value in cache_headers(cached):
+        resp.headers[name] = value
+    return resp
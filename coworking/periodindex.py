@@ -0,0 +1,136 @@
+import mmap
+import os
+import struct
+from datetime import datetime
+
+from coworking.changes import changes_after, last_seq
+
+# -----------------------
+# Индекс периодов на диске
+# -----------------------
+# Таблица занятости (coworking/occupancy.py) при запуске воркера строится
+# заново. Без индекса для этого нужен перебор Request со strptime каждой
+# строки — с большой историей перезапуск становится долгим.
+#
+# Файл <база>.periods рядом с базой хранит действующие заявки (конец не
+# раньше сегодня) записями фиксированной ширины: id заявки, порядковые
+# номера первого и последнего дня, код типа помещения. В заголовке — stamp,
+# номер последнего учтённого изменения журнала (coworking/changes.py).
+# При запуске файл отображается в память (mmap), читается одним
+# struct.iter_unpack и догоняется по журналу — читаются только изменения
+# после stamp. Закончившиеся заявки при перезаписи файла отбрасываются,
+# поэтому он остаётся маленьким при любой длине истории.
+#
+# Полный перебор Request нужен, только если файла нет, он повреждён или
+# относится к другой базе (stamp больше последнего номера журнала).
+# Блокировку и снимок базы обеспечивает вызывающий.
+
+MAGIC = b"CWPIDX1\0"
+HEADER = struct.Struct("<8sqII")     # magic, stamp, число записей, длина списка типов
+RECORD = struct.Struct("<qiiHxx")    # id заявки, первый день, последний день, код типа
+CATCH_UP_BATCH = 1000
+
+
+class PeriodIndex:
+    def __init__(self, path, period_end):
+        self.path = path
+        self.period_end = period_end
+        self.full_scans = 0
+        self.replayed = 0
+
+    # -- файл ----------------------------------------------------------
+
+    def _read(self):
+        """(записи {id: (тип, первый, последний)}, stamp) или None, если файла нет или он испорчен."""
+        try:
+            with open(self.path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < HEADER.size:
+                    return None
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    magic, stamp, count, types_len = HEADER.unpack_from(mm, 0)
+                    start = HEADER.size + types_len
+                    if magic != MAGIC or size != start + count * RECORD.size:
+                        return None
+                    types = mm[HEADER.size:start].decode("utf-8").split("\n") if types_len else []
+                    records = {}
+                    for row_id, first, last, code in RECORD.iter_unpack(mm[start:]):
+                        records[row_id] = (types[code], first, last)
+                    return records, stamp
+        except (OSError, ValueError, IndexError, UnicodeDecodeError):
+            return None
+
+    def _write(self, records, stamp):
+        types = sorted({room_type for room_type, _, _ in records.values()})
+        codes = {t: i for i, t in enumerate(types)}
+        blob = "\n".join(types).encode("utf-8")
+        body = b"".join(RECORD.pack(row_id, first, last, codes[room_type])
+                        for row_id, (room_type, first, last) in sorted(records.items()))
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, stamp, len(records), len(blob)))
+            f.write(blob)
+            f.write(body)
+        # Читатели видят либо старый файл, либо новый целиком
+        os.replace(tmp, self.path)
+
+    # -- построение ----------------------------------------------------
+
+    def _period(self, d_str, rent_type, duration):
+        start = datetime.strptime(d_str, "%Y-%m-%d").date()
+        return start.toordinal(), self.period_end(start, rent_type, int(duration)).toordinal()
+
+    def _scan(self, conn, since):
+        """Полный перебор Request — только при первом запуске или испорченном файле."""
+        self.full_scans += 1
+        records = {}
+        for row_id, room_type, d_str, rent_type, duration in conn.execute(
+                "SELECT id, RoomType, Date, RentType, Duration FROM Request"):
+            first, last = self._period(d_str, rent_type, duration)
+            if last >= since:
+                records[row_id] = (room_type, first, last)
+        return records
+
+    def _catch_up(self, conn, records, stamp, since):
+        """Применяет изменения журнала после stamp; возвращает число изменений."""
+        applied = 0
+        while True:
+            changes = changes_after(conn, stamp, CATCH_UP_BATCH)
+            for change in changes:
+                if change.table == "Request":
+                    if change.op == "delete":
+                        records.pop(change.row_id, None)
+                    else:
+                        row = change.data
+                        first, last = self._period(row["date"], row["rent_type"], row["duration"])
+                        if last >= since:
+                            records[change.row_id] = (row["room_type"], first, last)
+                stamp = change.seq
+            applied += len(changes)
+            if len(changes) < CATCH_UP_BATCH:
+                return applied
+
+    def load(self, conn, since):
+        """Действующие заявки [(тип, первый день, последний день)] с концом не раньше since.
+
+        since — порядковый номер дня. conn должен видеть один снимок базы
+        (открытая читающая транзакция), иначе журнал и файл разойдутся.
+        """
+        last = last_seq(conn)
+        loaded = self._read()
+        if loaded is None or loaded[1] > last:
+            records, changed = self._scan(conn, since), True
+        else:
+            records, stamp = loaded
+            before = len(records)
+            self.replayed += self._catch_up(conn, records, stamp, since)
+            # Закончившиеся заявки больше не влияют на доступность
+            for row_id in [r for r, (_, _, end) in records.items() if end < since]:
+                del records[row_id]
+            changed = stamp != last or len(records) != before
+        if changed:
+            try:
+                self._write(records, last)
+            except OSError as e:
+                print(f"[periods] Не удалось сохранить индекс периодов {self.path}: {e}")
+        return list(records.values())
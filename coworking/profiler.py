@@ -0,0 +1,172 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# -----------------------
+# Профилировщик по выборкам для работающего воркера
+# -----------------------
+# По запросу администратора на N секунд включается выборка стеков: каждые
+# interval секунд sys._current_frames() снимает стеки всех потоков воркера,
+# стек приписывается маршруту, который поток сейчас обслуживает (его
+# отмечают хуки before/teardown_request — словарь по id потока, почти
+# бесплатно). Выключенный профилировщик ничего не стоит: отдельного потока
+# нет, трассировка (sys.setprofile) не используется.
+#
+# Ограничения: не дольше MAX_SECONDS, не чаще MIN_INTERVAL, один сеанс на
+# воркер одновременно (ProfilerBusy), не больше MAX_DEPTH кадров на стек
+# и MAX_STACKS различных стеков. Выборка держит GIL и отнимает время у
+# запросов; если она занимает больше OVERHEAD_BUDGET от интервала, интервал
+# удваивается.
+#
+# Результат — «свёрнутые» стеки (формат flamegraph.pl, speedscope:
+# «маршрут;кадр;кадр число») или дерево для флейм-графа.
+
+MAX_SECONDS = 30
+MIN_INTERVAL = 0.005
+DEFAULT_INTERVAL = 0.01
+MAX_INTERVAL = 0.5
+MAX_DEPTH = 64
+MAX_STACKS = 20000
+OVERHEAD_BUDGET = 0.02
+OTHER = "[прочее]"       # стеки сверх MAX_STACKS
+TRUNCATED = "[…]"        # кадры глубже MAX_DEPTH
+
+
+class ProfilerBusy(Exception):
+    """На этом воркере уже идёт профилирование."""
+
+
+class Profile:
+    """Результат сеанса: {(маршрут, стек от корня): число выборок}."""
+
+    def __init__(self, interval):
+        self.samples = Counter()
+        self.interval = interval
+        self.started = time.time()
+        self.seconds = 0.0
+        self.ticks = 0           # сколько раз снимались стеки
+        self.overhead = 0.0      # доля времени сеанса, потраченная на выборку
+
+    @property
+    def total(self):
+        return sum(self.samples.values())
+
+    def collapsed(self):
+        """Свёрнутые стеки, по строке на стек, самые частые первыми.
+
+        Число выборок отделено последним пробелом — пробелы внутри кадров
+        инструменты (flamegraph.pl, speedscope) допускают.
+        """
+        lines = [";".join((route,) + stack) + f" {count}"
+                 for (route, stack), count in self.samples.most_common()]
+        return "\n".join(lines) + "\n"
+
+    def routes(self):
+        """[(маршрут, выборок)] по убыванию."""
+        counts = Counter()
+        for (route, _), count in self.samples.items():
+            counts[route] += count
+        return counts.most_common()
+
+    def tree(self, min_share=0.005):
+        """Дерево {name, value, children} для флейм-графа; узлы меньше min_share отбрасываются."""
+        root = {"name": "все", "value": 0, "children": {}}
+        for (route, stack), count in self.samples.items():
+            node = root
+            node["value"] += count
+            for name in (route,) + stack:
+                node = node["children"].setdefault(name, {"name": name, "value": 0, "children": {}})
+                node["value"] += count
+        limit = root["value"] * min_share
+
+        def prune(node):
+            children = [prune(c) for c in node["children"].values() if c["value"] >= limit]
+            children.sort(key=lambda c: -c["value"])
+            return {"name": node["name"], "value": node["value"], "children": children}
+
+        return prune(root)
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self._routes = {}       # {id потока: маршрут} — заполняют хуки запросов
+        self._labels = {}       # {code: подпись кадра}
+        self._lock = threading.Lock()
+
+    def enter(self, route):
+        self._routes[threading.get_ident()] = route
+
+    def leave(self):
+        self._routes.pop(threading.get_ident(), None)
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            path = code.co_filename
+            short = os.path.join(os.path.basename(os.path.dirname(path)), os.path.basename(path))
+            label = self._labels[code] = f"{code.co_qualname} ({short}:{code.co_firstlineno})"
+        return label
+
+    def _stack(self, frame):
+        stack = []
+        while frame is not None and len(stack) < MAX_DEPTH:
+            stack.append(self._label(frame.f_code))
+            frame = frame.f_back
+        if frame is not None:
+            stack.append(TRUNCATED)
+        stack.reverse()
+        return tuple(stack)
+
+    def _sample(self, profile, me, all_threads, names):
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            route = self._routes.get(ident)
+            if route is None:
+                if not all_threads:
+                    continue
+                route = f"[{names.get(ident, ident)}]"
+            key = (route, self._stack(frame))
+            if key not in profile.samples and len(profile.samples) >= MAX_STACKS:
+                key = (route, (OTHER,))
+            profile.samples[key] += 1
+
+    def run(self, seconds, interval=DEFAULT_INTERVAL, all_threads=False):
+        """Снимает выборки seconds секунд в текущем потоке и возвращает Profile.
+
+        all_threads — учитывать и фоновые потоки (запись, журнал, рассылки),
+        а не только обслуживающие запросы.
+        """
+        seconds = min(max(float(seconds), 0.1), MAX_SECONDS)
+        interval = min(max(float(interval), MIN_INTERVAL), MAX_INTERVAL)
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("профилирование на этом воркере уже идёт")
+        try:
+            profile = Profile(interval)
+            me = threading.get_ident()
+            started = time.monotonic()
+            deadline = started + seconds
+            spent_total = 0.0
+            while time.monotonic() < deadline:
+                t0 = time.perf_counter()
+                names = {t.ident: t.name for t in threading.enumerate()} if all_threads else {}
+                self._sample(profile, me, all_threads, names)
+                spent = time.perf_counter() - t0
+                spent_total += spent
+                profile.ticks += 1
+                if spent > interval * OVERHEAD_BUDGET and interval < MAX_INTERVAL:
+                    interval = min(interval * 2, MAX_INTERVAL)
+                time.sleep(max(0.0, min(interval, deadline - time.monotonic())))
+            profile.seconds = time.monotonic() - started
+            profile.interval = interval
+            profile.overhead = spent_total / profile.seconds if profile.seconds else 0.0
+            return profile
+        finally:
+            self._lock.release()
+
+
+# Один на процесс: выборка видит все потоки процесса, в том числе запросы
+# других площадок, смонтированных в то же приложение
+profiler = SamplingProfiler()
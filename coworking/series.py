@@ -0,0 +1,184 @@
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from coworking.db import connect
+from coworking.engine import OWN, TAKEN, BookingEngine, Storage
+
+# -----------------------
+# Повторяющиеся брони
+# -----------------------
+# Серия («переговорная каждый вторник») хранится одной строкой Series.
+# Повторения разворачиваются лениво: при создании — только в пределах окна
+# бронирования, остальные — по мере того как окно сдвигается (при открытии
+# «Моих заявок» владельцем серии).
+#
+# Все повторения проверяются за один проход: занятые периоды типа помещения
+# читаются одним запросом в отсортированный BusyIndex, и каждое повторение
+# проверяется BookingEngine.conflict поверх него — пересекающиеся периоды
+# находятся бинарным поиском. Подходящие повторения вставляются одной
+# транзакцией, для остальных возвращается причина конфликта.
+#
+# period_end(start, rent_type, duration) передаёт приложение — правило
+# окончания периода у него своё.
+
+DAILY = "daily"
+WEEKLY = "weekly"
+STEP_DAYS = {DAILY: 1, WEEKLY: 7}
+FREQ_LABELS = {DAILY: "Каждый день", WEEKLY: "Каждую неделю"}
+
+# Причины, по которым повторение не забронировано (TAKEN и OWN — из ядра)
+SERIES = "series"
+CONFLICT_LABELS = {
+    TAKEN: "Занято другим пользователем",
+    OWN: "У вас уже есть бронь на эти даты",
+    SERIES: "Пересекается с предыдущим повторением серии",
+}
+
+Occurrence = namedtuple("Occurrence", "start end conflict")
+
+
+def occurrences(first, freq, until=None, count=None, start_index=0, through=None):
+    """Лениво перечисляет (номер, дата) повторений начиная с номера start_index.
+
+    Останавливается на until (включительно), count повторениях или дате through.
+    """
+    step = timedelta(days=STEP_DAYS[freq])
+    n = start_index
+    day = first + step * n
+    while (count is None or n < count) and (until is None or day <= until) \
+            and (through is None or day <= through):
+        yield n, day
+        n += 1
+        day += step
+
+
+class BusyIndex(Storage):
+    """Занятые периоды одного типа помещения, отсортированные по началу.
+
+    Хранилище для BookingEngine только для чтения: пересекающие период
+    заявки находятся бинарным поиском, а не перебором.
+    """
+
+    def __init__(self, periods):
+        periods = sorted(periods)
+        self.starts = [p[0] for p in periods]
+        self.ends = [p[1] for p in periods]
+        self.users = [p[2] for p in periods]
+        # Наибольший конец среди периодов, начавшихся не позже i-го
+        self.max_ends = []
+        for end in self.ends:
+            self.max_ends.append(max(end, self.max_ends[-1]) if self.max_ends else end)
+
+    @classmethod
+    def load(cls, conn, room_type, last_day, period_end):
+        rows = conn.execute(
+            "SELECT Date, RentType, Duration, id_users FROM Request WHERE RoomType=? AND Date<=?",
+            (room_type, last_day.isoformat())
+        ).fetchall()
+        periods = []
+        for d_str, rent_type, duration, user_id in rows:
+            start = datetime.strptime(d_str, "%Y-%m-%d").date()
+            periods.append((start, period_end(start, rent_type, int(duration)), user_id))
+        return cls(periods)
+
+    def units(self, room_type):
+        return [None]
+
+    def bookings(self, room_type, start, end):
+        # Идём влево от последнего начавшегося до end периода, пока среди
+        # оставшихся есть заканчивающиеся не раньше start
+        i = bisect_right(self.starts, end) - 1
+        while i >= 0 and self.max_ends[i] >= start:
+            if self.ends[i] >= start:
+                yield None, self.starts[i], self.ends[i], self.users[i]
+            i -= 1
+
+
+def plan(conn, room_type, dates, rent_type, duration, user_id, period_end):
+    """Проверяет даты повторений за один проход; возвращает список Occurrence."""
+    dates = list(dates)
+    if not dates:
+        return []
+    engine = BookingEngine(BusyIndex.load(conn, room_type, period_end(dates[-1], rent_type, duration), period_end))
+    report = []
+    prev_end = None
+    for day in dates:
+        end = period_end(day, rent_type, duration)
+        conflict = engine.conflict(room_type, day, end, user_id)
+        if conflict is None and prev_end is not None and day <= prev_end:
+            conflict = SERIES
+        if conflict is None:
+            prev_end = end
+        report.append(Occurrence(day, end, conflict))
+    return report
+
+
+def _insert_accepted(conn, series_id, user_id, room_type, rent_type, duration, report):
+    conn.executemany("""
+        INSERT INTO Request (RoomType, Date, RentType, Duration, id_users, id_series)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [(room_type, o.start.isoformat(), rent_type, duration, user_id, series_id)
+          for o in report if o.conflict is None])
+
+
+def create_series(conn, user_id, room_type, first, freq, until, count, rent_type, duration,
+                  period_end, window_end):
+    """Создаёт серию и бронирует подходящие повторения внутри окна.
+
+    Выполняется внутри транзакции записи. Возвращает (id серии или None,
+    если не подошло ни одно повторение; отчёт по повторениям).
+    """
+    dates = [day for _, day in occurrences(first, freq, until, count, through=window_end)]
+    report = plan(conn, room_type, dates, rent_type, duration, user_id, period_end)
+    if not any(o.conflict is None for o in report):
+        return None, report
+    series_id = conn.execute("""
+        INSERT INTO Series (id_users, RoomType, FirstDate, Freq, UntilDate, Count,
+                            RentType, Duration, ExpandedThrough, Generated)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (user_id, room_type, first.isoformat(), freq, until.isoformat() if until else None, count,
+          rent_type, duration, window_end.isoformat(), len(dates))).lastrowid
+    _insert_accepted(conn, series_id, user_id, room_type, rent_type, duration, report)
+    return series_id, report
+
+
+def _due_query(user_id, window_end):
+    return """
+        SELECT id, RoomType, FirstDate, Freq, UntilDate, Count, RentType, Duration, Generated
+        FROM Series
+        WHERE id_users=? AND ExpandedThrough < ?
+          AND (Count IS NULL OR Generated < Count)
+          AND (UntilDate IS NULL OR UntilDate > ExpandedThrough)
+    """, (user_id, window_end.isoformat())
+
+
+def has_due_series(db_name, user_id, window_end):
+    """Есть ли у пользователя серии, которые пора развернуть дальше (только чтение)."""
+    sql, params = _due_query(user_id, window_end)
+    conn = connect(db_name)
+    try:
+        return conn.execute(sql + " LIMIT 1", params).fetchone() is not None
+    finally:
+        conn.close()
+
+
+def expand_due(conn, user_id, window_end, period_end, today=None):
+    """Бронирует повторения, вошедшие в окно с прошлого разворачивания.
+
+    Занятые к этому моменту и уже прошедшие повторения пропускаются.
+    Возвращает число новых заявок.
+    """
+    today = today or date.today()
+    sql, params = _due_query(user_id, window_end)
+    added = 0
+    for series_id, room_type, first, freq, until, count, rent_type, duration, generated in conn.execute(sql, params).fetchall():
+        first = datetime.strptime(first, "%Y-%m-%d").date()
+        until = datetime.strptime(until, "%Y-%m-%d").date() if until else None
+        dates = [day for _, day in occurrences(first, freq, until, count, start_index=generated, through=window_end)]
+        report = plan(conn, room_type, [d for d in dates if d >= today], rent_type, duration, user_id, period_end)
+        _insert_accepted(conn, series_id, user_id, room_type, rent_type, duration, report)
+        conn.execute("UPDATE Series SET ExpandedThrough=?, Generated=? WHERE id=?",
+                     (window_end.isoformat(), generated + len(dates), series_id))
+        added += sum(1 for o in report if o.conflict is None)
+    return added
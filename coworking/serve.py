@@ -0,0 +1,86 @@
+"""Боевой запуск Flask-приложений коворкинга под gunicorn.
+
+    python site.py --workers 4
+    COWORKING_THREADS=64 python site.py
+    python trpo/site.py --max-requests 1000
+    gunicorn -c gunicorn.conf.py "coworking.serve:load_app('site.py')"
+    gunicorn -c gunicorn.conf.py "coworking.serve:load_app('trpo/site.py:create_app_from_env')"
+
+`python site.py` запускает gunicorn с настройками из gunicorn.conf.py в корне
+репозитория; остальные аргументы командной строки передаются gunicorn как
+есть. Приложение загружается один раз в главном процессе (preload), воркеры
+обслуживают запросы пулом потоков (gthread).
+
+Сигналы главному процессу — обычные для gunicorn:
+    SIGTERM  — плавная остановка: воркеры дорабатывают текущие запросы;
+    SIGHUP   — плавный перезапуск воркеров; с preload код приложения при
+               этом не перечитывается — для нового кода нужен перезапуск
+               главного процесса;
+    SIGTTIN / SIGTTOU — добавить / убрать воркер.
+
+Число потоков воркера задаётся COWORKING_THREADS (а не --threads): от него
+же зависит, сколько лент событий (/availability/stream) держит воркер —
+каждая открытая вкладка занимает поток до STREAM_TTL, а FEED_RESERVED_THREADS
+потоков остаются обычным запросам. Сверх лимита лента отвечает 503.
+
+--debug включает встроенный сервер Flask с отладчиком и перезагрузкой — только
+для разработки, по умолчанию выключено.
+"""
+import importlib.util
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_PATH = os.path.join(BASE_DIR, "gunicorn.conf.py")
+DEFAULT_HOST = "localhost"
+DEFAULT_PORT = 8000
+DEFAULT_THREADS = 32          # потоков воркера gunicorn и пула ASGI (coworking/asgi.py)
+FEED_RESERVED_THREADS = 4     # потоков, которые ленты событий не занимают
+
+
+def worker_threads():
+    return int(os.environ.get("COWORKING_THREADS", DEFAULT_THREADS))
+
+
+def feed_subscriber_limit():
+    """Сколько лент событий одновременно держит воркер (по умолчанию FEED_MAX_SUBSCRIBERS)."""
+    return max(1, worker_threads() - FEED_RESERVED_THREADS)
+
+
+def load_module(path):
+    """Импортирует файл приложения по пути (относительный — от корня репозитория).
+
+    Модули называются site.py, поэтому обычный import вернул бы
+    стандартный модуль site — грузим по пути под своим именем.
+    """
+    path = os.path.join(BASE_DIR, path)
+    name = "coworking_app_" + os.path.splitext(os.path.relpath(path, BASE_DIR))[0].replace(os.sep, "_").replace(".", "_")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_app(spec):
+    """Создаёт приложение по "путь[:фабрика]", например trpo/site.py:create_app_from_env.
+
+    Модули приложений экземпляр при импорте не создают — его создаёт
+    фабрика (по умолчанию create_app). Это же — фабрика для gunicorn.
+    """
+    path, _, factory = spec.partition(":")
+    return getattr(load_module(path), factory or "create_app")()
+
+
+def main(spec, argv=None):
+    """Точка входа `python site.py`: gunicorn с gunicorn.conf.py или --debug."""
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if "--debug" in argv:
+        host = os.environ.get("COWORKING_HOST", DEFAULT_HOST)
+        port = int(os.environ.get("COWORKING_PORT", DEFAULT_PORT))
+        load_app(spec).run(host=host, port=port, debug=True)
+        return
+    from gunicorn.app.wsgiapp import run
+
+    sys.argv = ["gunicorn", "--config", CONFIG_PATH, *argv, f"coworking.serve:load_app({spec!r})"]
+    run()
@@ -0,0 +1,80 @@
+import json
+import time
+
+from coworking.db import connect
+
+# -----------------------
+# Сессии в SQLite
+# -----------------------
+# Словарь sessions в памяти виден только одному процессу: при нескольких
+# воркерах пользователь, вошедший через один из них, для остальных оставался
+# бы гостем. SessionStore хранит сессии в той же базе и повторяет интерфейс
+# словаря, которым пользовались приложения. Таблица создаётся миграцией
+# в coworking/db.py.
+#
+# Сессия живёт TTL секунд с момента входа: истёкшая при чтении не находится,
+# а строки удаляются фоновой задачей (coworking/jobs.py) не чаще раза в
+# PURGE_INTERVAL — без неё таблица росла бы с каждым входом.
+
+TTL = 14 * 24 * 3600
+PURGE_INTERVAL = 3600
+
+
+class SessionStore:
+    def __init__(self, db_name, ttl=TTL, jobs=None, purge_interval=PURGE_INTERVAL):
+        self.db_name = db_name
+        self.ttl = ttl
+        self.jobs = jobs
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+
+    def _connect(self):
+        return connect(self.db_name, timeout=10)
+
+    def get(self, session_id, default=None):
+        now = time.time()
+        self._schedule_purge(now)
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT data FROM Sessions WHERE id=? AND expires > ?", (session_id, now)).fetchone()
+        finally:
+            conn.close()
+        return json.loads(row[0]) if row else default
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+    def __setitem__(self, session_id, value):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO Sessions (id, data, expires) VALUES (?, ?, ?)",
+                             (session_id, json.dumps(value, ensure_ascii=False), time.time() + self.ttl))
+        finally:
+            conn.close()
+
+    def __delitem__(self, session_id):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM Sessions WHERE id=?", (session_id,))
+        finally:
+            conn.close()
+
+    def purge(self, now=None):
+        """Удаляет истёкшие сессии; возвращает, сколько удалено."""
+        conn = self._connect()
+        try:
+            with conn:
+                cur = conn.execute("DELETE FROM Sessions WHERE expires IS NULL OR expires <= ?",
+                                   (time.time() if now is None else now,))
+            return cur.rowcount
+        finally:
+            conn.close()
+
+    def _schedule_purge(self, now):
+        # Ключ задачи — номер интервала: в каждом интервале очистка запускается один раз
+        if self.jobs is None or now < self._next_purge:
+            return
+        self._next_purge = now + self.purge_interval
+        self.jobs.submit(("purge_sessions", int(now // self.purge_interval)), lambda job: self.purge())
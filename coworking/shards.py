@@ -0,0 +1,80 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# -----------------------
+# Несколько площадок в одном приложении
+# -----------------------
+# У каждой площадки коворкинга свой файл SQLite. ShardRouter сопоставляет
+# ключ площадки (часть URL: /center/..., /north/...) с её базой. Приложение
+# создаёт на каждую площадку отдельный экземпляр со своими сессиями,
+# кэшами, очередью записи и отчётов — нагрузка на одной базе не держит
+# блокировки и очереди другой.
+#
+# Сводные отчёты опрашивают площадки параллельно в общем пуле потоков
+# (fan_out) и сливают результаты; ошибка одной площадки не роняет отчёт.
+
+SITE_KEY = re.compile(r"^[a-z0-9][a-z0-9_-]*$")
+
+
+def parse_sites(value):
+    """Разбирает "center=/data/center.db,north=/data/north.db" в {ключ: путь к БД}."""
+    sites = {}
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        key, sep, db_name = item.partition("=")
+        key = key.strip().lower()
+        if not sep or not db_name.strip() or not SITE_KEY.match(key):
+            raise ValueError(f"Некорректная площадка: {item!r} (ожидается ключ=путь_к_БД)")
+        if key in sites:
+            raise ValueError(f"Площадка {key} указана дважды")
+        sites[key] = db_name.strip()
+    return sites
+
+
+class ShardRouter:
+    """Ключ площадки -> база данных; параллельный опрос всех площадок."""
+
+    def __init__(self, sites, titles=None, max_workers=None):
+        if not sites:
+            raise ValueError("Нужна хотя бы одна площадка")
+        self.sites = dict(sites)
+        self.titles = dict(titles or {})
+        self.max_workers = max_workers or min(len(self.sites), 8)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def keys(self):
+        return list(self.sites)
+
+    def db_name(self, key):
+        """Путь к базе площадки; KeyError — такой площадки нет."""
+        return self.sites[key]
+
+    def title(self, key):
+        return self.titles.get(key, key)
+
+    def _executor(self):
+        # Пул создаётся при первом отчёте — уже в воркере, а не до fork
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="shard")
+            return self._pool
+
+    def fan_out(self, fn, *args):
+        """Вызывает fn(db_name, *args) на каждой площадке параллельно.
+
+        Возвращает (результаты, ошибки) — словари по ключу площадки,
+        в порядке площадок.
+        """
+        pool = self._executor()
+        futures = {key: pool.submit(fn, db_name, *args) for key, db_name in self.sites.items()}
+        results, errors = {}, {}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                errors[key] = str(e)
+        return results, errors
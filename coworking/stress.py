@@ -0,0 +1,380 @@
+"""Нагрузочная проверка бронирования при конкурентных запросах.
+
+    python -m coworking.stress
+    python -m coworking.stress site.py --levels 1,8,64,256 --requests 500
+    python -m coworking.stress --url http://localhost:8000 --db coworking.db
+
+Сотни одновременных POST /book на одну и ту же комнату и день от разных
+пользователей. На каждом уровне конкурентности (--levels — число потоков
+клиента) берётся новый день; после серии проверяются инварианты:
+
+    * заявки на одну единицу помещения не пересекаются;
+    * каждая подтверждённая бронь есть в хранилище и нет заявок без
+      подтверждения (ничего не потеряно и не задвоено);
+    * если все запросы дошли до приложения, принято ровно столько броней,
+      сколько единиц помещения (свободную комнату кто-то получил).
+
+Для каждого уровня печатаются пропускная способность, задержки, число
+принятых, отказов, 503 от перегруженного сервера и ошибок, а для
+Flask-приложений — время ожидания блокировки записи SQLite в потоке записи.
+
+Файлы приложений (site.py, trpo/site.py, trpo.py) запускаются в этом же
+процессе на свободном порту с временной базой: Flask — на многопоточном
+wsgiref-сервере, trpo.py — на ThreadingHTTPServer. Боевой сервер (gunicorn с
+несколькими воркерами) проверяется через --url; для проверки инвариантов ему
+нужна --db — путь к его базе (только тестовой: инструмент создаёт
+пользователей и заявки).
+
+Код возврата 1 — нарушен инвариант.
+"""
+import argparse
+import http.client
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, namedtuple
+from datetime import date, datetime, timedelta
+from http.server import ThreadingHTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlencode, urlsplit
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+from coworking import db
+from coworking.engine import BOOKING_WINDOW_DAYS, period_end
+from coworking.serve import load_module
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TARGETS = ["site.py", "trpo/site.py", "trpo.py"]
+PASSWORD = "stress-pass"
+ACCEPTED_MARK = "Заявка принята".encode("utf-8")   # trpo.py отвечает страницей, а не редиректом
+MAX_VIOLATIONS = 5
+
+# Исходы запроса
+ACCEPTED = "accepted"
+REFUSED = "refused"
+BUSY = "busy"       # 503 — сервер отказал до приложения
+ERROR = "error"
+
+Result = namedtuple("Result", "outcome seconds")
+Period = namedtuple("Period", "id unit start end")
+
+
+def request(base, method, path, fields=None, cookie=None, timeout=60):
+    """(статус, значения Set-Cookie, тело) — без перехода по редиректам."""
+    parts = urlsplit(base)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+    headers = {}
+    body = None
+    if fields is not None:
+        body = urlencode(fields)
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+    if cookie:
+        headers["Cookie"] = cookie
+    try:
+        conn.request(method, parts.path.rstrip("/") + path, body, headers)
+        resp = conn.getresponse()
+        return resp.status, resp.msg.get_all("Set-Cookie") or [], resp.read()
+    finally:
+        conn.close()
+
+
+def sign_up(base, login):
+    """Регистрирует пользователя и возвращает cookie его сессии."""
+    request(base, "POST", "/register", {"username": login, "password": PASSWORD})
+    status, cookies, _ = request(base, "POST", "/login", {"username": login, "password": PASSWORD})
+    for cookie in cookies:
+        pair = cookie.split(";")[0].strip()
+        if pair.startswith("session=") and pair != "session=":
+            return pair
+    raise RuntimeError(f"не удалось войти как {login} (HTTP {status})")
+
+
+def classify(status, body):
+    if status == 302 or (status == 200 and ACCEPTED_MARK in body):
+        return ACCEPTED
+    if status == 200:
+        return REFUSED
+    if status == 503:
+        return BUSY
+    return ERROR
+
+
+# -----------------------
+# Цели
+# -----------------------
+
+class Target:
+    """Сервер под нагрузкой и доступ к его хранилищу для проверки."""
+
+    name = ""
+    url = ""
+
+    def units(self, room_type):
+        """Число единиц помещения или None, если неизвестно."""
+        return None
+
+    def periods(self, room_type):
+        """[Period] действующих заявок типа или None — проверить нечем."""
+        return None
+
+    def lock_wait(self):
+        """Секунд ожидания блокировки записи с запуска или None."""
+        return None
+
+    def close(self):
+        pass
+
+
+class StressWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class QuietWSGIHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class FlaskTarget(Target):
+    """Flask-приложение в этом процессе на многопоточном сервере, временная база."""
+
+    def __init__(self, path):
+        self.name = os.path.relpath(path, BASE_DIR)
+        self.dir = tempfile.mkdtemp(prefix="coworking-stress-")
+        self.db_name = os.path.join(self.dir, "stress.db")
+        self.app = load_module(path).create_app(self.db_name)
+        self.server = StressWSGIServer(("localhost", 0), QuietWSGIHandler)
+        self.server.set_app(self.app)
+        self.url = f"http://localhost:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.1}, daemon=True)
+        self.thread.start()
+
+    def units(self, room_type):
+        return 1
+
+    def periods(self, room_type):
+        return sqlite_periods(self.db_name, room_type)
+
+    def lock_wait(self):
+        return self.app.extensions["writer"].lock_wait
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        occupancy = self.app.extensions.get("occupancy")
+        if occupancy is not None:
+            occupancy.unlink()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class StressHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Очередь listen() по умолчанию — 5 соединений: остальные клиенты ждут
+    # повтора SYN секунду и мерилась бы сеть, а не бронирование
+    request_queue_size = 1024
+
+
+class MemoryTarget(Target):
+    """trpo.py в этом процессе на ThreadingHTTPServer; заявки читаются из его памяти."""
+
+    def __init__(self, path):
+        self.name = os.path.relpath(path, BASE_DIR)
+        self.module = load_module(path)
+
+        class QuietHandler(self.module.Handler):
+            def log_message(self, format, *args):
+                pass
+
+        self.server = StressHTTPServer(("localhost", 0), QuietHandler)
+        self.url = f"http://localhost:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.1}, daemon=True)
+        self.thread.start()
+
+    def units(self, room_type):
+        return len(self.module.storage.units(room_type))
+
+    def periods(self, room_type):
+        storage = self.module.storage
+        with self.module.lock:
+            return [Period(b["id"], b["room_id"], b["start_date"], b["end_date"])
+                    for b in storage.bookings_list
+                    if b["status"] == "accepted" and storage.room_type(b["room_id"]) == room_type]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class RemoteTarget(Target):
+    """Уже запущенный сервер; заявки проверяются по его базе, если она указана."""
+
+    def __init__(self, url, db_name=None, units=1):
+        self.name = self.url = url.rstrip("/")
+        self.db_name = db_name
+        self._units = units
+
+    def units(self, room_type):
+        return self._units
+
+    def periods(self, room_type):
+        return sqlite_periods(self.db_name, room_type) if self.db_name else None
+
+
+def sqlite_periods(db_name, room_type):
+    conn = db.connect_readonly(db_name)
+    try:
+        rows = conn.execute(
+            "SELECT id, Date, RentType, Duration FROM Request WHERE RoomType=?", (room_type,)
+        ).fetchall()
+    finally:
+        conn.close()
+    result = []
+    for row_id, d_str, rent_type, duration in rows:
+        start = datetime.strptime(d_str, "%Y-%m-%d").date()
+        # В SQLite тип помещения — одна единица
+        result.append(Period(row_id, None, start, period_end(start, rent_type, int(duration))))
+    return result
+
+
+def make_target(path):
+    path = os.path.join(BASE_DIR, path) if not os.path.isabs(path) else path
+    if os.path.basename(path) == "trpo.py":
+        return MemoryTarget(path)
+    return FlaskTarget(path)
+
+
+# -----------------------
+# Нагрузка и проверка
+# -----------------------
+
+def hammer(base, cookies, fields, level, total):
+    """total запросов /book из level потоков, стартующих одновременно."""
+    results = []
+    counter = iter(range(total))
+    counter_lock = threading.Lock()
+    barrier = threading.Barrier(level)
+
+    def worker():
+        barrier.wait()
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            started = time.perf_counter()
+            try:
+                status, _, body = request(base, "POST", "/book", fields, cookies[i % len(cookies)])
+                outcome = classify(status, body)
+            except OSError:
+                outcome = ERROR
+            results.append(Result(outcome, time.perf_counter() - started))
+
+    threads = [threading.Thread(target=worker) for _ in range(level)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def check(target, room_type, day, counts, users):
+    """Список нарушений инвариантов для серии броней на day."""
+    periods = target.periods(room_type)
+    if periods is None:
+        return None
+    violations = []
+    by_unit = {}
+    for period in periods:
+        by_unit.setdefault(period.unit, []).append(period)
+    for unit_periods in by_unit.values():
+        unit_periods.sort(key=lambda p: p.start)
+        for a, b in zip(unit_periods, unit_periods[1:]):
+            if b.start <= a.end:
+                violations.append(f"заявки #{a.id} и #{b.id} пересекаются на одной единице")
+    stored = sum(1 for p in periods if p.start == day)
+    if stored < counts[ACCEPTED]:
+        violations.append(f"потеряно подтверждённых броней: {counts[ACCEPTED] - stored}")
+    elif stored > counts[ACCEPTED]:
+        violations.append(f"заявок без подтверждения: {stored - counts[ACCEPTED]}")
+    units = target.units(room_type)
+    if units is not None and not counts[BUSY] and not counts[ERROR] and counts[ACCEPTED] != min(units, users):
+        violations.append(f"принято {counts[ACCEPTED]} броней при {units} единицах помещения")
+    return violations
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def run_target(target, levels, total, room_type):
+    print(f"[{target.name}] {target.url}: {room_type}, {total} запросов на уровень, "
+          f"единиц: {target.units(room_type) or '?'}")
+    run = uuid.uuid4().hex[:6]
+    cookies = [sign_up(target.url, f"stress{run}_{i}") for i in range(max(levels))]
+    print(f"  {'потоков':>8} {'зап/с':>8} {'p50 мс':>8} {'p95 мс':>8} {'max мс':>8} "
+          f"{'принято':>8} {'отказ':>6} {'503':>5} {'ошибок':>7} {'ожид. блок., мс':>16}")
+    failed = False
+    for n, level in enumerate(levels):
+        day = date.today() + timedelta(days=n + 1)
+        fields = {"room_type": room_type, "start_date": day.isoformat(),
+                  "duration_unit": "days", "duration_value": "1"}
+        waited = target.lock_wait()
+        results, seconds = hammer(target.url, cookies[:level], fields, level, total)
+        counts = Counter(r.outcome for r in results)
+        latencies = [r.seconds * 1000 for r in results]
+        lock_wait = "—" if waited is None else f"{(target.lock_wait() - waited) * 1000:.1f}"
+        print(f"  {level:>8} {len(results) / seconds:>8.0f} {percentile(latencies, 0.5):>8.1f} "
+              f"{percentile(latencies, 0.95):>8.1f} {max(latencies):>8.1f} {counts[ACCEPTED]:>8} "
+              f"{counts[REFUSED]:>6} {counts[BUSY]:>5} {counts[ERROR]:>7} {lock_wait:>16}")
+        violations = check(target, room_type, day, counts, min(level, total))
+        if violations is None:
+            print("           инварианты не проверены: нет доступа к хранилищу (--db)")
+            continue
+        for violation in violations[:MAX_VIOLATIONS]:
+            print(f"           НАРУШЕНИЕ: {violation}")
+        failed = failed or bool(violations)
+    return failed
+
+
+def parse_levels(value):
+    levels = [int(x) for x in value.split(",") if x.strip()]
+    if not levels or min(levels) < 1:
+        raise argparse.ArgumentTypeError("ожидается список положительных чисел через запятую")
+    if len(levels) > BOOKING_WINDOW_DAYS:
+        raise argparse.ArgumentTypeError(f"не больше {BOOKING_WINDOW_DAYS} уровней — по дню окна на каждый")
+    return levels
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочная проверка бронирования")
+    parser.add_argument("targets", nargs="*", help=f"файлы приложений (по умолчанию {', '.join(DEFAULT_TARGETS)})")
+    parser.add_argument("--url", help="адрес уже запущенного сервера вместо файлов")
+    parser.add_argument("--db", help="база запущенного сервера — для проверки инвариантов")
+    parser.add_argument("--units", type=int, default=1, help="единиц помещения у запущенного сервера")
+    parser.add_argument("--levels", type=parse_levels, default=[1, 8, 32, 128],
+                        help="числа одновременных клиентов через запятую")
+    parser.add_argument("--requests", type=int, default=200, help="запросов на уровень")
+    parser.add_argument("--room-type", default="meeting_room")
+    args = parser.parse_args(argv)
+
+    failed = False
+    if args.url:
+        failed = run_target(RemoteTarget(args.url, args.db, args.units), args.levels, args.requests, args.room_type)
+    else:
+        for path in args.targets or DEFAULT_TARGETS:
+            target = make_target(path)
+            try:
+                failed = run_target(target, args.levels, args.requests, args.room_type) or failed
+            finally:
+                target.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
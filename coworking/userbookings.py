@@ -0,0 +1,107 @@
+from datetime import date
+
+from coworking.db import connect
+
+# -----------------------
+# Постраничный список «Мои заявки»
+# -----------------------
+# Заявки пользователя делятся на предстоящие (ещё не закончились: последний
+# день брони сегодня или позже — сюда попадает и идущая многодневная бронь)
+# и прошедшие. Каждая секция листается курсором по (Date, id), поэтому
+# запрос не зависит от длины истории и читает ровно одну страницу.
+# Запрос идёт по индексу idx_request_user_date (см. coworking/db.py);
+# предстоящие начинаются не раньше, чем сегодня минус самая длинная дневная
+# бронь (её длина берётся по idx_request_rent_duration).
+
+PAGE_SIZE = 20
+
+UPCOMING = "upcoming"
+PAST = "past"
+
+# Последний день брони, как engine.period_end
+END_SQL = "CASE WHEN RentType = 'days' THEN date(Date, '+' || (Duration - 1) || ' days') ELSE Date END"
+EARLIEST_RUNNING_SQL = ("date(?, '-' || (SELECT IFNULL(MAX(Duration), 1) - 1 FROM Request "
+                        "WHERE RentType = 'days') || ' days')")
+
+
+def parse_cursor(value):
+    """Курсор вида 'YYYY-MM-DD:id' -> (date_str, id) или None."""
+    if not value:
+        return None
+    d_str, _, id_str = value.partition(":")
+    try:
+        date.fromisoformat(d_str)
+        return d_str, int(id_str)
+    except ValueError:
+        return None
+
+
+def format_cursor(row):
+    return f"{row[2]}:{row[0]}"
+
+
+def cursor_value(cursor):
+    """Обратное parse_cursor: (date_str, id) -> 'YYYY-MM-DD:id'."""
+    return f"{cursor[0]}:{cursor[1]}" if cursor else None
+
+
+class BookingsPage:
+    """Одна страница заявок секции; строки читаются из БД по мере итерации.
+
+    Строки имеют вид (id, RoomType, Date, RentType, Duration). После того как
+    шаблон прошёл по странице, next_cursor указывает на следующую страницу
+    (или None, если это последняя); position — курсор текущей страницы,
+    чтобы ссылки другой секции его сохраняли.
+    """
+
+    def __init__(self, db_name, user_id, section, cursor=None, limit=PAGE_SIZE, today=None):
+        self.db_name = db_name
+        self.user_id = user_id
+        self.section = section
+        self.cursor = cursor
+        self.limit = limit
+        self.today = (today or date.today()).isoformat()
+        self.count = 0
+        self.next_cursor = None
+
+    @property
+    def position(self):
+        return cursor_value(self.cursor)
+
+    def _query(self):
+        if self.section == UPCOMING:
+            sql = ("SELECT id, RoomType, Date, RentType, Duration FROM Request "
+                   f"WHERE id_users=? AND Date >= {EARLIEST_RUNNING_SQL} AND {END_SQL} >= ?")
+            params = [self.user_id, self.today, self.today]
+            if self.cursor:
+                sql += " AND (Date, id) > (?, ?)"
+                params += list(self.cursor)
+            sql += " ORDER BY Date, id LIMIT ?"
+        else:
+            sql = ("SELECT id, RoomType, Date, RentType, Duration FROM Request "
+                   f"WHERE id_users=? AND Date < ? AND {END_SQL} < ?")
+            params = [self.user_id, self.today, self.today]
+            if self.cursor:
+                sql += " AND (Date, id) < (?, ?)"
+                params += list(self.cursor)
+            sql += " ORDER BY Date DESC, id DESC LIMIT ?"
+        # Берём на одну строку больше, чтобы узнать, есть ли следующая страница
+        params.append(self.limit + 1)
+        return sql, params
+
+    def __iter__(self):
+        self.count = 0
+        self.next_cursor = None
+        sql, params = self._query()
+        conn = connect(self.db_name)
+        try:
+            last = None
+            for row in conn.execute(sql, params):
+                if self.count == self.limit:
+                    self.next_cursor = format_cursor(last)
+                    break
+                self.count += 1
+                last = row
+                yield row
+        finally:
+            conn.close()
@@ -0,0 +1,142 @@
+import queue
+import threading
+from datetime import date
+
+from coworking.db import connect
+
+# -----------------------
+# Отмена брони и лист ожидания
+# -----------------------
+# Отмена удаляет строку Request по первичному ключу: индексы SQLite
+# обновляются за O(log n), а триггер дописывает отмену в журнал изменений —
+# по нему лента доступности узнаёт об освободившихся днях.
+#
+# Кто не успел забронировать, встаёт в лист ожидания на (тип помещения,
+# дата начала). Продвижением занимается фоновый PromotionWorker, а не запрос
+# отмены: по сигналу «освободился тип помещения до такой-то даты» он
+# в транзакции записи проходит ожидающих в порядке очереди и бронирует
+# каждому, чей период теперь свободен. Повторная проверка внутри транзакции
+# не даёт двум воркерам отдать одно место дважды.
+
+WAITING = "waiting"
+PROMOTED = "promoted"
+EXPIRED = "expired"
+CANCELLED = "cancelled"
+
+STATUS_LABELS = {
+    WAITING: "В очереди",
+    PROMOTED: "Забронировано",
+    EXPIRED: "Истекло",
+    CANCELLED: "Отменено",
+}
+
+
+def cancel_booking(conn, booking_id, user_id=None, today=None):
+    """Удаляет заявку и возвращает её (RoomType, Date, RentType, Duration) или None.
+
+    С user_id отменить можно только свою заявку, которая ещё не началась;
+    без него (администратор) — любую.
+    """
+    sql = "SELECT RoomType, Date, RentType, Duration FROM Request WHERE id=?"
+    params = [booking_id]
+    if user_id is not None:
+        sql += " AND id_users=? AND Date >= ?"
+        params += [user_id, (today or date.today()).isoformat()]
+    row = conn.execute(sql, params).fetchone()
+    if row:
+        conn.execute("DELETE FROM Request WHERE id=?", (booking_id,))
+    return row
+
+
+def join_waitlist(conn, room_type, date_str, rent_type, duration, user_id):
+    return conn.execute("""
+        INSERT INTO Waitlist (RoomType, Date, RentType, Duration, id_users)
+        VALUES (?, ?, ?, ?, ?)
+    """, (room_type, date_str, rent_type, duration, user_id)).lastrowid
+
+
+def leave_waitlist(conn, entry_id, user_id):
+    cur = conn.execute(
+        "UPDATE Waitlist SET Status=? WHERE id=? AND id_users=? AND Status=?",
+        (CANCELLED, entry_id, user_id, WAITING)
+    )
+    return cur.rowcount > 0
+
+
+def user_waitlist(db_name, user_id, limit=20):
+    """Последние записи пользователя: (id, RoomType, Date, RentType, Duration, Status)."""
+    conn = connect(db_name)
+    try:
+        return conn.execute("""
+            SELECT id, RoomType, Date, RentType, Duration, Status FROM Waitlist
+            WHERE id_users=? ORDER BY id DESC LIMIT ?
+        """, (user_id, limit)).fetchall()
+    finally:
+        conn.close()
+
+
+def promote(conn, room_type, until, fits, today=None):
+    """Бронирует ожидающим, чей период свободен; возвращает id продвинутых записей.
+
+    Выполняется внутри транзакции записи. fits(conn, entry) — проверка
+    приложения, entry = (id, RoomType, Date, RentType, Duration, id_users).
+    Записи, начинающиеся позже until, освободившийся период не затрагивает.
+    """
+    conn.execute(
+        "UPDATE Waitlist SET Status=? WHERE Status=? AND Date < ?",
+        (EXPIRED, WAITING, (today or date.today()).isoformat())
+    )
+    entries = conn.execute("""
+        SELECT id, RoomType, Date, RentType, Duration, id_users FROM Waitlist
+        WHERE Status=? AND RoomType=? AND Date <= ? ORDER BY id
+    """, (WAITING, room_type, until)).fetchall()
+    promoted = []
+    for entry in entries:
+        if not fits(conn, entry):
+            continue
+        request_id = conn.execute("""
+            INSERT INTO Request (RoomType, Date, RentType, Duration, id_users)
+            VALUES (?, ?, ?, ?, ?)
+        """, entry[1:]).lastrowid
+        conn.execute("UPDATE Waitlist SET Status=?, id_request=? WHERE id=?", (PROMOTED, request_id, entry[0]))
+        promoted.append(entry[0])
+    return promoted
+
+
+class PromotionWorker:
+    """Фоновый поток продвижения листа ожидания.
+
+    notify(room_type, until) только ставит сигнал в очередь; сигналы по одному
+    типу помещения, пришедшие до обработки, сливаются в один (с большей датой).
+    Сама работа — run(room_type, until), её передаёт приложение.
+    """
+
+    def __init__(self, run):
+        self.run = run
+        self._queue = queue.Queue()
+        self._pending = {}          # room_type -> until
+        self._lock = threading.Lock()
+        self._thread = None
+        self.promoted = 0
+
+    def notify(self, room_type, until):
+        with self._lock:
+            if room_type in self._pending:
+                self._pending[room_type] = max(self._pending[room_type], until)
+                return
+            self._pending[room_type] = until
+            # Поток стартует при первом сигнале — уже в воркере, а не до fork
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="waitlist", daemon=True)
+                self._thread.start()
+        self._queue.put(room_type)
+
+    def _loop(self):
+        while True:
+            room_type = self._queue.get()
+            with self._lock:
+                until = self._pending.pop(room_type)
+            try:
+                self.promoted += len(self.run(room_type, until) or [])
+            except Exception as e:
+                print(f"[waitlist] Ошибка продвижения листа ожидания ({room_type}): {e}")
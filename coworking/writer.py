@@ -0,0 +1,112 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from coworking.db import connect
+
+# -----------------------
+# Групповая запись бронирований
+# -----------------------
+# Каждый INSERT со своим COMMIT платит за fsync журнала. WriteCoordinator
+# собирает операции записи, пришедшие почти одновременно (за окно window или
+# до max_batch штук), и выполняет их одной транзакцией с одним fsync.
+#
+# Операция — функция fn(conn), которая внутри транзакции проверяет конфликты
+# и вставляет строку. Каждая выполняется в своей точке сохранения, поэтому
+# отказ одной (BookingConflict или ошибка) откатывает только её. Результат
+# возвращается вызывающему лишь после COMMIT — гарантии сохранности те же,
+# что и при отдельном коммите на каждую запись.
+#
+# on_commit(conn) вызывается после каждого COMMIT, до ответа вызывающим, —
+# так производные структуры (таблица занятости) обновляются раньше, чем
+# пользователь увидит результат своей брони.
+
+
+class BookingConflict(Exception):
+    """Операция отклонена проверкой внутри транзакции; текст — для пользователя."""
+
+
+class WriteCoordinator:
+    def __init__(self, db_name, window=0.002, max_batch=64, on_commit=None):
+        self.db_name = db_name
+        self.on_commit = on_commit
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.operations = 0
+        self.lock_wait = 0.0    # секунд ожидания блокировки записи SQLite (BEGIN IMMEDIATE)
+
+    def _ensure_started(self):
+        # Поток стартует при первой записи — уже в воркере, а не в процессе,
+        # который загрузил приложение до fork
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="write-coordinator", daemon=True)
+                    self._thread.start()
+
+    def submit(self, fn, timeout=30):
+        """Выполняет fn(conn) в ближайшей групповой транзакции и возвращает её результат."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((fn, future))
+        return future.result(timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # Окно закрыто — забираем только то, что уже стоит в очереди
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = connect(self.db_name, timeout=30)
+        conn.isolation_level = None   # транзакциями управляем сами
+        while True:
+            batch = self._collect()
+            results = []
+            try:
+                started = time.monotonic()
+                conn.execute("BEGIN IMMEDIATE")
+                self.lock_wait += time.monotonic() - started
+                for fn, _ in batch:
+                    conn.execute("SAVEPOINT op")
+                    try:
+                        results.append((True, fn(conn)))
+                        conn.execute("RELEASE op")
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO op")
+                        conn.execute("RELEASE op")
+                        results.append((False, e))
+                conn.execute("COMMIT")
+            except Exception as e:
+                # Транзакция не зафиксирована — ни одна операция пакета не сохранена
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            if self.on_commit is not None:
+                try:
+                    self.on_commit(conn)
+                except Exception as e:
+                    print(f"[writer] Ошибка обработчика после COMMIT: {e}")
+            self.batches += 1
+            self.operations += len(batch)
+            for (_, future), (ok, value) in zip(batch, results):
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
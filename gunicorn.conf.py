@@ -0,0 +1,43 @@
+# -----------------------
+# Настройки gunicorn для приложений коворкинга
+# -----------------------
+# Используются `python site.py` и `python trpo/site.py`; при запуске gunicorn
+# напрямую — через -c gunicorn.conf.py. Аргументы командной строки (-w,
+# --threads, --max-requests, ...) перекрывают значения отсюда.
+import os
+
+# Пакет coworking — в корне репозитория, откуда бы ни запускали
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+
+bind = f"{os.environ.get('COWORKING_HOST', 'localhost')}:{os.environ.get('COWORKING_PORT', '8000')}"
+workers = int(os.environ.get("COWORKING_WORKERS", 1))
+worker_class = "gthread"
+# Потоки воркера меняйте через COWORKING_THREADS, а не --threads: по этому же
+# значению приложение считает лимит лент событий (coworking/serve.py). Каждая
+# открытая лента /availability/stream держит поток до STREAM_TTL (5 минут);
+# лимит — threads - 4, остальные потоки всегда свободны для обычных запросов.
+# Сверх лимита лента отвечает 503, браузер повторяет через 30 секунд.
+threads = int(os.environ.get("COWORKING_THREADS", 32))
+
+# Приложение создаётся один раз до fork: воркеры получают готовые ресурсы
+# (таблица занятости в общей памяти создаётся один раз на хост)
+preload_app = True
+
+# Одновременных соединений на воркер; остальные ждут в очереди listen().
+# Не меньше threads: соединения лент и keep-alive обычных запросов
+worker_connections = max(64, 2 * threads)
+backlog = 64
+
+# Воркер перезапускается после стольких запросов — на случай утечек памяти
+max_requests = 2000
+max_requests_jitter = 200
+
+# Сколько секунд воркер дорабатывает запросы при остановке и HUP
+graceful_timeout = 30
+timeout = 60
+keepalive = 5
+
+accesslog = None
+errorlog = "-"
+# Управляющий сокет общий для всех экземпляров на хосте — не нужен
+control_socket_disable = True
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+# Пакет coworking лежит в корне репозитория
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from coworking import db  # noqa: E402
+
+
+@pytest.fixture
+def db_name(tmp_path):
+    return str(tmp_path / "coworking.db")
+
+
+@pytest.fixture
+def conn(db_name):
+    conn = db.connect(db_name)
+    yield conn
+    conn.close()
+
+
+def add_user(conn, login):
+    return conn.execute("INSERT INTO Users (Login, Password) VALUES (?, 'x')", (login,)).lastrowid
+
+
+def add_request(conn, user_id, room_type, start, rent_type="days", duration=1):
+    return conn.execute(
+        "INSERT INTO Request (RoomType, Date, RentType, Duration, id_users) VALUES (?, ?, ?, ?, ?)",
+        (room_type, start.isoformat(), rent_type, duration, user_id)
+    ).lastrowid
+
+
+@pytest.fixture(scope="session")
+def trpo_site():
+    """Модуль trpo/site.py (импорт по пути: имя site занято стандартным модулем)."""
+    from coworking.serve import load_module
+    return load_module("trpo/site.py")
+
+
+@pytest.fixture(scope="session")
+def root_site():
+    """Модуль site.py из корня репозитория."""
+    from coworking.serve import load_module
+    return load_module("site.py")
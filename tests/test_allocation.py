@@ -0,0 +1,78 @@
+from datetime import date, timedelta
+
+from conftest import add_request, add_user
+from coworking.allocation import COUNT, Ask, allocate
+from coworking.engine import OWN, TAKEN
+
+TODAY = date.today()
+
+
+def days(n):
+    return TODAY + timedelta(days=n)
+
+
+def test_parse_checks_window_and_own_duplicates(trpo_site):
+    text = "\n".join([
+        f"bob;meeting_room;{days(1)};days;3",
+        f"bob;meeting_room;{days(2)};days;1",        # пересекается со строкой 1
+        f"bob;office_light;{days(2)};days;1",        # другой тип — можно
+        f"alice;meeting_room;{days(-1)};days;1",     # в прошлом
+        f"alice;meeting_room;{days(40)};days;1",     # за окном бронирования
+        f"nobody;meeting_room;{days(1)};days;1",
+        "bob;meeting_room;not-a-date;days;1",
+    ])
+    asks, details, errors = trpo_site.parse_allocation_batch(text, {"bob": 1, "alice": 2})
+    assert [a.key for a in asks] == [1, 3]
+    assert details[3] == ("bob", 1, "days", 1)
+    assert [e.split(":")[0] for e in errors] == ["Строка 2", "Строка 4", "Строка 5", "Строка 6", "Строка 7"]
+
+
+def test_run_allocation_checks_each_ask_like_a_booking(conn, trpo_site):
+    bob, alice, carol = (add_user(conn, name) for name in ("bob", "alice", "carol"))
+    add_request(conn, bob, "meeting_room", days(1), duration=2)       # дни 1-2
+    add_request(conn, alice, "meeting_room", days(5))
+    asks = [Ask(1, "meeting_room", days(2), days(2)),     # своя бронь bob
+            Ask(2, "meeting_room", days(5), days(5)),     # чужая бронь alice
+            Ask(3, "meeting_room", days(3), days(4)),
+            Ask(4, "meeting_room", days(4), days(4))]     # проигрывает строке 3
+    details = {1: ("bob", bob, "days", 1), 2: ("bob", bob, "days", 1),
+               3: ("carol", carol, "days", 2), 4: ("alice", alice, "days", 1)}
+    result, baseline, conflicts = trpo_site.run_allocation(conn, asks, details, COUNT, apply=True)
+    assert conflicts == {1: OWN, 2: TAKEN}
+    assert set(result.accepted) == {3}
+    assert set(result.rejected) == {4}
+    rows = conn.execute("SELECT Date, id_users FROM Request WHERE Date=?", (days(3).isoformat(),)).fetchall()
+    assert rows == [(days(3).isoformat(), carol)]
+
+
+def test_load_occupancy_is_bounded_to_running_and_window(conn, trpo_site):
+    bob = add_user(conn, "bob")
+    add_request(conn, bob, "office_light", days(-20), duration=25)     # ещё идёт: дни -20..4
+    add_request(conn, bob, "office_light", days(-400), duration=3)     # давно закончилась
+    add_request(conn, bob, "office_light", days(-1), "hours", 2)       # вчера
+    add_request(conn, bob, "office_light", days(10))
+    add_request(conn, bob, "office_light", days(25))                   # позже last_day
+    periods = trpo_site.load_occupancy(conn, days(12))
+    assert periods["office_light"] == [(days(-20), days(4), bob), (days(10), days(10), bob)]
+    assert periods["meeting_room"] == []
+    # Идущая бронь по-прежнему не даёт распределить заявку на её дни
+    occupancy = {t: [[(s, e) for s, e, _ in busy]] for t, busy in periods.items()}
+    assert allocate([Ask(1, "office_light", days(0), days(0))], occupancy).rejected == [1]
+
+
+def test_parse_finds_overlap_among_unordered_lines(trpo_site):
+    text = "\n".join([
+        f"bob;meeting_room;{days(10)};days;2",
+        f"bob;meeting_room;{days(1)};days;2",
+        f"bob;meeting_room;{days(5)};days;1",
+        f"bob;meeting_room;{days(4)};days;3",     # задевает строку 3 (начало раньше)
+        f"bob;meeting_room;{days(11)};hours;1",   # внутри строки 1
+        f"bob;meeting_room;{days(3)};days;1",     # между строками 2 и 3
+        f"bob;meeting_room;{days(9)};days;1",     # вплотную к строке 1
+    ])
+    asks, _, errors = trpo_site.parse_allocation_batch(text, {"bob": 1})
+    assert [a.key for a in asks] == [1, 2, 3, 6, 7]
+    assert errors == [
+        "Строка 4: пересекается со строкой 3 того же пользователя",
+        "Строка 5: пересекается со строкой 1 того же пользователя",
+    ]
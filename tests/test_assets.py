@@ -0,0 +1,68 @@
+import pytest
+from flask import Flask
+
+from coworking.assets import IMMUTABLE, init_assets
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / "styles.css").write_text("body { color: black; }\n" * 50)
+    app = Flask(__name__, static_folder=str(tmp_path))
+    pipeline = init_assets(app)
+    return app.test_client(), pipeline.by_name["styles.css"]
+
+
+def test_asset_is_served_with_validators(client):
+    c, asset = client
+    r = c.get(f"/assets/{asset.hashed_name}", headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert r.headers["ETag"] == f'"{asset.digest}-gz"'
+    assert r.headers["Cache-Control"] == IMMUTABLE
+    assert r.headers["Vary"] == "Accept-Encoding"
+
+
+@pytest.mark.parametrize("header", [
+    lambda etag: etag,
+    lambda etag: f'"other", {etag}',
+    lambda etag: "*",
+])
+def test_matching_etag_gets_304(client, header):
+    c, asset = client
+    r = c.get(f"/assets/{asset.hashed_name}", headers={"If-None-Match": header(f'"{asset.digest}"')})
+    assert r.status_code == 304
+    assert r.data == b""
+    assert r.headers["ETag"] == f'"{asset.digest}"'
+
+
+@pytest.mark.parametrize("header", [
+    lambda etag: f'"x{etag[1:-1]}x"',      # отпечаток — только подстрока тега
+    lambda etag: '"other"',
+])
+def test_other_etag_gets_body(client, header):
+    c, asset = client
+    r = c.get(f"/assets/{asset.hashed_name}", headers={"If-None-Match": header(f'"{asset.digest}"')})
+    assert r.status_code == 200
+    assert r.data == asset.variants[None]
+
+
+def test_each_encoding_has_its_own_etag(client):
+    c, asset = client
+    url = f"/assets/{asset.hashed_name}"
+    etags = {}
+    for encoding in asset.variants:
+        r = c.get(url, headers={"Accept-Encoding": encoding or "identity"})
+        assert r.headers.get("Content-Encoding") == encoding
+        etags[encoding] = r.headers["ETag"]
+        # Свой тег — 304, тег другого варианта — тело
+        assert c.get(url, headers={"Accept-Encoding": encoding or "identity",
+                                   "If-None-Match": etags[encoding]}).status_code == 304
+    assert len(set(etags.values())) == len(asset.variants) >= 2
+    r = c.get(url, headers={"If-None-Match": etags["gzip"]})
+    assert r.status_code == 200
+    assert r.data == asset.variants[None]
+
+
+def test_unknown_asset_is_404(client):
+    c, _ = client
+    assert c.get("/assets/styles.000000000000.css").status_code == 404
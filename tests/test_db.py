@@ -0,0 +1,54 @@
+import sqlite3
+
+from coworking import db
+
+
+def columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def test_fresh_database_gets_latest_schema(db_name):
+    conn = db.connect(db_name)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == db.SCHEMA_VERSION
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert "id_series" in columns(conn, "Request")
+    assert "At" in columns(conn, "Changes")
+    assert "expires" in columns(conn, "Sessions")
+
+
+def test_migrations_apply_step_by_step_to_old_data(tmp_path):
+    """База, созданная старой версией схемы, догоняет текущую без потери строк.
+
+    Версия 0 — база исходного site.py: таблицы есть, номера схемы нет.
+    """
+    for version in range(db.SCHEMA_VERSION):
+        conn = sqlite3.connect(str(tmp_path / f"v{version}.db"))
+        with conn:
+            for statements in db.MIGRATIONS[:max(version, 1)]:
+                for sql in statements:
+                    conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {version}")
+        conn.execute("INSERT INTO Users (Login, Password) VALUES ('bob', 'x')")
+        conn.execute("INSERT INTO Request (RoomType, Date, RentType, Duration, id_users) "
+                     "VALUES ('meeting_room', '2026-01-05', 'days', 1, 1)")
+        conn.commit()
+        assert db.migrate(conn) == version
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == db.SCHEMA_VERSION
+        assert conn.execute("SELECT COUNT(*) FROM Request").fetchone()[0] == 1
+        # Триггеры последней версии пишут журнал со временем изменения
+        conn.execute("INSERT INTO Users (Login, Password) VALUES ('new', 'x')")
+        assert conn.execute("SELECT tbl, At IS NOT NULL FROM Changes ORDER BY seq DESC").fetchone() == ("Users", 1)
+        conn.close()
+
+
+def test_migrate_is_noop_when_current(conn):
+    assert db.migrate(conn) == db.SCHEMA_VERSION
+
+
+def test_triggers_log_request_insert_and_delete(conn):
+    conn.execute("INSERT INTO Users (Login, Password) VALUES ('bob', 'x')")
+    row_id = conn.execute("INSERT INTO Request (RoomType, Date, RentType, Duration, id_users) "
+                          "VALUES ('meeting_room', '2026-01-05', 'days', 2, 1)").lastrowid
+    conn.execute("DELETE FROM Request WHERE id = ?", (row_id,))
+    ops = conn.execute("SELECT tbl, op, row_id FROM Changes ORDER BY seq").fetchall()
+    assert ops == [("Users", "insert", 1), ("Request", "insert", row_id), ("Request", "delete", row_id)]
@@ -0,0 +1,71 @@
+from datetime import date, timedelta
+
+from conftest import add_request, add_user
+from coworking.engine import OWN, TAKEN, BookingEngine, MemoryStorage, SQLiteStorage, period_end
+
+D = date(2030, 1, 10)
+
+
+def days(n):
+    return D + timedelta(days=n)
+
+
+def memory_engine():
+    rooms = [{"id": 1, "room_type": "office"}, {"id": 2, "room_type": "office"}]
+    return BookingEngine(MemoryStorage(rooms))
+
+
+def test_memory_free_unit_left():
+    engine = memory_engine()
+    assert engine.book("office", days(0), "days", 3, "alice")[1] is None
+    # Вторая комната свободна — не конфликт
+    assert engine.conflict("office", days(1), days(1), "bob") is None
+
+
+def test_memory_own_among_several_overlaps():
+    engine = memory_engine()
+    engine.book("office", days(0), "days", 3, "alice")    # комната 1, дни 0-2
+    engine.book("office", days(1), "days", 5, "bob")      # комната 2, дни 1-5
+    # Период пересекает обе заявки; одна из них своя
+    assert engine.conflict("office", days(2), days(3), "alice") == OWN
+    assert engine.conflict("office", days(2), days(3), "carol") == TAKEN
+    # Своя заявка уже закончилась, чужая занимает одну из двух комнат
+    assert engine.conflict("office", days(4), days(4), "alice") is None
+
+
+def test_memory_book_refuses_with_reason():
+    engine = memory_engine()
+    engine.book("office", days(0), "days", 2, "alice")
+    engine.book("office", days(0), "days", 2, "bob")
+    assert engine.book("office", days(1), "days", 1, "carol") == (None, TAKEN)
+    assert engine.book("office", days(1), "days", 1, "alice") == (None, OWN)
+
+
+def test_sqlite_own_behind_nearer_foreign_booking(conn):
+    alice, bob = add_user(conn, "alice"), add_user(conn, "bob")
+    add_request(conn, alice, "meeting_room", days(0), duration=10)   # дни 0-9
+    add_request(conn, bob, "meeting_room", days(5), "hours", 2)      # день 5
+    engine = BookingEngine(SQLiteStorage(conn))
+    # Ближайшая слева заявка — чужая и уже закончилась; пересекается своя, более ранняя
+    assert engine.conflict("meeting_room", days(6), days(6), alice) == OWN
+    assert engine.conflict("meeting_room", days(6), days(6), bob) == TAKEN
+    assert engine.conflict("meeting_room", days(10), days(12), bob) is None
+
+
+def test_sqlite_taken_by_several_bookings(conn):
+    alice, bob, carol = (add_user(conn, name) for name in ("alice", "bob", "carol"))
+    add_request(conn, alice, "office_light", days(0), duration=2)
+    add_request(conn, bob, "office_light", days(3), duration=2)
+    assert engine_conflict(conn, days(1), days(3), carol) == TAKEN
+    assert engine_conflict(conn, days(1), days(3), bob) == OWN
+    assert engine_conflict(conn, days(2), days(2), carol) is None
+
+
+def engine_conflict(conn, start, end, user):
+    return BookingEngine(SQLiteStorage(conn)).conflict("office_light", start, end, user)
+
+
+def test_period_end_rules():
+    assert period_end(D, "hours", 8) == D
+    assert period_end(D, "days", 1) == D
+    assert period_end(D, "days", 3) == days(2)
@@ -0,0 +1,97 @@
+import pytest
+from flask import Flask
+
+from coworking import events
+from coworking.events import Broadcaster, event_stream
+from coworking.serve import feed_subscriber_limit
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    monkeypatch.setattr(events, "KEEPALIVE", 0.05)
+    opened = []
+
+    def open_stream(broadcaster, last_event_id=None):
+        app = Flask(__name__)
+        app.add_url_rule("/stream", "stream",
+                         lambda: event_stream(broadcaster, lambda: {"busy": []}))
+        headers = {"Last-Event-ID": last_event_id} if last_event_id else {}
+        r = app.test_client().get("/stream", headers=headers, buffered=False)
+        opened.append(r)
+        return r
+
+    yield open_stream
+    for r in opened:
+        r.close()
+
+
+def read(response, count):
+    """Следующие count событий потока, без retry и пингов."""
+    it = iter(response.response)
+    found = []
+    while len(found) < count:
+        chunk = next(it)
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        fields = dict(line.split(": ", 1) for line in chunk.strip().split("\n") if ": " in line)
+        if "event" in fields:
+            found.append(fields)
+    return found
+
+
+def test_resume_within_history_replays_missed_events(stream):
+    b = Broadcaster()
+    for day in ("2026-10-20", "2026-10-21", "2026-10-22"):
+        b.publish({"day": day})
+    r = stream(b, b.event_id(1))
+    got = read(r, 2)
+    assert [e["event"] for e in got] == ["availability", "availability"]
+    assert [e["id"] for e in got] == [b.event_id(2), b.event_id(3)]
+
+
+@pytest.mark.parametrize("last_event_id", [
+    lambda b: b.event_id(1),            # история уже не хранит следующих событий
+    lambda b: b.event_id(b.seq + 5),    # номер из будущего — другой процесс
+    lambda b: "deadbeef-3",             # другая эпоха — перезапуск или другой воркер
+])
+def test_stale_last_event_id_gets_fresh_snapshot(stream, last_event_id):
+    b = Broadcaster(history=2)
+    for i in range(5):
+        b.publish({"n": i})
+    r = stream(b, last_event_id(b))
+    first, = read(r, 1)
+    assert first["event"] == "snapshot"
+    assert first["id"] == b.event_id(5)
+    b.publish({"n": 5})
+    assert read(r, 1)[0]["id"] == b.event_id(6)
+
+
+def test_overflow_mid_stream_sends_reset(stream):
+    b = Broadcaster(buffer_size=2)
+    r = stream(b)
+    assert read(r, 1)[0]["event"] == "snapshot"
+    for i in range(3):
+        b.publish({"n": i})
+    assert read(r, 1)[0]["event"] == "reset"
+    with pytest.raises(StopIteration):
+        read(r, 1)
+    assert not b._subscribers
+
+
+def test_subscriber_limit_returns_503(stream):
+    b = Broadcaster(max_subscribers=1)
+    first = stream(b)
+    read(first, 1)
+    r = stream(b)
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "30"
+    first.close()
+    assert stream(b).status_code == 200
+
+
+@pytest.mark.parametrize("threads, limit", [(None, 28), ("8", 4), ("2", 1)])
+def test_feed_limit_follows_worker_threads(monkeypatch, threads, limit):
+    if threads is None:
+        monkeypatch.delenv("COWORKING_THREADS", raising=False)
+    else:
+        monkeypatch.setenv("COWORKING_THREADS", threads)
+    assert feed_subscriber_limit() == limit
@@ -0,0 +1,83 @@
+from datetime import date
+
+from conftest import add_request, add_user
+from coworking.changes import changes_after
+from coworking.engine import period_end
+from coworking.icalfeed import SECRET_ENV, CalendarFeeds, make_token
+
+LABELS = {"meeting_room": "Переговорная"}
+
+
+def dtstamps(body):
+    return [line for line in body.decode().split("\r\n") if line.startswith("DTSTAMP:")]
+
+
+def test_dtstamp_is_creation_time_and_stable(conn, db_name):
+    bob = add_user(conn, "bob")
+    booking = add_request(conn, bob, "meeting_room", date(2026, 5, 4), duration=2)
+    conn.execute("UPDATE Changes SET At = '2026-04-01T09:30:00Z' WHERE tbl = 'Request' AND row_id = ?", (booking,))
+    conn.commit()
+
+    first = CalendarFeeds(db_name, LABELS, period_end)._load(bob)
+    again = CalendarFeeds(db_name, LABELS, period_end)._load(bob)
+    assert dtstamps(first.body) == ["DTSTAMP:20260401T093000Z"]
+    assert again.body == first.body and again.etag == first.etag
+
+
+def test_appended_event_matches_fresh_load(conn, db_name):
+    bob = add_user(conn, "bob")
+    add_request(conn, bob, "meeting_room", date(2026, 5, 4))
+    conn.commit()
+    feeds = CalendarFeeds(db_name, LABELS, period_end)
+    feeds._feeds[bob] = feeds._load(bob)
+
+    add_request(conn, bob, "meeting_room", date(2026, 5, 6), "hours", 3)
+    conn.commit()
+    for change in changes_after(conn, feeds._feeds[bob].seq):
+        feeds.apply(change)
+    assert feeds._feeds[bob].body == feeds._load(bob).body
+
+
+def test_rows_older_than_journal_fall_back_to_start_date(conn, db_name):
+    bob = add_user(conn, "bob")
+    add_request(conn, bob, "meeting_room", date(2026, 5, 4))
+    conn.execute("DELETE FROM Changes")
+    conn.commit()
+    feed = CalendarFeeds(db_name, LABELS, period_end)._load(bob)
+    assert dtstamps(feed.body) == ["DTSTAMP:20260504T000000Z"]
+
+
+def calendar_client(module, tmp_path, **config):
+    app = module.create_app(str(tmp_path / "cal.db"), {"OCCUPANCY_SHM": False, **config})
+    client = app.test_client()
+    client.post("/register", data={"username": "bob", "password": "secret1"})
+    client.post("/login", data={"username": "bob", "password": "secret1"})
+    return app, client
+
+
+def test_feed_needs_configured_secret(root_site, tmp_path, monkeypatch):
+    monkeypatch.delenv(SECRET_ENV, raising=False)
+    app, client = calendar_client(root_site, tmp_path)
+    assert "/calendar/" not in client.get("/bookings").get_data(as_text=True)
+    # Ключ приложения из репозитория токены больше не подписывает
+    for secret in (app.secret_key, None, ""):
+        token = make_token(secret, 1)
+        assert client.get(f"/calendar/{token}.ics").status_code == 404
+
+
+def test_token_forged_with_wrong_key_gets_404(root_site, tmp_path):
+    app, client = calendar_client(root_site, tmp_path, CALENDAR_SECRET="s3cret-from-env")
+    page = client.get("/bookings").get_data(as_text=True)
+    assert f"/calendar/{make_token('s3cret-from-env', 1)}.ics" in page
+    assert client.get(f"/calendar/{make_token('s3cret-from-env', 1)}.ics").status_code == 200
+    anonymous = app.test_client()
+    for secret in (app.secret_key, "guess"):
+        assert anonymous.get(f"/calendar/{make_token(secret, 1)}.ics").status_code == 404
+
+
+def test_secret_from_environment_and_site_scope(trpo_site, tmp_path, monkeypatch):
+    monkeypatch.setenv(SECRET_ENV, "env-secret")
+    app, client = calendar_client(trpo_site, tmp_path, SITE="north")
+    assert client.get(f"/calendar/{make_token('env-secret', 1, 'north')}.ics").status_code == 200
+    # Токен другой площадки к этой не подходит
+    assert client.get(f"/calendar/{make_token('env-secret', 1, 'south')}.ics").status_code == 404
@@ -0,0 +1,114 @@
+import threading
+from datetime import date, timedelta
+
+import pytest
+from flask import Flask
+from werkzeug.datastructures import MultiDict
+
+from coworking.idempotency import KEY_FIELD, IdempotencyCache, InProgress, freeze, replay, request_key
+
+
+def test_request_key_depends_on_user_key_and_fields():
+    form = MultiDict([(KEY_FIELD, "k1"), ("room_type", "meeting_room"), ("duration_value", "1")])
+    changed = MultiDict([(KEY_FIELD, "k1"), ("room_type", "meeting_room"), ("duration_value", "2")])
+    reordered = MultiDict([("duration_value", "1"), ("room_type", "meeting_room"), (KEY_FIELD, "k1")])
+    assert request_key(1, form) == request_key(1, reordered)
+    assert request_key(1, form) != request_key(1, changed)
+    assert request_key(1, form) != request_key(2, form)
+    assert request_key(1, MultiDict([("room_type", "meeting_room")])) is None
+
+
+def test_repeat_gets_first_outcome():
+    cache = IdempotencyCache()
+    calls = []
+    assert cache.run("k", lambda: calls.append(1) or "first") == "first"
+    assert cache.run("k", lambda: calls.append(2) or "second") == "first"
+    assert calls == [1] and cache.replayed == 1
+
+
+def test_failed_first_run_is_not_replayed():
+    cache = IdempotencyCache()
+
+    def fail():
+        raise RuntimeError("база недоступна")
+
+    with pytest.raises(RuntimeError):
+        cache.run("k", fail)
+    assert cache.run("k", lambda: "retried") == "retried"
+    assert cache.replayed == 0
+
+
+def test_concurrent_repeat_waits_for_first_run():
+    cache = IdempotencyCache()
+    started, release = threading.Event(), threading.Event()
+    results = []
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    first = threading.Thread(target=lambda: results.append(cache.run("k", slow)))
+    first.start()
+    started.wait(5)
+    repeat = threading.Thread(target=lambda: results.append(cache.run("k", lambda: "again")))
+    repeat.start()
+    release.set()
+    first.join()
+    repeat.join()
+    assert results == ["done", "done"]
+
+
+def test_repeat_gives_up_after_wait_timeout():
+    cache = IdempotencyCache(wait_timeout=0.05)
+    started, release = threading.Event(), threading.Event()
+    first = threading.Thread(target=cache.run, args=("k", lambda: started.set() or release.wait(5)))
+    first.start()
+    try:
+        started.wait(5)
+        with pytest.raises(InProgress):
+            cache.run("k", lambda: "again")
+    finally:
+        release.set()
+        first.join()
+
+
+def test_entries_expire_and_are_bounded():
+    cache = IdempotencyCache(max_entries=2, ttl=0)
+    cache.run("a", lambda: 1)
+    assert cache.run("a", lambda: 2) == 2      # ttl истёк — выполняется заново
+    cache = IdempotencyCache(max_entries=2)
+    for key in "abc":
+        cache.run(key, lambda: key)
+    assert list(cache._entries) == ["b", "c"]
+
+
+def test_frozen_response_replays_without_cookies():
+    app = Flask(__name__)
+    with app.test_request_context():
+        response = app.response_class("ok", status=201, headers={"X-Test": "1"})
+        response.set_cookie("session", "secret")
+        frozen = freeze(response)
+        replayed = replay(frozen)
+    assert (replayed.status_code, replayed.get_data(), replayed.headers["X-Test"]) == (201, b"ok", "1")
+    assert "Set-Cookie" not in replayed.headers
+
+
+def test_double_submit_books_once(root_site, tmp_path):
+    app = root_site.create_app(str(tmp_path / "site.db"), {"OCCUPANCY_SHM": False})
+    client = app.test_client()
+    client.post("/register", data={"username": "bob", "password": "secret1"})
+    client.post("/login", data={"username": "bob", "password": "secret1"})
+    form = {"room_type": "meeting_room", "start_date": (date.today() + timedelta(days=3)).isoformat(),
+            "duration_unit": "days", "duration_value": "1", KEY_FIELD: "form-1"}
+    first = client.post("/book", data=form)
+    again = client.post("/book", data=form)
+    assert (again.status_code, again.get_data()) == (first.status_code, first.get_data())
+    assert app.extensions["idempotency"].replayed == 1
+    # Новый ключ — новая отправка: та же бронь уже конфликтует
+    other = client.post("/book", data=dict(form, **{KEY_FIELD: "form-2"}))
+    assert other.get_data() != first.get_data()
+    with app.app_context():
+        conn = root_site.get_db()
+        assert conn.execute("SELECT COUNT(*) FROM Request").fetchone()[0] == 1
+        conn.close()
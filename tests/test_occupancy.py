@@ -0,0 +1,144 @@
+import os
+import struct
+from datetime import date, timedelta
+
+import pytest
+
+from conftest import add_request, add_user
+from coworking import occupancy
+from coworking.engine import period_end
+from coworking.occupancy import HEADER, SEQ_OFFSET, OccupancyTable
+
+pytestmark = pytest.mark.skipif(occupancy.shared_memory is None, reason="нет POSIX shared memory")
+
+TYPES = ["meeting_room", "office_light"]
+TODAY = date.today()
+DAYS = 16
+
+
+def days(n):
+    return TODAY + timedelta(days=n)
+
+
+@pytest.fixture
+def table(db_name):
+    table = OccupancyTable(db_name, TYPES, period_end, days=DAYS)
+    yield table
+    table.unlink()
+    if os.path.exists(table._lock_path):
+        os.remove(table._lock_path)
+
+
+def expected(conn):
+    """Занятые дни окна по строкам Request — то, что должна показывать таблица."""
+    busy = {t: set() for t in TYPES}
+    for room_type, d_str, rent_type, duration in conn.execute(
+            "SELECT RoomType, Date, RentType, Duration FROM Request"):
+        start = date.fromisoformat(d_str)
+        end = period_end(start, rent_type, duration)
+        day = max(start, TODAY)
+        while day <= min(end, days(DAYS - 1)):
+            busy[room_type].add(day.isoformat())
+            day += timedelta(days=1)
+    return {t: sorted(v) for t, v in busy.items()}
+
+
+def assert_agrees(table, conn):
+    assert table.busy_days(TODAY, days(DAYS - 1)) == expected(conn)
+
+
+def test_first_attach_rebuilds_from_database(table, conn):
+    bob = add_user(conn, "bob")
+    add_request(conn, bob, "meeting_room", days(-3), duration=5)     # идёт с прошлого
+    add_request(conn, bob, "office_light", days(4), "hours", 2)
+    add_request(conn, bob, "meeting_room", days(-30), duration=2)    # закончилась
+    conn.commit()
+    assert table.is_free("meeting_room", days(1), days(1)) is False
+    assert table.is_free("meeting_room", days(2), days(5)) is True
+    assert table.is_free("office_light", days(4), days(4)) is False
+    assert table.is_free("meeting_room", days(DAYS), days(DAYS)) is None     # вне окна
+    assert table.rebuilds == 1
+    assert_agrees(table, conn)
+
+
+def test_book_and_cancel_are_applied_from_the_log(table, conn):
+    bob = add_user(conn, "bob")
+    conn.commit()
+    assert table.is_free("office_light", days(2), days(2)) is True
+    booking = add_request(conn, bob, "office_light", days(1), duration=3)
+    conn.commit()
+    table.sync(conn)
+    assert table.is_free("office_light", days(2), days(2)) is False
+    assert_agrees(table, conn)
+
+    conn.execute("DELETE FROM Request WHERE id = ?", (booking,))
+    conn.commit()
+    table.sync(conn)
+    assert table.is_free("office_light", days(1), days(3)) is True
+    assert_agrees(table, conn)
+    assert table.rebuilds == 1      # изменения догнаны по журналу, без перестройки
+
+
+def test_other_process_sees_the_same_segment(table, db_name, conn):
+    bob = add_user(conn, "bob")
+    add_request(conn, bob, "meeting_room", days(2))
+    conn.commit()
+    table.refresh(rebuild=True)
+    other = OccupancyTable(db_name, TYPES, period_end, days=DAYS)
+    try:
+        assert other.name == table.name
+        other._attach()       # подключение без перестройки: читаем то, что записал первый
+        other._verified = float("inf")
+        assert other.is_free("meeting_room", days(2), days(2)) is False
+    finally:
+        other.close()
+
+
+def test_reader_retries_torn_read(table, conn):
+    add_user(conn, "bob")
+    conn.commit()
+    table.refresh(rebuild=True)
+    seq = struct.unpack_from("<Q", table._shm.buf, SEQ_OFFSET)[0]
+    calls = []
+
+    def read(epoch):
+        calls.append(epoch)
+        if len(calls) == 1:
+            # Писатель успел изменить таблицу, пока мы читали
+            table._set_seq(seq + 2)
+        return len(calls)
+
+    assert table._read(read) == 2
+
+
+def test_reader_gives_up_while_writer_holds_seq(table, conn):
+    add_user(conn, "bob")
+    conn.commit()
+    table.refresh(rebuild=True)
+    table._set_seq(struct.unpack_from("<Q", table._shm.buf, SEQ_OFFSET)[0] | 1)
+    table._verified = float("inf")     # без сверки: seq остаётся нечётным
+    assert table.is_free("meeting_room", days(1), days(1)) is None
+
+
+@pytest.mark.parametrize("damage", ["dead_writer", "stale_epoch", "foreign_stamp", "negative_count"])
+def test_damaged_table_is_rebuilt(table, conn, damage):
+    bob = add_user(conn, "bob")
+    add_request(conn, bob, "meeting_room", days(1), duration=2)
+    conn.commit()
+    table.refresh(rebuild=True)
+    magic, seq, stamp, epoch, n_types, n_days = table._header()
+    table._counts[0:DAYS] = memoryview(bytes(4 * DAYS)).cast("i")     # счётчики испорчены
+    if damage == "dead_writer":
+        table._set_seq(seq | 1)
+    elif damage == "stale_epoch":
+        HEADER.pack_into(table._shm.buf, 0, magic, seq, stamp, epoch - 1, n_types, n_days)
+    elif damage == "foreign_stamp":
+        HEADER.pack_into(table._shm.buf, 0, magic, seq, stamp + 100, epoch, n_types, n_days)
+    else:
+        # Отмена брони, которой таблица не видела: счётчик уходит в минус
+        booking = conn.execute("SELECT id FROM Request").fetchone()[0]
+        conn.execute("DELETE FROM Request WHERE id = ?", (booking,))
+        conn.commit()
+    table.sync(conn)
+    assert table.rebuilds == 2
+    assert_agrees(table, conn)
@@ -0,0 +1,102 @@
+import os
+from datetime import date, timedelta
+
+import pytest
+
+from conftest import add_request, add_user
+from coworking import db
+from coworking.engine import period_end
+from coworking.periodindex import PeriodIndex
+
+TODAY = date(2026, 6, 1)
+SINCE = TODAY.toordinal()
+
+
+def days(n):
+    return TODAY + timedelta(days=n)
+
+
+def load(index, db_name):
+    """Загрузка в одном снимке базы, как это делает таблица занятости."""
+    conn = db.connect_readonly(db_name)
+    try:
+        conn.execute("BEGIN")
+        return sorted(index.load(conn, SINCE))
+    finally:
+        conn.close()
+
+
+def running(conn):
+    """Действующие заявки по Request — эталон для индекса."""
+    result = []
+    for room_type, d_str, rent_type, duration in conn.execute(
+            "SELECT RoomType, Date, RentType, Duration FROM Request"):
+        start = date.fromisoformat(d_str)
+        end = period_end(start, rent_type, duration)
+        if end.toordinal() >= SINCE:
+            result.append((room_type, start.toordinal(), end.toordinal()))
+    return sorted(result)
+
+
+@pytest.fixture
+def index(db_name):
+    return PeriodIndex(db_name + ".periods", period_end)
+
+
+@pytest.fixture
+def bob(conn):
+    user = add_user(conn, "bob")
+    add_request(conn, user, "meeting_room", days(-2), duration=4)     # идёт
+    add_request(conn, user, "office_light", days(-10), duration=2)    # закончилась
+    add_request(conn, user, "office_light", days(3), "hours", 1)
+    conn.commit()
+    return user
+
+
+def test_catches_up_with_writes_from_another_connection(index, db_name, conn, bob):
+    assert load(index, db_name) == running(conn)
+    assert index.full_scans == 1
+
+    other = db.connect(db_name)
+    add_request(other, bob, "meeting_room", days(5), duration=3)
+    add_request(other, bob, "office_light", days(-5), duration=1)      # уже в прошлом
+    cancelled = other.execute("SELECT id FROM Request WHERE Date = ?", (days(3).isoformat(),)).fetchone()[0]
+    other.execute("DELETE FROM Request WHERE id = ?", (cancelled,))
+    other.commit()
+    other.close()
+
+    assert load(index, db_name) == running(conn)
+    assert (index.full_scans, index.replayed) == (1, 3)
+    # Догнанный файл сохранён: следующей загрузке журнал не нужен
+    fresh = PeriodIndex(index.path, period_end)
+    assert load(fresh, db_name) == running(conn)
+    assert (fresh.full_scans, fresh.replayed) == (0, 0)
+
+
+def test_recreated_or_damaged_file_is_rebuilt(index, db_name, conn, bob):
+    load(index, db_name)
+    os.remove(index.path)
+    add_request(conn, bob, "meeting_room", days(8))
+    conn.commit()
+    assert load(index, db_name) == running(conn)
+    assert index.full_scans == 2
+
+    with open(index.path, "r+b") as f:        # обрезанный файл
+        f.truncate(os.path.getsize(index.path) - 3)
+    assert load(index, db_name) == running(conn)
+    assert index.full_scans == 3
+
+
+def test_file_of_another_database_is_not_trusted(index, db_name, conn, bob, tmp_path):
+    # Файл с большим stamp, чем журнал этой базы, — от другой базы
+    other_db = str(tmp_path / "other.db")
+    other = db.connect(other_db)
+    user = add_user(other, "alice")
+    for i in range(10):
+        add_request(other, user, "meeting_room", days(i))
+    other.commit()
+    other.close()
+    load(PeriodIndex(index.path, period_end), other_db)
+
+    assert load(index, db_name) == running(conn)
+    assert index.full_scans == 1
@@ -0,0 +1,45 @@
+from datetime import date, timedelta
+
+from conftest import add_request, add_user
+from coworking.engine import period_end
+from coworking.series import OWN, SERIES, TAKEN, WEEKLY, BusyIndex, create_series, plan
+
+D = date(2030, 1, 10)
+
+
+def days(n):
+    return D + timedelta(days=n)
+
+
+def test_own_overlap_behind_nearest_left_period(conn):
+    alice, bob = add_user(conn, "alice"), add_user(conn, "bob")
+    add_request(conn, alice, "meeting_room", days(0), duration=10)   # дни 0-9
+    add_request(conn, bob, "meeting_room", days(5))                  # день 5
+    report = plan(conn, "meeting_room", [days(6)], "days", 1, alice, period_end)
+    assert report[0].conflict == OWN
+    report = plan(conn, "meeting_room", [days(6)], "days", 1, bob, period_end)
+    assert report[0].conflict == TAKEN
+
+
+def test_busy_index_lists_every_overlap():
+    index = BusyIndex([(days(0), days(9), 1), (days(2), days(3), 2), (days(5), days(5), 3), (days(12), days(12), 4)])
+    found = {user for _, _, _, user in index.bookings("office", days(4), days(6))}
+    assert found == {1, 3}
+    assert list(index.bookings("office", days(10), days(11))) == []
+
+
+def test_plan_marks_self_overlap_and_free_dates(conn):
+    alice = add_user(conn, "alice")
+    report = plan(conn, "office_light", [days(0), days(1), days(7)], "days", 2, alice, period_end)
+    assert [o.conflict for o in report] == [None, SERIES, None]
+
+
+def test_create_series_inserts_only_free_occurrences(conn):
+    alice, bob = add_user(conn, "alice"), add_user(conn, "bob")
+    add_request(conn, bob, "office_light", days(7))
+    series_id, report = create_series(conn, alice, "office_light", days(0), WEEKLY, None, 3,
+                                      "days", 1, period_end, days(30))
+    assert series_id is not None
+    assert [o.conflict for o in report] == [None, TAKEN, None]
+    rows = conn.execute("SELECT Date FROM Request WHERE id_series=? ORDER BY Date", (series_id,)).fetchall()
+    assert [r[0] for r in rows] == [days(0).isoformat(), days(14).isoformat()]
@@ -0,0 +1,43 @@
+import time
+
+from coworking.jobs import JobQueue
+from coworking.sessions import SessionStore
+
+
+def test_session_expires_on_lookup(db_name):
+    store = SessionStore(db_name, ttl=60)
+    store["live"] = {"username": "bob"}
+    assert store.get("live") == {"username": "bob"}
+    assert "live" in store
+
+    store.ttl = -1
+    store["stale"] = {"username": "bob"}
+    assert store.get("stale") is None
+    assert "stale" not in store
+
+
+def test_purge_deletes_expired_and_legacy_rows(db_name, conn):
+    store = SessionStore(db_name, ttl=60)
+    store["live"] = "bob"
+    store.ttl = -1
+    store["stale"] = "alice"
+    conn.execute("INSERT INTO Sessions (id, data) VALUES ('legacy', '\"carol\"')")    # до миграции 10
+    conn.commit()
+    assert store.purge() == 2
+    assert [row[0] for row in conn.execute("SELECT id FROM Sessions")] == ["live"]
+
+
+def test_lookup_schedules_one_purge_per_interval(db_name, conn):
+    jobs = JobQueue(max_workers=1)
+    store = SessionStore(db_name, ttl=-1, jobs=jobs, purge_interval=3600)
+    store["stale"] = "bob"
+    store.get("stale")
+    store.get("stale")
+    assert len(jobs._jobs) == 1
+    job = next(iter(jobs._jobs.values()))
+    assert jobs.wait(job, timeout=5) and job.result == 1
+    assert conn.execute("SELECT COUNT(*) FROM Sessions").fetchone()[0] == 0
+
+    store._next_purge = time.time() - 1     # интервал прошёл, но задача этого интервала уже есть
+    store.get("stale")
+    assert len(jobs._jobs) == 1
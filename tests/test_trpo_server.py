@@ -0,0 +1,44 @@
+import http.client
+import threading
+from http.server import HTTPServer
+from urllib.parse import urlencode
+
+import pytest
+
+from coworking.serve import load_module
+
+
+@pytest.fixture(scope="module")
+def server():
+    module = load_module("trpo.py")
+    httpd = HTTPServer(("127.0.0.1", 0), module.Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    module.sessions["test-session"] = "bob"
+    yield httpd.server_address
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def post(address, path, fields):
+    conn = http.client.HTTPConnection(*address, timeout=5)
+    try:
+        conn.request("POST", path, urlencode(fields), {"Cookie": "session=test-session",
+                                                      "Content-Type": "application/x-www-form-urlencoded"})
+        response = conn.getresponse()
+        return response.status, response.read().decode("utf-8")
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("booking_id", ["abc", "", "1.5", "<script>"])
+def test_cancel_rejects_non_numeric_id(server, booking_id):
+    status, body = post(server, "/cancel", {"booking_id": booking_id})
+    assert status == 400
+    assert "Некорректная заявка." in body
+
+
+def test_cancel_unknown_booking(server):
+    status, body = post(server, "/cancel", {"booking_id": "999999"})
+    assert status == 200
+    assert "Заявка не найдена." in body
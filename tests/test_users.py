@@ -0,0 +1,28 @@
+import sys
+
+import pytest
+
+from conftest import add_user
+
+TOP = chr(sys.maxunicode)
+
+
+@pytest.mark.parametrize("prefix, upper", [
+    ("bo", "bp"),
+    ("\ud7ff", "\ue000"),  # за U+D7FF идут суррогаты — пропускаем их
+    ("a\ud7ff", "a\ue000"),
+    ("a" + TOP, "b"),               # U+10FFFF увеличить нельзя — увеличиваем предыдущий
+    (TOP * 2, None),
+])
+def test_login_prefix_range(trpo_site, prefix, upper):
+    assert trpo_site.login_prefix_range(prefix) == (prefix, upper)
+
+
+def test_search_by_prefix_next_to_surrogates(conn, trpo_site):
+    for login in ("x\ud7ff", "x\ud7ff1", "x\ue000", "y" + TOP, "y" + TOP + "1", "z"):
+        add_user(conn, login)
+    conn.commit()
+    for prefix, expected in [("x\ud7ff", ["x\ud7ff", "x\ud7ff1"]),
+                             ("y" + TOP, ["y" + TOP, "y" + TOP + "1"])]:
+        rows, _, _ = trpo_site.search_users(conn, prefix)
+        assert [login for _, login, _ in rows] == expected
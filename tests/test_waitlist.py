@@ -0,0 +1,118 @@
+import threading
+from datetime import date, timedelta
+
+from conftest import add_request, add_user
+from coworking.engine import BookingEngine, SQLiteStorage, period_end
+from coworking.waitlist import (CANCELLED, EXPIRED, PROMOTED, WAITING, PromotionWorker, cancel_booking,
+                                join_waitlist, leave_waitlist, promote)
+
+TODAY = date(2026, 6, 1)
+
+
+def days(n):
+    return (TODAY + timedelta(days=n)).isoformat()
+
+
+def fits(conn, entry):
+    """Как waitlist_entry_fits в приложениях: конфликтов с заявками нет."""
+    _, room_type, d_str, rent_type, duration, user_id = entry
+    start = date.fromisoformat(d_str)
+    end = period_end(start, rent_type, int(duration))
+    return BookingEngine(SQLiteStorage(conn)).conflict(room_type, start, end, user_id) is None
+
+
+def statuses(conn):
+    return dict(conn.execute("SELECT id, Status FROM Waitlist"))
+
+
+def test_cancellation_promotes_first_waiting_in_order(conn):
+    bob, alice, carol = (add_user(conn, name) for name in ("bob", "alice", "carol"))
+    booking = add_request(conn, bob, "meeting_room", TODAY + timedelta(days=3), duration=2)
+    first = join_waitlist(conn, "meeting_room", days(4), "days", 1, alice)
+    second = join_waitlist(conn, "meeting_room", days(4), "days", 1, carol)
+
+    assert promote(conn, "meeting_room", days(4), fits, TODAY) == []      # ещё занято
+
+    assert cancel_booking(conn, booking, bob, TODAY) == ("meeting_room", days(3), "days", 2)
+    assert promote(conn, "meeting_room", days(4), fits, TODAY) == [first]
+    # Вторая в очереди снова упирается в занятый день — теперь бронь первой
+    assert statuses(conn) == {first: PROMOTED, second: WAITING}
+    request_id = conn.execute("SELECT id_request FROM Waitlist WHERE id = ?", (first,)).fetchone()[0]
+    assert conn.execute("SELECT RoomType, Date, id_users FROM Request WHERE id = ?",
+                        (request_id,)).fetchone() == ("meeting_room", days(4), alice)
+
+
+def test_later_entry_promoted_when_earlier_still_conflicts(conn):
+    bob, alice, carol = (add_user(conn, name) for name in ("bob", "alice", "carol"))
+    add_request(conn, bob, "office_light", TODAY + timedelta(days=6))
+    long_wait = join_waitlist(conn, "office_light", days(5), "days", 3, alice)    # задевает день 6
+    short_wait = join_waitlist(conn, "office_light", days(5), "days", 1, carol)
+    assert promote(conn, "office_light", days(6), fits, TODAY) == [short_wait]
+    assert statuses(conn) == {long_wait: WAITING, short_wait: PROMOTED}
+
+
+def test_nothing_to_promote(conn):
+    alice = add_user(conn, "alice")
+    other_type = join_waitlist(conn, "office_light", days(2), "days", 1, alice)
+    later = join_waitlist(conn, "meeting_room", days(9), "days", 1, alice)       # после until
+    left = join_waitlist(conn, "meeting_room", days(2), "days", 1, alice)
+    old = join_waitlist(conn, "meeting_room", days(-1), "days", 1, alice)
+    assert leave_waitlist(conn, left, alice)
+    assert not leave_waitlist(conn, left, alice)
+    assert promote(conn, "meeting_room", days(5), fits, TODAY) == []
+    assert statuses(conn) == {other_type: WAITING, later: WAITING, left: CANCELLED, old: EXPIRED}
+    assert conn.execute("SELECT COUNT(*) FROM Request").fetchone()[0] == 0
+
+
+def test_cancel_checks_owner_and_start(conn):
+    bob, alice = add_user(conn, "bob"), add_user(conn, "alice")
+    started = add_request(conn, bob, "meeting_room", TODAY - timedelta(days=1), duration=3)
+    upcoming = add_request(conn, bob, "meeting_room", TODAY + timedelta(days=2))
+    assert cancel_booking(conn, upcoming, alice, TODAY) is None
+    assert cancel_booking(conn, started, bob, TODAY) is None
+    assert cancel_booking(conn, started, today=TODAY) is not None       # администратор
+
+
+def test_worker_merges_signals_per_room_type():
+    calls = []
+    busy, gate, done = threading.Event(), threading.Event(), threading.Event()
+
+    def run(room_type, until):
+        busy.set()
+        gate.wait(5)
+        calls.append((room_type, until))
+        if len(calls) == 2:
+            done.set()
+        return [1]
+
+    worker = PromotionWorker(run)
+    worker.notify("office_light", days(2))
+    assert busy.wait(5)
+    # Пока поток занят, сигналы по одному типу сливаются в один с большей датой
+    worker.notify("meeting_room", days(1))
+    worker.notify("meeting_room", days(7))
+    worker.notify("meeting_room", days(3))
+    gate.set()
+    assert done.wait(5)
+    assert calls == [("office_light", days(2)), ("meeting_room", days(7))]
+    assert worker.promoted == 2
+
+
+def test_worker_survives_failed_run():
+    failed, done = threading.Event(), threading.Event()
+    calls = []
+
+    def run(room_type, until):
+        calls.append(until)
+        if len(calls) == 1:
+            failed.set()
+            raise RuntimeError("база недоступна")
+        done.set()
+        return []
+
+    worker = PromotionWorker(run)
+    worker.notify("meeting_room", days(1))
+    assert failed.wait(5)
+    worker.notify("meeting_room", days(2))
+    assert done.wait(5)
+    assert calls == [days(1), days(2)]
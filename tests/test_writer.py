@@ -0,0 +1,70 @@
+import threading
+
+from conftest import add_user
+from coworking.writer import BookingConflict, WriteCoordinator
+
+
+def insert(login, fail=None):
+    def op(conn):
+        conn.execute("INSERT INTO Users (Login, Password) VALUES (?, 'x')", (login,))
+        if fail is not None:
+            raise fail
+        return login
+    return op
+
+
+def submit_together(writer, ops):
+    """Отправляет операции из разных потоков так, чтобы они попали в один пакет."""
+    outcomes = [None] * len(ops)
+
+    def call(i, op):
+        try:
+            outcomes[i] = writer.submit(op)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=call, args=(i, op)) for i, op in enumerate(ops)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return outcomes
+
+
+def test_failed_operation_rolls_back_only_its_savepoint(db_name, conn):
+    commits = []
+    writer = WriteCoordinator(db_name, window=0.5,
+                              on_commit=lambda c: commits.append(c.execute("SELECT COUNT(*) FROM Users").fetchone()[0]))
+    ok1, conflict, error, ok2 = submit_together(writer, [
+        insert("a"), insert("b", BookingConflict("занято")), insert("c", ValueError("сбой")), insert("d"),
+    ])
+    assert (ok1, ok2) == ("a", "d")
+    assert isinstance(conflict, BookingConflict) and str(conflict) == "занято"
+    assert isinstance(error, ValueError)
+    assert writer.batches == 1 and commits == [2]
+    assert sorted(row[0] for row in conn.execute("SELECT Login FROM Users")) == ["a", "d"]
+
+
+def test_failed_commit_fails_every_operation(db_name, conn):
+    add_user(conn, "taken")
+    conn.commit()
+    writer = WriteCoordinator(db_name, window=0.5)
+
+    def break_transaction(c):
+        # Операция, закрывшая транзакцию сама, ломает RELEASE — пакет не фиксируется
+        c.execute("ROLLBACK")
+
+    outcomes = submit_together(writer, [insert("x"), break_transaction])
+    assert all(isinstance(o, Exception) for o in outcomes)
+    assert [row[0] for row in conn.execute("SELECT Login FROM Users")] == ["taken"]
+    # Поток записи продолжает работать после неудачного пакета
+    assert writer.submit(insert("y")) == "y"
+
+
+def test_result_is_returned_after_commit(db_name):
+    writer = WriteCoordinator(db_name)
+    seen = []
+    writer.on_commit = lambda c: seen.append(c.execute("SELECT COUNT(*) FROM Users").fetchone()[0])
+    assert writer.submit(insert("z")) == "z"
+    assert seen == [1]
+
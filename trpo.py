@@ -1,8 +1,15 @@
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from urllib.parse import parse_qs
-from datetime import datetime, date, timedelta
+from datetime import datetime, date
+from html import escape
+from collections import deque
+import threading
 import uuid
 
+from coworking.engine import BookingEngine, MemoryStorage, OWN, TAKEN, can_book_date
+from coworking.pagecache import PageCache, is_not_modified, cache_headers
+from coworking.waitlist import CANCELLED, PromotionWorker, STATUS_LABELS
+
 # -----------------------
 # Данные
 # -----------------------
@@ -13,6 +20,8 @@ ALLOWED_TYPES = [
     ("office_premium", "Кабинет «Премиум»"),
     ("meeting_room", "Переговорная комната"),
 ]
+TYPE_LABELS = dict(ALLOWED_TYPES)
+DURATION_UNITS = ("days", "hours")
 
 rooms = [
     {"id": 1, "room_type": "workspace_open", "equipment_class": "Стандарт"},
@@ -23,38 +32,72 @@ rooms = [
     {"id": 6, "room_type": "meeting_room", "equipment_class": "Видеоконф"},
 ]
 
-bookings = []
+# Заявки и индекс занятости хранит общее ядро бронирования
+storage = MemoryStorage(rooms)
+engine = BookingEngine(storage)
+bookings = storage.bookings_list
+occupied = storage.occupied   # {(room_id, дата): id заявки} — все дни заявки, без перебора
+waitlist = {}       # {(room_type, дата): очередь ожидающих}
+waitlist_log = []   # все записи листа ожидания — для «Моих заявок»
+# Данные меняют и обработчик запросов, и поток листа ожидания
+lock = threading.Lock()
 users = {}      # {username: password}
 sessions = {}   # {session_id: username}
+page_cache = PageCache()   # готовые страницы для гостей и форм входа/регистрации
 
 # -----------------------
 # Логика бронирования
 # -----------------------
 
-def can_book_date(desired_date: date) -> bool:
-    return desired_date - date.today() <= timedelta(days=30)
-
-def find_free_room(room_type: str, desired_date: date):
-    for room in rooms:
-        if room["room_type"] == room_type:
-            conflict = next((b for b in bookings if b["room_id"] == room["id"]
-                             and b["start_date"] == desired_date
-                             and b["status"] == "accepted"), None)
-            if not conflict:
-                return room
-    return None
-
-def create_booking(room_id: int, desired_date: date, duration_unit: str, duration_value: int):
-    booking = {
-        "id": len(bookings) + 1,
-        "room_id": room_id,
+def create_booking(room_type: str, desired_date: date, duration_unit: str, duration_value: int, user=None):
+    """Бронирует свободную комнату типа; (заявка, None) или (None, причина отказа)"""
+    booking_id, reason = engine.book(room_type, desired_date, duration_unit, duration_value, user)
+    return (storage.get(booking_id) if booking_id else None), reason
+
+def cancel_booking(booking_id: int, user: str):
+    """Отменяет свою заявку; возвращает её или None"""
+    return storage.cancel(booking_id, user)
+
+def join_waitlist(room_type: str, desired_date: date, duration_unit: str, duration_value: int, user: str):
+    entry = {
+        "room_type": room_type,
         "start_date": desired_date,
-        "duration_hours": duration_value if duration_unit == "hours" else None,
-        "duration_days": duration_value if duration_unit == "days" else None,
-        "status": "accepted"
+        "duration_unit": duration_unit,
+        "duration_value": duration_value,
+        "user": user,
+        "status": "waiting"
     }
-    bookings.append(booking)
-    return booking
+    waitlist.setdefault((room_type, desired_date), deque()).append(entry)
+    waitlist_log.append(entry)
+    return entry
+
+def promote_waitlist(room_type: str, until: date):
+    """Отдаёт свободные комнаты ожидающим в порядке очереди (в фоновом потоке)"""
+    promoted = []
+    with lock:
+        keys = sorted(k for k in waitlist if k[0] == room_type and k[1] <= until)
+        for key in keys:
+            queue = waitlist[key]
+            while queue:
+                if key[1] < date.today():
+                    queue.popleft()["status"] = "expired"
+                    continue
+                entry = queue[0]
+                booking, reason = create_booking(room_type, key[1], entry["duration_unit"], entry["duration_value"], entry["user"])
+                if reason == TAKEN:
+                    break
+                queue.popleft()
+                if reason == OWN:
+                    # У пользователя уже есть заявка на эти дни — место ему не нужно
+                    entry["status"] = CANCELLED
+                    continue
+                entry["status"] = "promoted"
+                promoted.append(booking["id"])
+            if not queue:
+                del waitlist[key]
+    return promoted
+
+promotion = PromotionWorker(promote_waitlist)
 
 # -----------------------
 # HTML шаблон
@@ -154,17 +197,37 @@ class Handler(BaseHTTPRequestHandler):
             return sessions.get(session_id)
         return None
 
+    def send_cached(self, key, render):
+        # render() вызывается только при первом обращении к странице
+        cached = page_cache.get_or_render(key, lambda: (render(), None))
+        not_modified = is_not_modified(cached, self.headers.get("If-None-Match"),
+                                       self.headers.get("If-Modified-Since"))
+        self.send_response(304 if not_modified else 200)
+        if not not_modified:
+            self.send_header("Content-type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(cached.body)))
+        for name, value in cache_headers(cached):
+            self.send_header(name, value)
+        self.end_headers()
+        if not not_modified:
+            self.wfile.write(cached.body)
+
     def do_GET(self):
         if self.path == "/":
             user = self.get_username()
             if user:
                 content = f"""
                 <div class='card' style='text-align:center;'>
-                  <h1>Привет, {user}!</h1>
+                  <h1>Привет, {escape(user)}!</h1>
                   <p>Добро пожаловать в коворкинг. Перейдите к бронированию или посмотрите свои заявки.</p>
                   <p><a href='/bookings'><button>Перейти к бронированию</button></a></p>
                 </div>
                 """
+                html = page(content)
+                self.send_response(200)
+                self.send_header("Content-type", "text/html; charset=utf-8")
+                self.end_headers()
+                self.wfile.write(html.encode("utf-8"))
             else:
                 content = """
                 <div class='card' style='text-align:center;'>
@@ -186,11 +249,7 @@ class Handler(BaseHTTPRequestHandler):
                   </ul>
                 </div>
                 """
-            html = page(content)
-            self.send_response(200)
-            self.send_header("Content-type", "text/html; charset=utf-8")
-            self.end_headers()
-            self.wfile.write(html.encode("utf-8"))
+                self.send_cached(("/", False), lambda: page(content))
 
         elif self.path == "/register":
             form = """
@@ -203,11 +262,7 @@ class Handler(BaseHTTPRequestHandler):
               </form>
             </div>
             """
-            html = page(form)
-            self.send_response(200)
-            self.send_header("Content-type", "text/html; charset=utf-8")
-            self.end_headers()
-            self.wfile.write(html.encode("utf-8"))
+            self.send_cached(("/register", self.get_username() is not None), lambda: page(form))
 
         elif self.path == "/login":
             form = """
@@ -220,11 +275,7 @@ class Handler(BaseHTTPRequestHandler):
               </form>
             </div>
             """
-            html = page(form)
-            self.send_response(200)
-            self.send_header("Content-type", "text/html; charset=utf-8")
-            self.end_headers()
-            self.wfile.write(html.encode("utf-8"))
+            self.send_cached(("/login", self.get_username() is not None), lambda: page(form))
 
         elif self.path == "/logout":
             html = page("<div class='card'><p>Вы вышли из системы.</p><p><a href='/'><button>На главную</button></a></p></div>")
@@ -240,7 +291,21 @@ class Handler(BaseHTTPRequestHandler):
                 html = page("<div class='card'><p style='color:red'>Войдите, чтобы бронировать помещения.</p><p><a href='/login'><button>Войти</button></a></p></div>")
             else:
                 options_html = "".join([f'<option value="{t}">{label}</option>' for t, label in ALLOWED_TYPES])
-                bookings_html = "".join([f"<li>#{b['id']} — комната {b['room_id']} — {b['start_date']}</li>" for b in bookings])
+                items = []
+                for b in bookings:
+                    item = f"#{b['id']} — комната {b['room_id']} — {b['start_date']}"
+                    if b["status"] == "cancelled":
+                        item += " — отменена"
+                    elif b["user"] == user:
+                        item += f"""
+                        <form method="POST" action="/cancel" style="display:inline;">
+                          <input type="hidden" name="booking_id" value="{b['id']}">
+                          <button type="submit" style="padding:4px 10px; margin-left:10px;">Отменить</button>
+                        </form>"""
+                    items.append(f"<li>{item}</li>")
+                bookings_html = "".join(items)
+                waiting_html = "".join([f"<li>{escape(TYPE_LABELS.get(e['room_type'], e['room_type']))} — {e['start_date']} — {STATUS_LABELS[e['status']]}</li>"
+                                        for e in waitlist_log if e["user"] == user])
                 form_html = f"""
                 <div class="card">
                   <h2>Заявка на бронирование</h2>
@@ -261,6 +326,7 @@ class Handler(BaseHTTPRequestHandler):
                   <h2>Все заявки</h2>
                   <ul>{bookings_html if bookings_html else "<li>Нет заявок</li>"}</ul>
                 </div>
+                {f'<div class="card"><h2>Лист ожидания</h2><ul>{waiting_html}</ul></div>' if waiting_html else ""}
                 """
                 html = page(form_html)
             self.send_response(200)
@@ -305,7 +371,7 @@ class Handler(BaseHTTPRequestHandler):
             if users.get(username) == password:
                 session_id = str(uuid.uuid4())
                 sessions[session_id] = username
-                html = page(f"<div class='card'><p style='color:green'>Вход выполнен. Привет, {username}!</p><p><a href='/bookings'><button>Перейти к бронированию</button></a></p></div>")
+                html = page(f"<div class='card'><p style='color:green'>Вход выполнен. Привет, {escape(username)}!</p><p><a href='/bookings'><button>Перейти к бронированию</button></a></p></div>")
                 self.send_response(200)
                 self.send_header("Set-Cookie", f"session={session_id}; Path=/")
                 self.send_header("Content-type", "text/html; charset=utf-8")
@@ -335,12 +401,16 @@ class Handler(BaseHTTPRequestHandler):
             room_type = params.get("room_type", [""])[0]
             date_str = params.get("start_date", [""])[0]
             duration_unit = params.get("duration_unit", ["days"])[0]
-            duration_value = int(params.get("duration_value", ["1"])[0])
 
             try:
                 desired_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+                duration_value = int(params.get("duration_value", ["1"])[0])
             except ValueError:
-                html = page("<div class='card'><p style='color:red'>Некорректная дата.</p><p><a href='/bookings'><button>Назад</button></a></p></div>")
+                desired_date = None
+            # Тип и единицу проверяем до любых обращений к ядру: в ответ они
+            # попадают в форму листа ожидания
+            if desired_date is None or room_type not in TYPE_LABELS or duration_unit not in DURATION_UNITS:
+                html = page("<div class='card'><p style='color:red'>Некорректная заявка.</p><p><a href='/bookings'><button>Назад</button></a></p></div>")
                 self.send_response(200)
                 self.send_header("Content-type", "text/html; charset=utf-8")
                 self.end_headers()
@@ -350,23 +420,38 @@ class Handler(BaseHTTPRequestHandler):
             if not can_book_date(desired_date):
                 message = "<div class='card'><p style='color:red'>Бронирование доступно не далее чем за месяц.</p><p><a href='/bookings'><button>Назад</button></a></p></div>"
             else:
-                room = find_free_room(room_type, desired_date)
-                if room:
-                    booking = create_booking(room["id"], desired_date, duration_unit, duration_value)
+                with lock:
+                    booking, reason = create_booking(room_type, desired_date, duration_unit, duration_value, user)
+                if booking:
                     message = f"""
                     <div class='card' style='border-left:6px solid #0abf53;'>
                       <h2 style='color:#0abf53;'>✅ Заявка принята!</h2>
                       <p>Номер заявки: <strong>#{booking['id']}</strong></p>
-                      <p>Комната: {booking['room_id']}</p>
+                      <p>Помещение: {escape(TYPE_LABELS[room_type])}, комната {booking['room_id']}</p>
                       <p>Дата: {booking['start_date']}</p>
-                      <p>Длительность: {booking['duration_days'] or booking['duration_hours']} {duration_unit}</p>
+                      <p>Длительность: {booking['duration_days'] or booking['duration_hours']} {escape(duration_unit)}</p>
                       <div style='margin-top:15px;'>
                         <a href='/bookings'><button>Вернуться к бронированию</button></a>
                       </div>
                     </div>
                     """
+                elif reason == OWN:
+                    message = "<div class='card'><p style='color:red'>У вас уже есть заявка на это помещение на эти даты.</p><p><a href='/bookings'><button>Назад</button></a></p></div>"
                 else:
-                    message = "<div class='card'><p style='color:red'>Нет свободных помещений.</p><p><a href='/bookings'><button>Назад</button></a></p></div>"
+                    message = f"""
+                    <div class='card'>
+                      <p style='color:red'>Нет свободных помещений: {escape(TYPE_LABELS[room_type])}, {desired_date}.</p>
+                      <form method="POST" action="/waitlist">
+                        <input type="hidden" name="room_type" value="{escape(room_type)}">
+                        <input type="hidden" name="start_date" value="{desired_date.isoformat()}">
+                        <input type="hidden" name="duration_unit" value="{escape(duration_unit)}">
+                        <input type="hidden" name="duration_value" value="{duration_value}">
+                        <p>Встаньте в лист ожидания — комната будет забронирована автоматически, когда освободится.</p>
+                        <button type="submit">Встать в лист ожидания</button>
+                        <a href='/bookings'><button type="button" style='background:#5aa5ff; margin-left:10px;'>Назад</button></a>
+                      </form>
+                    </div>
+                    """
 
             html = page(message)
             self.send_response(200)
@@ -374,6 +459,60 @@ class Handler(BaseHTTPRequestHandler):
             self.end_headers()
             self.wfile.write(html.encode("utf-8"))
 
+        elif self.path in ("/cancel", "/waitlist"):
+            user = self.get_username()
+            length = int(self.headers.get('Content-Length', 0))
+            params = parse_qs(self.rfile.read(length).decode("utf-8"))
+            status = 200
+            if not user:
+                message = "<div class='card'><p style='color:red'>Войдите, чтобы бронировать помещения.</p><p><a href='/login'><button>Войти</button></a></p></div>"
+            elif self.path == "/cancel":
+                try:
+                    booking_id = int(params.get("booking_id", [""])[0])
+                except ValueError:
+                    booking_id = None
+                if booking_id is None:
+                    status = 400
+                    message = "<div class='card'><p style='color:red'>Некорректная заявка.</p><p><a href='/bookings'><button>Назад</button></a></p></div>"
+                else:
+                    with lock:
+                        booking = cancel_booking(booking_id, user)
+                    if booking:
+                        # Продвижение листа ожидания — в фоновом потоке, не в запросе
+                        promotion.notify(storage.room_type(booking["room_id"]), booking["end_date"])
+                        message = f"<div class='card'><p style='color:green'>Заявка #{booking['id']} отменена.</p><p><a href='/bookings'><button>Назад</button></a></p></div>"
+                    else:
+                        message = "<div class='card'><p style='color:red'>Заявка не найдена.</p><p><a href='/bookings'><button>Назад</button></a></p></div>"
+            else:
+                room_type = params.get("room_type", [""])[0]
+                duration_unit = params.get("duration_unit", ["days"])[0]
+                try:
+                    desired_date = datetime.strptime(params.get("start_date", [""])[0], "%Y-%m-%d").date()
+                    duration_value = int(params.get("duration_value", ["1"])[0])
+                except ValueError:
+                    desired_date = None
+                if (desired_date is None or room_type not in TYPE_LABELS
+                        or duration_unit not in DURATION_UNITS or not can_book_date(desired_date)):
+                    message = "<div class='card'><p style='color:red'>Некорректная заявка.</p><p><a href='/bookings'><button>Назад</button></a></p></div>"
+                else:
+                    with lock:
+                        # Пока пользователь решал, комната могла освободиться
+                        booking, reason = create_booking(room_type, desired_date, duration_unit, duration_value, user)
+                        if reason == TAKEN:
+                            join_waitlist(room_type, desired_date, duration_unit, duration_value, user)
+                    if booking:
+                        message = f"<div class='card'><p style='color:green'>Комната освободилась — заявка #{booking['id']} принята.</p><p><a href='/bookings'><button>Назад</button></a></p></div>"
+                    elif reason == OWN:
+                        message = "<div class='card'><p style='color:red'>У вас уже есть заявка на это помещение на эти даты.</p><p><a href='/bookings'><button>Назад</button></a></p></div>"
+                    else:
+                        message = "<div class='card'><p style='color:green'>Вы в листе ожидания.</p><p><a href='/bookings'><button>Назад</button></a></p></div>"
+
+            html = page(message)
+            self.send_response(status)
+            self.send_header("Content-type", "text/html; charset=utf-8")
+            self.end_headers()
+            self.wfile.write(html.encode("utf-8"))
+
         else:
             self.send_response(404)
             self.send_header("Content-type", "text/plain; charset=utf-8")
@@ -1,16 +1,42 @@
 import sqlite3
-from flask import Flask, render_template, request, redirect, url_for, make_response
+from bisect import bisect_right
+from flask import Flask, current_app, render_template, stream_template, request, redirect, url_for, make_response
+from markupsafe import Markup
 from datetime import datetime, date, timedelta
 import uuid
 import os
+import sys
 from functools import wraps
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+from jinja2 import FileSystemBytecodeCache
 
-app = Flask(__name__)
-app.secret_key = "coworking_secret_2024"
+# Общие модули лежат в корне репозитория, рядом с папкой trpo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from coworking import db
+from coworking.allocation import Ask, COUNT, DAYS, OBJECTIVES, allocate, ask_days, first_come
+from coworking.assets import init_assets
+from coworking.changes import ChangeFollower, last_seq
+from coworking.engine import (BookingEngine, SQLiteStorage, TAKEN, booking_window_end, can_book_date,
+                              period_end)
+from coworking.events import Broadcaster, event_stream
+from coworking.icalfeed import CalendarFeeds, configured_secret, make_token, parse_token
+from coworking.idempotency import IdempotencyCache, InProgress, freeze, new_key, replay, request_key
+from coworking.jobs import JobQueue
+from coworking.occupancy import OccupancyTable
+from coworking.pagecache import PageCache, is_not_modified, render_cached
+from coworking.profiler import MAX_SECONDS, ProfilerBusy, profiler
+from coworking.series import BusyIndex, CONFLICT_LABELS, FREQ_LABELS, create_series, expand_due, has_due_series
+from coworking.serve import feed_subscriber_limit
+from coworking.sessions import SessionStore
+from coworking.shards import ShardRouter, parse_sites
+from coworking.userbookings import BookingsPage, UPCOMING, PAST, parse_cursor
+from coworking.waitlist import (PromotionWorker, STATUS_LABELS, cancel_booking, join_waitlist,
+                                leave_waitlist, promote, user_waitlist)
+from coworking.writer import WriteCoordinator, BookingConflict
 
-# Конфигурация
+# Конфигурация по умолчанию; create_app() принимает любой путь к БД
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_NAME = os.path.join(BASE_DIR, "coworking.db")
+DEFAULT_DB_NAME = os.path.join(BASE_DIR, "coworking.db")
 
 # Типы помещений
 ALLOWED_TYPES = [
@@ -21,17 +47,69 @@ ALLOWED_TYPES = [
 ]
 ALLOWED_TYPE_KEYS = {t for t, _ in ALLOWED_TYPES}
 ALLOWED_RENT_UNITS = {"days", "hours"}
+ROOM_LABELS = dict(ALLOWED_TYPES)
+
+# Сколько дней вперёд покрывает лента доступности (как и окно бронирования)
+FEED_DAYS = 30
+
 
 # -----------------------
 # Вспомогательные функции
 # -----------------------
 
-sessions = {}   # {session_id: {"username": "", "is_admin": bool}}
+def get_db():
+    # Схема проверяется при первом подключении к базе, а не при импорте
+    return db.connect(current_app.config["DB_NAME"])
+
+def get_sessions():
+    return current_app.extensions["sessions"]      # {session_id: {"username": "", "is_admin": bool}}
+
+def get_page_cache():
+    return current_app.extensions["page_cache"]    # готовые страницы для гостей
+
+def report_snapshot():
+    # Отчёты читают отдельным соединением только для чтения из снимка WAL
+    return db.ReadSnapshot(current_app.config["DB_NAME"])
+
+def get_report_jobs():
+    return current_app.extensions["report_jobs"]   # фоновые задачи отчётов
+
+def get_writer():
+    return current_app.extensions["writer"]        # групповые транзакции для /book
+
+def get_feed():
+    return current_app.extensions["feed"]          # рассылка изменений доступности
+
+def get_waitlist():
+    return current_app.extensions["waitlist"]      # фоновое продвижение листа ожидания
+
+def get_occupancy():
+    return current_app.extensions["occupancy"]     # занятость по дням в общей памяти или None
+
+def get_shards():
+    return current_app.extensions["shards"]        # площадки для сводных отчётов
+
+def get_calendar():
+    return current_app.extensions["calendar"]      # готовые ленты iCalendar пользователей
+
+def get_profiler():
+    return current_app.extensions["profiler"]      # выборка стеков этого воркера
+
+def get_idempotency():
+    return current_app.extensions["idempotency"]   # результаты недавних отправок формы брони
+
+def mark_route():
+    # Профилировщик приписывает стек потока маршруту, который тот обслуживает
+    rule = request.url_rule.rule if request.url_rule else request.path
+    get_profiler().enter(f"{request.method} {request.script_root}{rule}")
+
+def unmark_route(exc=None):
+    get_profiler().leave()
 
 def get_user_info():
     session_id = request.cookies.get("session")
     if session_id:
-        return sessions.get(session_id)
+        return get_sessions().get(session_id)
     return None
 
 def login_required(f):
@@ -52,69 +130,65 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def can_book_date(desired_date: date) -> bool:
-    return date.today() <= desired_date <= (date.today() + timedelta(days=30))
+def get_engine(conn=None):
+    """Ядро бронирования на переданном соединении (транзакция, снимок отчёта)
+    или на своих подключениях с таблицей занятости в общей памяти"""
+    if conn is not None:
+        return BookingEngine(SQLiteStorage(conn))
+    return BookingEngine(SQLiteStorage(db_name=current_app.config["DB_NAME"]), get_occupancy())
 
-def period_end(start: date, rent_type: str, duration: int) -> date:
-    if rent_type == "hours":
-        return start
-    return start + timedelta(days=duration - 1)
+def get_room_availability(room_type: str, target_date: date, conn=None):
+    """Проверяет доступность помещения на конкретную дату"""
+    return get_engine(conn).is_available(room_type, target_date)
 
-def overlaps(a_start: date, a_end: date, b_start: date, b_end: date) -> bool:
-    return not (a_end < b_start or b_end < a_start)
+def room_is_free(conn, room_type: str, start: date, end: date) -> bool:
+    """Проверка занятости на переданном соединении (внутри транзакции записи)"""
+    return get_engine(conn).conflict(room_type, start, end) is None
 
-def get_room_availability(room_type: str, target_date: date):
-    """Проверяет доступность помещения на конкретную дату"""
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    
-    cur.execute("SELECT Date, RentType, Duration FROM Request WHERE RoomType=?", (room_type,))
-    bookings = cur.fetchall()
-    conn.close()
-    
-    for d_str, rtype, dur in bookings:
-        start_date = datetime.strptime(d_str, "%Y-%m-%d").date()
-        end_date = period_end(start_date, rtype, int(dur))
-        
-        if overlaps(target_date, target_date, start_date, end_date):
-            return False
-    
-    return True
+def waitlist_entry_fits(conn, entry):
+    """Свободен ли период записи листа ожидания (внутри транзакции записи)"""
+    _, room_type, d_str, rent_type, duration, _ = entry
+    start = datetime.strptime(d_str, "%Y-%m-%d").date()
+    return room_is_free(conn, room_type, start, period_end(start, rent_type, int(duration)))
+
+def promote_waitlist(writer, room_type: str, until: str):
+    # Выполняется в потоке PromotionWorker, а не в запросе
+    return writer.submit(lambda conn: promote(conn, room_type, until, waitlist_entry_fits))
+
+def expand_user_series(user_id: int):
+    """Бронирует повторения серий пользователя, вошедшие в сдвинувшееся окно"""
+    window_end = booking_window_end()
+    # Обычно разворачивать нечего — тогда обходимся одним чтением
+    if has_due_series(current_app.config["DB_NAME"], user_id, window_end):
+        get_writer().submit(lambda conn: expand_due(conn, user_id, window_end, period_end))
+
+def parse_repeat(form, first: date):
+    """(until, count) повторения из формы; ValueError при некорректных значениях"""
+    until_str = form.get("repeat_until", "").strip()
+    count_str = form.get("repeat_count", "").strip()
+    until = datetime.strptime(until_str, "%Y-%m-%d").date() if until_str else None
+    count = int(count_str) if count_str else None
+    if (until is not None and until < first) or (count is not None and count <= 0):
+        raise ValueError
+    return until, count
+
+def release_period(row):
+    """Отдаёт освободившийся период листу ожидания"""
+    room_type, d_str, rent_type, duration = row
+    start = datetime.strptime(d_str, "%Y-%m-%d").date()
+    get_waitlist().notify(room_type, period_end(start, rent_type, int(duration)).isoformat())
 
 def find_alternative_date(room_type: str, desired_date: date, duration: int, rent_type: str):
     """Находит ближайшую доступную дату"""
-    for i in range(1, 31):
-        test_date = desired_date + timedelta(days=i)
-        if can_book_date(test_date) and get_room_availability(room_type, test_date):
-            return test_date
-    return None
+    return get_engine().alternative_date(room_type, desired_date, rent_type, duration)
 
 def find_alternative_type(target_date: date, duration: int, rent_type: str):
     """Находит доступные типы помещений на указанную дату"""
-    available_types = []
-    
-    for room_type, room_label in ALLOWED_TYPES:
-        if get_room_availability(room_type, target_date):
-            end_date = period_end(target_date, rent_type, duration)
-            available = True
-            
-            current_date = target_date
-            while current_date <= end_date:
-                if not get_room_availability(room_type, current_date):
-                    available = False
-                    break
-                current_date += timedelta(days=1)
-            
-            if available:
-                available_types.append(room_label)
-    
-    return available_types
-
-def get_all_bookings(start_date=None, end_date=None):
-    """Получает все заявки за период"""
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    
+    free = get_engine().alternative_types([t for t, _ in ALLOWED_TYPES], target_date, rent_type, duration)
+    return [ROOM_LABELS[t] for t in free]
+
+def bookings_query(start_date=None, end_date=None, limit=None):
+    """SQL и параметры выборки заявок за период"""
     query = """
         SELECT r.id, r.RoomType, r.Date, r.RentType, r.Duration, u.Login
         FROM Request r
@@ -133,18 +207,287 @@ def get_all_bookings(start_date=None, end_date=None):
     
     query += " ORDER BY r.Date DESC"
     
-    cur.execute(query, params)
-    rows = cur.fetchall()
-    conn.close()
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
     
-    return rows
+    return query, params
+
+def get_all_bookings(conn, start_date=None, end_date=None, limit=None):
+    """Получает все заявки за период"""
+    query, params = bookings_query(start_date, end_date, limit)
+    return conn.execute(query, params).fetchall()
+
+REPORT_CHUNK = 1000
+REPORT_MAX_ROWS = 5000   # строк в таблице отчёта; итоги считаются по всему периоду
 
-def get_available_rooms_for_date(target_date: date):
+def build_bookings_report(job, app, start_date, end_date):
+    """Отчёт по заявкам за период; выполняется в фоне и сообщает прогресс.
+
+    Результат — готовый HTML отчёта (без шапки с именем админа), общий для
+    всех, кто его смотрит; сами строки после отрисовки не хранятся.
+    """
+    with db.ReadSnapshot(app.config["DB_NAME"]) as snap:
+        total, unique_users = snap.conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT id_users) FROM Request WHERE Date >= ? AND Date <= ?",
+            (start_date, end_date)
+        ).fetchone()
+        query, params = bookings_query(start_date, end_date, REPORT_MAX_ROWS)
+        cur = snap.conn.execute(query, params)
+        bookings = []
+        while True:
+            chunk = cur.fetchmany(REPORT_CHUNK)
+            if not chunk:
+                break
+            bookings.extend(chunk)
+            job.report(len(bookings) / max(min(total, REPORT_MAX_ROWS), 1))
+    with app.app_context():
+        html = render_template("admin_reports_result.html",
+                               bookings=bookings,
+                               total=total,
+                               unique_users=unique_users,
+                               start_date=start_date,
+                               end_date=end_date)
+    return {"html": Markup(html), "data_as_of": snap.taken_at}
+
+def data_version():
+    """Номер последнего изменения заявок в журнале — часть ключа кэша отчётов"""
+    conn = get_db()
+    version = last_seq(conn, "Request")
+    conn.close()
+    return version
+
+def feed_days(start: date, end: date):
+    """Дни периода в ISO-формате, попадающие в окно ленты доступности"""
+    first = max(start, date.today())
+    last = min(end, date.today() + timedelta(days=FEED_DAYS))
+    return [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+
+def availability_snapshot():
+    """Занятые дни по типам помещений — первое событие ленты"""
+    occupancy = get_occupancy()
+    if occupancy is not None:
+        busy = occupancy.busy_days(date.today(), date.today() + timedelta(days=FEED_DAYS))
+        if busy is not None:
+            return {"busy": busy}
+    conn = get_db()
+    rows = conn.execute(
+        "SELECT RoomType, Date, RentType, Duration FROM Request WHERE Date<=?",
+        ((date.today() + timedelta(days=FEED_DAYS)).isoformat(),)
+    ).fetchall()
+    conn.close()
+    busy = {t: set() for t, _ in ALLOWED_TYPES}
+    for room_type, d_str, rtype, dur in rows:
+        s = datetime.strptime(d_str, "%Y-%m-%d").date()
+        busy.setdefault(room_type, set()).update(feed_days(s, period_end(s, rtype, int(dur))))
+    return {"busy": {t: sorted(days) for t, days in busy.items()}}
+
+def publish_change(feed, change):
+    """События ленты по записи журнала изменений.
+
+    Журнал читают все воркеры, поэтому подписчик узнаёт и о бронях,
+    сделанных через другой процесс.
+    """
+    if change.table != "Request":
+        return
+    # Тип помещения не бронируется дважды на один день, поэтому отмена
+    # освобождает все дни заявки
+    state = "free" if change.op == "delete" else "busy"
+    row = change.data
+    start = datetime.strptime(row["date"], "%Y-%m-%d").date()
+    for day in feed_days(start, period_end(start, row["rent_type"], int(row["duration"]))):
+        feed.publish({"room": row["room_type"], "day": day, "state": state})
+
+def site_summary(db_name: str, today: str):
+    """Показатели одной площадки; выполняется в пуле потоков, без контекста запроса"""
+    with db.ReadSnapshot(db_name) as snap:
+        cur = snap.conn.cursor()
+        users = cur.execute("SELECT COUNT(*) FROM Users").fetchone()[0]
+        bookings = cur.execute("SELECT COUNT(*) FROM Request").fetchone()[0]
+        today_bookings = cur.execute("SELECT COUNT(*) FROM Request WHERE Date = ?", (today,)).fetchone()[0]
+        by_type = dict(cur.execute(
+            "SELECT RoomType, COUNT(*) FROM Request WHERE Date >= ? GROUP BY RoomType", (today,)
+        ).fetchall())
+    return {"users": users, "bookings": bookings, "today": today_bookings,
+            "upcoming": sum(by_type.values()), "by_type": by_type, "data_as_of": snap.taken_at}
+
+def merge_summaries(summaries):
+    """Сводка по всем площадкам: сумма показателей"""
+    total = {"users": 0, "bookings": 0, "today": 0, "upcoming": 0, "by_type": {}}
+    for summary in summaries:
+        for field in ("users", "bookings", "today", "upcoming"):
+            total[field] += summary[field]
+        for room_type, count in summary["by_type"].items():
+            total["by_type"][room_type] = total["by_type"].get(room_type, 0) + count
+    return total
+
+USERS_PAGE_SIZE = 50
+
+def login_prefix_range(prefix: str):
+    """Границы [prefix, upper) поиска по префиксу: диапазон по индексу Login, а не LIKE
+
+    upper None — верхней границы нет (префикс из одних U+10FFFF).
+    """
+    # Увеличиваем последний символ, который ещё можно увеличить
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return prefix, None
+    last = ord(stem[-1]) + 1
+    if 0xD800 <= last <= 0xDFFF:
+        # Суррогаты не кодируются в UTF-8 (sqlite3 падает на них), а порядок
+        # строк в SQLite — порядок байтов UTF-8: следующий символ — U+E000
+        last = 0xE000
+    return prefix, stem[:-1] + chr(last)
+
+def search_users(conn, prefix="", after=None, before=None, limit=USERS_PAGE_SIZE):
+    """Страница пользователей по логину с числом их заявок.
+
+    Листается ключевым курсором по Login (after — следующая страница,
+    before — предыдущая): и поиск по префиксу, и курсор — диапазон по
+    уникальному индексу Login, так что страница читается за O(limit)
+    при любом числе пользователей. Возвращает (строки (id, логин, заявок),
+    курсор назад, курсор вперёд).
+    """
+    where, params = [], []
+    if prefix:
+        low, high = login_prefix_range(prefix)
+        where.append("Login >= ?")
+        params.append(low)
+        if high is not None:
+            where.append("Login < ?")
+            params.append(high)
+    if before is not None:
+        where.append("Login < ?")
+        params.append(before)
+    elif after is not None:
+        where.append("Login > ?")
+        params.append(after)
+    sql = "SELECT id, Login FROM Users"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY Login DESC LIMIT ?" if before is not None else " ORDER BY Login LIMIT ?"
+    # На одну строку больше — чтобы узнать, есть ли страница дальше
+    rows = conn.execute(sql, params + [limit + 1]).fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+        prev_cursor = rows[0][1] if more and rows else None
+        next_cursor = rows[-1][1] if rows else None
+    else:
+        prev_cursor = rows[0][1] if after is not None and rows else None
+        next_cursor = rows[-1][1] if more else None
+    # Число заявок — одной группировкой по индексу idx_request_user для всей страницы
+    counts = {}
+    if rows:
+        marks = ",".join("?" * len(rows))
+        counts = dict(conn.execute(
+            f"SELECT id_users, COUNT(*) FROM Request WHERE id_users IN ({marks}) GROUP BY id_users",
+            [user_id for user_id, _ in rows]
+        ).fetchall())
+    return [(user_id, login, counts.get(user_id, 0)) for user_id, login in rows], prev_cursor, next_cursor
+
+ALLOCATION_PREVIEW = 500   # строк отчёта распределения на странице
+
+def parse_allocation_batch(text: str, user_ids: dict, today=None):
+    """Строки «логин;тип;YYYY-MM-DD;days|hours;длительность» -> (заявки, ошибки)
+
+    Строки проверяются как форма брони: окно бронирования и пересечение
+    с предыдущей строкой того же пользователя на тот же тип.
+    """
+    asks, details, errors = [], {}, []
+    # (пользователь, тип) -> (начала, заявки) по возрастанию начала; принятые
+    # заявки одного ключа не пересекаются, поэтому задеть новую может только
+    # последняя начавшаяся не позже её конца
+    own = {}
+    for line_no, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        parts = [p.strip() for p in line.replace(",", ";").split(";")]
+        try:
+            login, room_type, d_str, rent_type, duration = parts
+            start = datetime.strptime(d_str, "%Y-%m-%d").date()
+            duration = int(duration)
+            if room_type not in ALLOWED_TYPE_KEYS or rent_type not in ALLOWED_RENT_UNITS or duration <= 0:
+                raise ValueError
+        except ValueError:
+            errors.append(f"Строка {line_no}: не разобрана — {line}")
+            continue
+        if login not in user_ids:
+            errors.append(f"Строка {line_no}: нет пользователя {login}")
+            continue
+        if not can_book_date(start, today):
+            errors.append(f"Строка {line_no}: можно бронировать только на ближайшие 30 дней — {line}")
+            continue
+        ask = Ask(line_no, room_type, start, period_end(start, rent_type, duration))
+        starts, taken = own.setdefault((login, room_type), ([], []))
+        i = bisect_right(starts, ask.end)
+        if i and taken[i - 1].end >= ask.start:
+            errors.append(f"Строка {line_no}: пересекается со строкой {taken[i - 1].key} того же пользователя")
+            continue
+        i = bisect_right(starts, ask.start)
+        starts.insert(i, ask.start)
+        taken.insert(i, ask)
+        asks.append(ask)
+        details[line_no] = (login, user_ids[login], rent_type, duration)
+    return asks, details, errors
+
+def load_occupancy(conn, last_day: date, today=None):
+    """Заявки, пересекающие [today, last_day], по типам: {тип: [(начало, конец, пользователь)]}"""
+    today = today or date.today()
+    # Раньше сегодняшнего дня начались только ещё идущие дневные брони —
+    # не раньше, чем за длительность самой длинной из них (по индексу)
+    longest = conn.execute("SELECT MAX(Duration) FROM Request WHERE RentType='days'").fetchone()[0] or 1
+    first = today - timedelta(days=int(longest) - 1)
+    periods = {}
+    for room_type in sorted(ALLOWED_TYPE_KEYS):
+        busy = periods[room_type] = []
+        rows = conn.execute(
+            "SELECT Date, RentType, Duration, id_users FROM Request WHERE RoomType=? AND Date BETWEEN ? AND ?",
+            (room_type, first.isoformat(), last_day.isoformat())
+        ).fetchall()
+        for d_str, rtype, dur, user_id in rows:
+            s = datetime.strptime(d_str, "%Y-%m-%d").date()
+            e = period_end(s, rtype, int(dur))
+            if e >= today:
+                busy.append((s, e, user_id))
+    return periods
+
+def run_allocation(conn, asks, details, objective, apply):
+    """Распределяет пакет по занятости на conn; при apply вставляет принятые заявки.
+
+    Возвращает (результат, очередь поступления для сравнения, {строка: OWN/TAKEN}).
+    """
+    periods = load_occupancy(conn, max(a.end for a in asks))
+    # Каждая заявка сначала проходит ту же проверку, что и одиночная бронь;
+    # распределяются только прошедшие её
+    engines = {t: BookingEngine(BusyIndex(busy)) for t, busy in periods.items()}
+    conflicts = {}
+    for a in asks:
+        reason = engines[a.room_type].conflict(a.room_type, a.start, a.end, details[a.key][1])
+        if reason:
+            conflicts[a.key] = reason
+    asks = [a for a in asks if a.key not in conflicts]
+    # В этом приложении тип помещения — одна единица
+    occupancy = {t: [[(s, e) for s, e, _ in busy]] for t, busy in periods.items()}
+    result = allocate(asks, occupancy, objective)
+    baseline = first_come(asks, occupancy)
+    if apply:
+        by_key = {a.key: a for a in asks}
+        conn.executemany("""
+            INSERT INTO Request (RoomType, Date, RentType, Duration, id_users)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(by_key[k].room_type, by_key[k].start.isoformat(), details[k][2], details[k][3], details[k][1])
+              for k in sorted(result.accepted)])
+    return result, baseline, conflicts
+
+def get_available_rooms_for_date(target_date: date, conn=None):
     """Получает список свободных помещений на дату"""
     available = {}
     
     for room_type, room_label in ALLOWED_TYPES:
-        if get_room_availability(room_type, target_date):
+        if get_room_availability(room_type, target_date, conn):
             available[room_label] = "Свободно"
         else:
             available[room_label] = "Занято"
@@ -155,15 +498,16 @@ def get_available_rooms_for_date(target_date: date):
 # Основные маршруты
 # -----------------------
 
-@app.route("/")
 def index():
     user_info = get_user_info()
-    return render_template("index.html", user=user_info)
+    if user_info:
+        # Приветствие персональное — такую страницу не кэшируем
+        return render_template("index.html", user=user_info)
+    return render_cached(get_page_cache(), ("index", False), "index.html", user=None)
 
-@app.route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "GET":
-        return render_template("register.html")
+        return render_cached(get_page_cache(), ("register", get_user_info() is not None), "register.html")
     
     login = request.form.get("username", "").strip()
     password = request.form.get("password", "").strip()
@@ -174,7 +518,7 @@ def register():
     if len(password) < 6:
         return render_template("register.html", error="Пароль должен содержать минимум 6 символов.")
     
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     cur = conn.cursor()
     
     try:
@@ -187,16 +531,17 @@ def register():
     conn.close()
     return redirect(url_for("login", success="Регистрация успешна. Теперь войдите."))
 
-@app.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "GET":
         success = request.args.get("success")
-        return render_template("login.html", success=success)
+        if success:
+            return render_template("login.html", success=success)
+        return render_cached(get_page_cache(), ("login", get_user_info() is not None), "login.html")
     
     login = request.form.get("username", "").strip()
     password = request.form.get("password", "").strip()
     
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     cur = conn.cursor()
     cur.execute("SELECT id FROM Users WHERE Login=? AND Password=?", (login, password))
     row = cur.fetchone()
@@ -206,189 +551,239 @@ def login():
         session_id = str(uuid.uuid4())
         # Проверяем, является ли пользователь администратором
         is_admin = (login == "admin")
-        sessions[session_id] = {
+        get_sessions()[session_id] = {
             "username": login,
             "user_id": row[0],
             "is_admin": is_admin
         }
         
         resp = make_response(redirect(url_for("bookings_view")))
-        resp.set_cookie("session", session_id, path="/", httponly=True, samesite="Lax")
+        # У каждой площадки свои сессии — cookie ограничена её префиксом
+        resp.set_cookie("session", session_id, max_age=get_sessions().ttl, path=request.script_root or "/",
+                        httponly=True, samesite="Lax")
         return resp
     
     return render_template("login.html", error="Неверные логин или пароль.")
 
-@app.route("/logout")
 def logout():
     session_id = request.cookies.get("session")
-    if session_id in sessions:
-        del sessions[session_id]
+    if session_id:
+        sessions = get_sessions()
+        if session_id in sessions:
+            del sessions[session_id]
     
     resp = make_response(redirect(url_for("index")))
-    resp.set_cookie("session", "", max_age=0, path="/")
+    resp.set_cookie("session", "", max_age=0, path=request.script_root or "/")
     return resp
 
-@app.route("/bookings")
 @login_required
 def bookings_view():
-    user_info = get_user_info()
-    
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, RoomType, Date, RentType, Duration 
-        FROM Request 
-        WHERE id_users=? 
-        ORDER BY Date DESC
-    """, (user_info["user_id"],))
-    
-    rows = cur.fetchall()
-    conn.close()
-    
-    bookings = []
-    type_dict = dict(ALLOWED_TYPES)
-    for row in rows:
-        room_type = type_dict.get(row[1], row[1])
-        bookings.append(row[:1] + (room_type,) + row[2:])
-    
-    return render_template("bookings.html", 
-                         user=user_info, 
-                         bookings=bookings,
-                         today=date.today().isoformat(),
-                         max_date=(date.today() + timedelta(days=30)).isoformat())
+    return render_bookings(get_user_info())
 
-@app.route("/book", methods=["POST"])
 @login_required
 def book():
+    """Отправка формы брони; повтор с тем же ключом формы получает первый результат"""
     user_info = get_user_info()
-    
+    key = request_key(user_info["user_id"], request.form)
+    if key is None:
+        return submit_booking(user_info)
+    try:
+        return replay(get_idempotency().run(key, lambda: freeze(submit_booking(user_info))))
+    except InProgress:
+        return render_bookings(user_info, error="Заявка ещё обрабатывается — обновите страницу через несколько секунд.")
+
+def submit_booking(user_info):
+    """Проверки, запись брони и поиск альтернатив по полям формы"""
     room_type = request.form.get("room_type", "").strip()
     date_str = request.form.get("start_date", "").strip()
     rent_type = request.form.get("duration_unit", "days").strip()
     duration_str = request.form.get("duration_value", "1").strip()
     
     if room_type not in ALLOWED_TYPE_KEYS:
-        return render_template("bookings.html", 
-                             user=user_info,
-                             bookings=fetch_user_requests(user_info["user_id"]),
-                             error="Некорректный тип помещения.")
+        return render_bookings(user_info, error="Некорректный тип помещения.")
     
     try:
         desired_date = datetime.strptime(date_str, "%Y-%m-%d").date()
     except ValueError:
-        return render_template("bookings.html",
-                             user=user_info,
-                             bookings=fetch_user_requests(user_info["user_id"]),
-                             error="Некорректная дата.")
+        return render_bookings(user_info, error="Некорректная дата.")
     
     if not can_book_date(desired_date):
-        return render_template("bookings.html",
-                             user=user_info,
-                             bookings=fetch_user_requests(user_info["user_id"]),
-                             error="Можно бронировать только на ближайшие 30 дней.")
+        return render_bookings(user_info, error="Можно бронировать только на ближайшие 30 дней.")
     
     try:
         duration = int(duration_str)
         if duration <= 0:
             raise ValueError
     except ValueError:
-        return render_template("bookings.html",
-                             user=user_info,
-                             bookings=fetch_user_requests(user_info["user_id"]),
-                             error="Длительность должна быть положительным числом.")
+        return render_bookings(user_info, error="Длительность должна быть положительным числом.")
+    
+    repeat = request.form.get("repeat", "").strip()
+    if repeat:
+        if repeat not in FREQ_LABELS:
+            return render_bookings(user_info, error="Некорректная периодичность.")
+        try:
+            until, count = parse_repeat(request.form, desired_date)
+        except ValueError:
+            return render_bookings(user_info, error="Некорректные параметры повторения.")
+        window_end = booking_window_end()
+        # Все повторения проверяются одним проходом и вставляются одной транзакцией,
+        # без поиска альтернатив для каждого
+        _, report = get_writer().submit(lambda conn: create_series(
+            conn, user_info["user_id"], room_type, desired_date, repeat, until, count, rent_type, duration,
+            period_end, window_end))
+        return render_bookings(user_info, series_report=report, conflict_labels=CONFLICT_LABELS)
     
     # Проверяем доступность
-    end_date = period_end(desired_date, rent_type, duration)
-    current_date = desired_date
-    available = True
+    available = get_engine().is_available(room_type, desired_date, period_end(desired_date, rent_type, duration))
     
-    while current_date <= end_date:
-        if not get_room_availability(room_type, current_date):
+    join = request.form.get("waitlist") == "1"
+    if available or join:
+        # Повторная проверка и вставка — одной транзакцией вместе с другими
+        # бронями, пришедшими в то же мгновение (один fsync на пакет)
+        def insert_booking(conn):
+            booking_id, reason = get_engine(conn).book(room_type, desired_date, rent_type, duration,
+                                                       user_info["user_id"])
+            if reason == TAKEN and join:
+                # Всё ещё занято — встаём в лист ожидания
+                return join_waitlist(conn, room_type, desired_date.isoformat(), rent_type,
+                                     duration, user_info["user_id"])
+            if reason:
+                raise BookingConflict("Помещение занято на выбранные даты.")
+            return booking_id
+
+        try:
+            get_writer().submit(insert_booking)
+        except BookingConflict:
+            # Комнату заняли между проверкой и записью — предлагаем альтернативы
             available = False
-            break
-        current_date += timedelta(days=1)
+        else:
+            available = True
     
     if not available:
         alt_date = find_alternative_date(room_type, desired_date, duration, rent_type)
         alt_types = find_alternative_type(desired_date, duration, rent_type)
         
-        bookings = fetch_user_requests(user_info["user_id"])
-        
-        return render_template("bookings.html",
-                             user=user_info,
-                             bookings=bookings,
+        return render_bookings(user_info,
                              error="Помещение занято на выбранные даты.",
                              alt_date=alt_date,
                              alt_types=alt_types,
-                             desired_room=room_type)
-    
-    # Создаем бронирование
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO Request (RoomType, Date, RentType, Duration, id_users)
-        VALUES (?, ?, ?, ?, ?)
-    """, (room_type, desired_date.isoformat(), rent_type, duration, user_info["user_id"]))
-    
-    conn.commit()
-    conn.close()
+                             desired_room=room_type,
+                             waitlist_offer={"room_type": room_type, "start_date": date_str,
+                                             "duration_unit": rent_type, "duration_value": duration})
     
     return redirect(url_for("bookings_view"))
 
-def fetch_user_requests(user_id):
-    """Получает заявки пользователя"""
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, RoomType, Date, RentType, Duration 
-        FROM Request 
-        WHERE id_users=? 
-        ORDER BY Date DESC
-    """, (user_id,))
-    rows = cur.fetchall()
-    conn.close()
-    
-    bookings = []
-    type_dict = dict(ALLOWED_TYPES)
-    for row in rows:
-        room_type = type_dict.get(row[1], row[1])
-        bookings.append(row[:1] + (room_type,) + row[2:])
-    
-    return bookings
+@login_required
+def cancel_booking_view(booking_id):
+    user_id = get_user_info()["user_id"]
+    freed = get_writer().submit(lambda conn: cancel_booking(conn, booking_id, user_id))
+    if freed:
+        release_period(freed)
+    return redirect(url_for("bookings_view"))
+
+@login_required
+def leave_waitlist_view(entry_id):
+    user_id = get_user_info()["user_id"]
+    get_writer().submit(lambda conn: leave_waitlist(conn, entry_id, user_id))
+    return redirect(url_for("bookings_view"))
+
+@login_required
+def availability_stream():
+    """Лента событий для формы бронирования (server-sent events)"""
+    current_app.extensions["changes"].start()
+    return event_stream(get_feed(), availability_snapshot)
+
+def calendar_feed(token):
+    """Лента iCalendar по токену: календари опрашивают её без cookie.
+
+    Опрос без изменений отвечает 304 из памяти, не обращаясь к базе.
+    """
+    user_id = parse_token(current_app.config["CALENDAR_SECRET"], token, current_app.config.get("SITE") or "")
+    if user_id is None:
+        return make_response("Календарь не найден", 404)
+    feed = get_calendar().get(user_id)
+    if is_not_modified(feed, request.headers.get("If-None-Match"), request.headers.get("If-Modified-Since")):
+        resp = make_response("", 304)
+    else:
+        resp = make_response(feed.body)
+        resp.headers["Content-Type"] = "text/calendar; charset=utf-8"
+    resp.headers["ETag"] = feed.etag
+    resp.headers["Last-Modified"] = feed.last_modified
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+def render_bookings(user_info, **context):
+    """Страница бронирования; «Мои заявки» отдаются потоком по страницам"""
+    expand_user_series(user_info["user_id"])
+    upcoming = BookingsPage(current_app.config["DB_NAME"], user_info["user_id"], UPCOMING,
+                            parse_cursor(request.args.get("upcoming_after")))
+    past = BookingsPage(current_app.config["DB_NAME"], user_info["user_id"], PAST,
+                        parse_cursor(request.args.get("past_before")))
+    waitlist = user_waitlist(current_app.config["DB_NAME"], user_info["user_id"])
+    secret = current_app.config["CALENDAR_SECRET"]
+    calendar_url = None
+    if secret:
+        token = make_token(secret, user_info["user_id"], current_app.config.get("SITE") or "")
+        calendar_url = url_for("calendar_feed", token=token, _external=True)
+    return stream_template("bookings.html",
+                           user=user_info,
+                           upcoming=upcoming,
+                           past=past,
+                           waitlist=waitlist,
+                           waitlist_labels=STATUS_LABELS,
+                           room_labels=ROOM_LABELS,
+                           today=date.today().isoformat(),
+                           max_date=booking_window_end().isoformat(),
+                           idempotency_key=new_key(),
+                           calendar_url=calendar_url,
+                           **context)
 
 # -----------------------
 # Админ-маршруты
 # -----------------------
 
-@app.route("/admin")
 @admin_required
 def admin_panel():
     user_info = get_user_info()
     
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    
-    cur.execute("SELECT COUNT(*) FROM Users")
-    total_users = cur.fetchone()[0]
-    
-    cur.execute("SELECT COUNT(*) FROM Request")
-    total_bookings = cur.fetchone()[0]
-    
-    today_str = date.today().isoformat()
-    cur.execute("SELECT COUNT(*) FROM Request WHERE Date = ?", (today_str,))
-    today_bookings = cur.fetchone()[0]
-    
-    conn.close()
+    with report_snapshot() as snap:
+        cur = snap.conn.cursor()
+        
+        cur.execute("SELECT COUNT(*) FROM Users")
+        total_users = cur.fetchone()[0]
+        
+        cur.execute("SELECT COUNT(*) FROM Request")
+        total_bookings = cur.fetchone()[0]
+        
+        today_str = date.today().isoformat()
+        cur.execute("SELECT COUNT(*) FROM Request WHERE Date = ?", (today_str,))
+        today_bookings = cur.fetchone()[0]
+        
+        # Последние 5 заявок — сразу LIMIT в запросе, а не срез в шаблоне
+        recent_bookings = get_all_bookings(snap.conn, end_date=today_str, limit=5)
     
     return render_template("admin.html",
                          user=user_info,
                          total_users=total_users,
                          total_bookings=total_bookings,
                          today_bookings=today_bookings,
-                         get_all_bookings=get_all_bookings,
-                         date=date)
+                         recent_bookings=recent_bookings,
+                         notice=request.args.get("notice"),
+                         data_as_of=snap.taken_at)
+
+@admin_required
+def admin_cancel_booking():
+    """Отмена любой заявки администратором"""
+    try:
+        booking_id = int(request.form.get("booking_id", ""))
+    except ValueError:
+        return redirect(url_for("admin_panel", notice="Некорректный номер заявки."))
+    freed = get_writer().submit(lambda conn: cancel_booking(conn, booking_id))
+    if not freed:
+        return redirect(url_for("admin_panel", notice=f"Заявка #{booking_id} не найдена."))
+    release_period(freed)
+    return redirect(url_for("admin_panel", notice=f"Заявка #{booking_id} отменена."))
 
-@app.route("/admin/reports/bookings")
 @admin_required
 def admin_reports_bookings():
     user_info = get_user_info()
@@ -400,15 +795,29 @@ def admin_reports_bookings():
     if not end_date:
         end_date = date.today().isoformat()
     
-    bookings = get_all_bookings(start_date, end_date)
+    # Отчёт считается в фоне; повторный просмотр при тех же данных — из кэша
+    key = ("bookings", start_date, end_date, data_version())
+    jobs = get_report_jobs()
+    job = jobs.submit(key, build_bookings_report, current_app._get_current_object(), start_date, end_date)
+    # Небольшие периоды успевают посчитаться, пока мы ждём
+    if not jobs.wait(job, timeout=0.5):
+        return render_template("admin_reports.html",
+                             user=user_info,
+                             job=job,
+                             start_date=start_date,
+                             end_date=end_date)
+    if job.status == "failed":
+        return render_template("error.html", error=f"Не удалось построить отчёт: {job.error}")
     
+    # Отчёт уже отрисован в фоне — здесь только шапка и фильтры
     return render_template("admin_reports.html",
                          user=user_info,
-                         bookings=bookings,
+                         job=job,
+                         report=job.result["html"],
                          start_date=start_date,
-                         end_date=end_date)
+                         end_date=end_date,
+                         data_as_of=job.result["data_as_of"])
 
-@app.route("/admin/reports/availability")
 @admin_required
 def admin_reports_availability():
     user_info = get_user_info()
@@ -419,32 +828,221 @@ def admin_reports_availability():
     except ValueError:
         target_date = date.today()
     
-    available_rooms = get_available_rooms_for_date(target_date)
+    with report_snapshot() as snap:
+        available_rooms = get_available_rooms_for_date(target_date, snap.conn)
     
     return render_template("admin_availability.html",
                          user=user_info,
                          target_date=target_date,
                          available_rooms=available_rooms,
                          rooms_list=ALLOWED_TYPES,
-                         get_room_availability=get_room_availability)
+                         data_as_of=snap.taken_at)
+
+@admin_required
+def admin_allocate():
+    """Пакетное распределение заявок: пробный прогон или запись принятых"""
+    user_info = get_user_info()
+    context = {"objectives": OBJECTIVES, "objective": COUNT, "dry_run": True, "batch": ""}
+    if request.method == "POST":
+        batch = request.form.get("batch", "")
+        objective = request.form.get("objective", COUNT)
+        if objective not in OBJECTIVES:
+            objective = COUNT
+        dry_run = request.form.get("dry_run") == "1"
+        context.update(batch=batch, objective=objective, dry_run=dry_run)
+
+        conn = get_db()
+        user_ids = {login: uid for uid, login in conn.execute("SELECT id, Login FROM Users")}
+        conn.close()
+        asks, details, errors = parse_allocation_batch(batch, user_ids)
+        context["errors"] = errors
+        if asks:
+            if dry_run:
+                with report_snapshot() as snap:
+                    result, baseline, conflicts = run_allocation(snap.conn, asks, details, objective, apply=False)
+            else:
+                # Занятость читается и заявки вставляются в одной транзакции записи
+                result, baseline, conflicts = get_writer().submit(
+                    lambda conn: run_allocation(conn, asks, details, objective, apply=True))
+            context.update(
+                rows=[(a, details[a.key][0], a.key in result.accepted, conflicts.get(a.key))
+                      for a in asks[:ALLOCATION_PREVIEW]],
+                total=len(asks),
+                accepted=len(result.accepted),
+                accepted_days=sum(ask_days(a) for a in asks if a.key in result.accepted),
+                baseline=len(baseline.accepted),
+                baseline_days=sum(ask_days(a) for a in asks if a.key in baseline.accepted),
+            )
+    return render_template("admin_allocate.html", user=user_info, room_labels=ROOM_LABELS,
+                           conflict_labels=CONFLICT_LABELS, preview_limit=ALLOCATION_PREVIEW, **context)
+
+@admin_required
+def admin_reports_sites():
+    """Сводный отчёт: площадки опрашиваются параллельно"""
+    shards = get_shards()
+    results, errors = shards.fan_out(site_summary, date.today().isoformat())
+    site = current_app.config.get("SITE")
+    # Префикс корня: на площадке /center он на один сегмент короче
+    root = request.script_root[:-len(site) - 1] if site else request.script_root
+    sites = [(key, shards.title(key), results.get(key)) for key in shards.keys()]
+    return render_template("admin_sites.html",
+                         user=get_user_info(),
+                         sites=sites,
+                         errors=errors,
+                         total=merge_summaries(results.values()),
+                         current_site=site,
+                         root=root,
+                         rooms_list=ALLOWED_TYPES)
+
+@admin_required
+def admin_profile():
+    """Профилирование этого воркера по выборкам стеков на заданное число секунд"""
+    user_info = get_user_info()
+    if "seconds" not in request.args:
+        return render_template("admin_profile.html", user=user_info, profile=None,
+                               max_seconds=MAX_SECONDS, pid=os.getpid())
+    try:
+        seconds = float(request.args["seconds"])
+        interval = float(request.args.get("interval_ms", 10)) / 1000
+    except ValueError:
+        return render_template("error.html", error="Некорректные параметры профилирования.")
+    try:
+        profile = get_profiler().run(seconds, interval, all_threads=request.args.get("threads") == "all")
+    except ProfilerBusy as e:
+        return make_response(render_template("error.html", error=str(e)), 409)
+    if request.args.get("format") == "collapsed":
+        # Для flamegraph.pl, speedscope и подобных
+        resp = make_response(profile.collapsed())
+        resp.headers["Content-Type"] = "text/plain; charset=utf-8"
+        resp.headers["Content-Disposition"] = f"attachment; filename=profile-{os.getpid()}.folded"
+        return resp
+    return render_template("admin_profile.html", user=user_info, profile=profile,
+                           flame=profile.tree(), max_seconds=MAX_SECONDS, pid=os.getpid())
 
-@app.route("/admin/users")
 @admin_required
 def admin_users():
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("SELECT id, Login FROM Users ORDER BY id")
-    users_data = cur.fetchall()
-    conn.close()
-    
+    prefix = request.args.get("q", "").strip()
+    with report_snapshot() as snap:
+        rows, prev_cursor, next_cursor = search_users(snap.conn, prefix,
+                                                      after=request.args.get("after"),
+                                                      before=request.args.get("before"))
+        total = snap.conn.execute("SELECT COUNT(*) FROM Users").fetchone()[0]
+        admins = snap.conn.execute("SELECT COUNT(*) FROM Users WHERE Login = 'admin'").fetchone()[0]
+
     users = []
-    for user_id, login in users_data:
+    for user_id, login, bookings_count in rows:
         is_admin = (login == "admin")
-        users.append((user_id, login, 1 if is_admin else 0))
-    
+        users.append((user_id, login, 1 if is_admin else 0, bookings_count))
+
     return render_template("admin_users.html",
                          user=get_user_info(),
-                         users=users)
+                         users=users,
+                         query=prefix,
+                         prev_cursor=prev_cursor,
+                         next_cursor=next_cursor,
+                         total=total,
+                         admins=admins,
+                         data_as_of=snap.taken_at)
+
+# -----------------------
+# Приложение
+# -----------------------
+
+def create_app(db_name=None, config=None):
+    """Создаёт приложение; база и конфигурация передаются аргументами.
+
+    К базе приложение при создании не обращается — схема проверяется
+    (и при необходимости обновляется) при первом подключении.
+    """
+    app = Flask(__name__)
+    app.secret_key = "coworking_secret_2024"
+    app.config["DB_NAME"] = db_name or DEFAULT_DB_NAME
+    app.config.update(config or {})
+    app.config["CALENDAR_SECRET"] = configured_secret(app.config)
+    # Не больше двух отчётов считаются одновременно; там же — очистка истёкших сессий
+    jobs = app.extensions["report_jobs"] = JobQueue(max_workers=2)
+    app.extensions["sessions"] = SessionStore(app.config["DB_NAME"], jobs=jobs)
+    app.extensions["page_cache"] = PageCache()
+    # Счётчики занятости в общей памяти — одна копия на все воркеры хоста,
+    # обновляются потоком записи после каждого COMMIT
+    occupancy = None
+    if app.config.get("OCCUPANCY_SHM", True):
+        occupancy = OccupancyTable(app.config["DB_NAME"], [t for t, _ in ALLOWED_TYPES], period_end)
+    app.extensions["occupancy"] = occupancy
+    writer = WriteCoordinator(app.config["DB_NAME"], on_commit=occupancy.sync if occupancy else None)
+    app.extensions["writer"] = writer
+    app.extensions["waitlist"] = PromotionWorker(lambda room_type, until: promote_waitlist(writer, room_type, until))
+    # Каждый подписчик занимает поток сервера — лимит ниже числа потоков воркера
+    feed = Broadcaster(max_subscribers=app.config.get("FEED_MAX_SUBSCRIBERS", feed_subscriber_limit()))
+    app.extensions["feed"] = feed
+    # Ленту наполняет журнал изменений; поток стартует с первым подписчиком
+    app.extensions["changes"] = ChangeFollower(app.config["DB_NAME"], lambda change: publish_change(feed, change))
+    app.extensions["calendar"] = CalendarFeeds(app.config["DB_NAME"], ROOM_LABELS, period_end)
+    app.extensions["profiler"] = profiler
+    app.extensions["idempotency"] = IdempotencyCache()
+    app.before_request(mark_route)
+    app.teardown_request(unmark_route)
+    # Одна площадка; create_multisite_app() подставляет общий маршрутизатор
+    app.extensions["shards"] = ShardRouter({app.config.get("SITE") or "main": app.config["DB_NAME"]})
+    # Статика с отпечатками в именах, сжатая один раз при старте
+    init_assets(app)
+    # Скомпилированные шаблоны хранятся на диске — новый воркер их не компилирует
+    app.config.setdefault("TEMPLATE_CACHE_DIR", os.path.join(app.instance_path, "jinja-cache"))
+    os.makedirs(app.config["TEMPLATE_CACHE_DIR"], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config["TEMPLATE_CACHE_DIR"])
+
+    app.add_url_rule("/", view_func=index)
+    app.add_url_rule("/register", view_func=register, methods=["GET", "POST"])
+    app.add_url_rule("/login", view_func=login, methods=["GET", "POST"])
+    app.add_url_rule("/logout", view_func=logout)
+    app.add_url_rule("/bookings", view_func=bookings_view)
+    app.add_url_rule("/book", view_func=book, methods=["POST"])
+    app.add_url_rule("/bookings/<int:booking_id>/cancel", view_func=cancel_booking_view, methods=["POST"])
+    app.add_url_rule("/waitlist/<int:entry_id>/leave", view_func=leave_waitlist_view, methods=["POST"])
+    app.add_url_rule("/availability/stream", view_func=availability_stream)
+    app.add_url_rule("/calendar/<token>.ics", view_func=calendar_feed)
+    app.add_url_rule("/admin", view_func=admin_panel)
+    app.add_url_rule("/admin/bookings/cancel", view_func=admin_cancel_booking, methods=["POST"])
+    app.add_url_rule("/admin/reports/bookings", view_func=admin_reports_bookings)
+    app.add_url_rule("/admin/reports/availability", view_func=admin_reports_availability)
+    app.add_url_rule("/admin/reports/sites", view_func=admin_reports_sites)
+    app.add_url_rule("/admin/users", view_func=admin_users)
+    app.add_url_rule("/admin/profile", view_func=admin_profile)
+    app.add_url_rule("/admin/allocate", view_func=admin_allocate, methods=["GET", "POST"])
+    return app
+
+def create_multisite_app(sites, config=None, titles=None):
+    """Одно приложение на несколько площадок: /<ключ>/... обслуживает своя база.
+
+    sites — {ключ: путь к БД}. Каждая площадка получает отдельный экземпляр
+    create_app() со своими сессиями, кэшами и очередями; корень показывает
+    список площадок.
+    """
+    shards = ShardRouter(sites, titles)
+    root = Flask(__name__)
+    root.secret_key = "coworking_secret_2024"
+    root.extensions["shards"] = shards
+    mounts = {}
+    for key in shards.keys():
+        site_app = create_app(shards.db_name(key), {**(config or {}), "SITE": key})
+        site_app.extensions["shards"] = shards
+        mounts["/" + key] = site_app
+
+    def sites_index():
+        return render_template("sites.html", sites=[(key, shards.title(key)) for key in shards.keys()])
+
+    root.add_url_rule("/", view_func=sites_index)
+    root.wsgi_app = DispatcherMiddleware(root.wsgi_app, mounts)
+    return root
+
+def create_app_from_env():
+    """Фабрика для сервера: COWORKING_SITES="center=/data/center.db,north=/data/north.db"
+    включает режим нескольких площадок, иначе — одна площадка с базой по умолчанию."""
+    sites = os.environ.get("COWORKING_SITES")
+    return create_multisite_app(parse_sites(sites)) if sites else create_app()
 
+# Экземпляр создаёт сервер (gunicorn через coworking.serve), а не импорт модуля
 if __name__ == "__main__":
-    app.run(host="localhost", port=8000, debug=True)
\ No newline at end of file
+    # Отладочный сервер Flask — только с --debug
+    from coworking.serve import main
+    main(__file__ + ":create_app_from_env")
\ No newline at end of file
@@ -57,6 +57,68 @@ document.addEventListener("DOMContentLoaded", () => {
             }
         });
     }
+
+    // Живая занятость: сервер присылает изменения после каждой брони
+    const feedUrl = bookingForm && bookingForm.dataset.feed;
+    if (feedUrl && window.EventSource) {
+        const busy = new Set();                     // "тип|YYYY-MM-DD"
+        const hint = document.getElementById("availability-hint");
+        const roomSelect = document.getElementById("room_type");
+        const dateInput = document.getElementById("start_date");
+        const unitSelect = document.getElementById("duration_unit");
+        const durationInput = document.getElementById("duration_value");
+        const labels = {};
+        Array.from(roomSelect.options).forEach((o) => { labels[o.value] = o.text; });
+
+        const selectedDays = () => {
+            if (!dateInput.value) return [];
+            const count = unitSelect.value === "days" ? Math.min(parseInt(durationInput.value) || 1, 31) : 1;
+            const day = new Date(dateInput.value + "T00:00:00Z");
+            const days = [];
+            for (let i = 0; i < count; i++) {
+                days.push(day.toISOString().slice(0, 10));
+                day.setUTCDate(day.getUTCDate() + 1);
+            }
+            return days;
+        };
+        const isBusy = (room, days) => days.some((d) => busy.has(room + "|" + d));
+
+        const refresh = () => {
+            const days = selectedDays();
+            Array.from(roomSelect.options).forEach((o) => {
+                if (o.value) o.text = isBusy(o.value, days) ? labels[o.value] + " — занято" : labels[o.value];
+            });
+            const taken = roomSelect.value && isBusy(roomSelect.value, days);
+            hint.textContent = taken ? "Это помещение уже занято на выбранные даты." : "";
+            hint.hidden = !taken;
+        };
+
+        const connect = () => {
+            const source = new EventSource(feedUrl);
+            source.addEventListener("snapshot", (e) => {
+                busy.clear();
+                Object.entries(JSON.parse(e.data).busy).forEach(([room, days]) => {
+                    days.forEach((d) => busy.add(room + "|" + d));
+                });
+                refresh();
+            });
+            source.addEventListener("availability", (e) => {
+                const change = JSON.parse(e.data);
+                const key = change.room + "|" + change.day;
+                if (change.state === "busy") busy.add(key); else busy.delete(key);
+                refresh();
+            });
+            // Отстали от ленты — переподключаемся за свежим снимком
+            source.addEventListener("reset", () => { source.close(); connect(); });
+            source.onerror = () => {
+                // Отказ сервера (например, 503) закрывает поток насовсем — повторим позже
+                if (source.readyState === EventSource.CLOSED) setTimeout(connect, 30000);
+            };
+        };
+
+        [roomSelect, dateInput, unitSelect, durationInput].forEach((el) => el.addEventListener("change", refresh));
+        connect();
+    }
     
     // Анимация альтернатив
     const alternatives = document.querySelector(".alternatives");